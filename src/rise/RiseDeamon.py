@@ -2,28 +2,73 @@ import getopt
 import glob
 import json
 import logging
+import multiprocessing
 import os
 from pathlib import Path
+import signal
+import socket
 import sys
+import threading
+import time
 from types import SimpleNamespace
+import uuid
 import zipfile
 
 import wasdi
 
 from src.rise.data.AreaRepository import AreaRepository
+from src.rise.data.DaemonStateRepository import DaemonStateRepository
+from src.rise.data.EventRepository import EventRepository
 from src.rise.data.LayerRepository import LayerRepository
+from src.rise.data.LeaseRepository import LeaseRepository
+from src.rise.data.MapRepository import MapRepository
+from src.rise.data.MapsParametersRepository import MapsParametersRepository
 from src.rise.data.MongoDBClient import MongoDBClient
 from src.rise.data.PluginRepository import PluginRepository
+from src.rise.data.PublishJobRepository import PublishJobRepository
+from src.rise.data.RiseSession import RiseSession
+from src.rise.data.UserRepository import UserRepository
 from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
+from src.rise.data.WidgetInfoRepository import WidgetInfoRepository
 from src.rise.geoserver.GeoserverClient import GeoserverClient
 from src.rise.geoserver.GeoserverService import GeoserverService
+from src.rise.utils import QueryExplainer
+from src.rise.utils import ReferenceCache
+from src.rise.utils import RunMemo
 from src.rise.utils import RiseUtils
+from src.rise.utils import TrafficRecorder
+from src.rise.utils import WorkspaceTracker
 
 
 class RiseDeamon:
+    # WASDI statuses of a process not yet finished
+    s_asRUNNING_STATUSES = ["CREATED", "RUNNING", "WAITING", "READY"]
+    # Fields of the CREATED tasks needed to plan the check of the results: the task is read in full only to handle it
+    s_aoTASK_PLAN_PROJECTION = {"_id": 0, "id": 1, "areaId": 1, "pluginId": 1, "workspaceId": 1, "application": 1, "status": 1,
+                                "startDate": 1, "isShortArchive": 1, "pluginPayload.integratedArchive": 1, "pluginPayload.fullArchive": 1}
+    # Key of the daemon state where the archive tasks cursor is saved
+    s_sARCHIVE_CURSOR_KEY = "checkResultsArchiveCursor"
+    # Lease used by each per-area method: the two steps of the new areas share the same one
+    s_asAREA_LEASE_PHASES = {"handleNewAreaMaps": "newAreas", "handleNewAreaArchives": "newAreas", "updateAreaMaps": "updateNewMaps"}
+    # Prefix of the daemon state keys that tell that the archives of a new area have already been triggered
+    s_sNEW_AREA_ARCHIVES_KEY = "newAreaArchives:"
+
     def __init__(self, oConfig):
         self.m_oConfig = oConfig
-        self.m_aoPluginEntities = []      
+        self.m_aoPluginEntities = []
+        # Plugin engines already created, by (plugin id, area id)
+        self.m_aoPluginEngines = {}
+        self.m_oStopEvent = threading.Event()
+        # Id of this instance in the leases shared with the other replicas
+        self.m_sLeaseOwner = self.getDaemonConfigValue("instanceId", None)
+        if RiseUtils.isNoneOrEmpty(self.m_sLeaseOwner):
+            self.m_sLeaseOwner = socket.gethostname() + "-" + str(os.getpid()) + "-" + uuid.uuid4().hex[:8]
+        # Leases we are working on, renewed by the heartbeat thread
+        self.m_asActiveLeases = set()
+        self.m_oLeasesLock = threading.Lock()
+        self.m_oHeartbeatThread = None
+        # Resident mode: pool of the publish workers, kept for the life of the deamon
+        self.m_oPublishPool = None
     
     def run(self):
         """
@@ -43,27 +88,207 @@ class RiseDeamon:
         logging.getLogger("requests").propagate = False
         logging.getLogger("urllib3").propagate = False
 
-        # Init the WASDI lib
+        self.initWasdi()
+
+        #self.forceLayerUpdate()
+
+        self.runCheckResults()
+        self.runPublishJobs()
+
+        aoNewAreas, aoOldAreas = self.getAreasToProcess()
+
+        self.runNewAreas(aoNewAreas)
+        self.runUpdateNewMaps(aoOldAreas)
+        self.runCleanLayers()
+        self.runArchiveTasks()
+
+    def serve(self):
+        """
+        Resident mode of the Deamon.
+        It initializes the wasdi lib once and then keeps running the phases of the cycle,
+        each one with its own cadence (daemon.serveIntervals in the config, in seconds),
+        until the process receives SIGTERM or SIGINT
+        :return:
+        """
+        logging.info("RiseDeamon.serve: Rise deamon start in resident mode v.1.3.4")
+
+        logging.getLogger("requests").propagate = False
+        logging.getLogger("urllib3").propagate = False
+
+        self.m_oStopEvent.clear()
+        signal.signal(signal.SIGTERM, self.stopServing)
+        signal.signal(signal.SIGINT, self.stopServing)
+
+        oIntervals = self.getDaemonConfigValue("serveIntervals", None)
+        iTickSeconds = self.getDaemonConfigValue("serveTickSeconds", 10)
+        iWasdiRefreshSeconds = self.getDaemonConfigValue("wasdiSessionRefreshSeconds", 3600)
+
+        # Phase name, method to call and default cadence in seconds
+        aoPhases = [
+            ("checkResults", self.runCheckResults, 120),
+            ("newAreas", self.serveNewAreas, 300),
+            ("updateNewMaps", self.serveUpdateNewMaps, 3600),
+            ("cleanLayers", self.runCleanLayers, 86400),
+            ("archiveTasks", self.runArchiveTasks, 86400)
+        ]
+
+        aiPhaseIntervals = {}
+        for sPhase, oMethod, iDefault in aoPhases:
+            aiPhaseIntervals[sPhase] = getattr(oIntervals, sPhase, iDefault) if oIntervals is not None else iDefault
+            logging.info("RiseDeamon.serve: phase " + sPhase + " every " + str(aiPhaseIntervals[sPhase]) + " seconds")
+
+        # The publish workers drain their queue on their own, without blocking the detection of the finished tasks
+        oPublishThread = None
+        if self.isPublishPipelineEnabled():
+            # The workers are started once: their wasdi session, clients and caches are reused by every drain
+            try:
+                iPublishWorkers = max(1, int(self.getDaemonConfigValue("publishWorkers", 2)))
+                oContext = multiprocessing.get_context("spawn")
+                self.m_oPublishPool = oContext.Pool(iPublishWorkers, initializer=_initPoolWorker, initargs=(self.m_oConfig, self.m_sLeaseOwner))
+            except Exception as oEx:
+                logging.error("RiseDeamon.serve: exception starting the publish workers, a pool will be created at each drain: " + str(oEx))
+
+            oPublishThread = threading.Thread(target=self.publishLoop, args=(getattr(oIntervals, "publishJobs", 30) if oIntervals is not None else 30,), name="RisePublishLoop")
+            oPublishThread.start()
+
+        # plugins, maps and maps_parameters are dropped from the cache as soon as they change
+        ReferenceCache.startWatching([PluginRepository(), MapRepository(), MapsParametersRepository()])
+
+        afLastPhaseRun = {}
+        fLastWasdiInit = 0.0
+
+        while not self.m_oStopEvent.is_set():
+
+            for sPhase, oMethod, iDefault in aoPhases:
+
+                if self.m_oStopEvent.is_set():
+                    break
+
+                fNow = time.time()
+
+                if fNow - afLastPhaseRun.get(sPhase, 0.0) < aiPhaseIntervals[sPhase]:
+                    continue
+
+                # The wasdi session is refreshed only when there is something to do
+                if fNow - fLastWasdiInit >= iWasdiRefreshSeconds:
+                    self.initWasdi()
+                    fLastWasdiInit = fNow
+
+                try:
+                    oMethod()
+                except Exception as oEx:
+                    logging.error("RiseDeamon.serve: exception in phase " + sPhase + ": " + str(oEx))
+
+                afLastPhaseRun[sPhase] = time.time()
+
+            self.m_oStopEvent.wait(iTickSeconds)
+
+        if oPublishThread is not None:
+            logging.info("RiseDeamon.serve: waiting for the publish workers")
+            oPublishThread.join()
+
+        if self.m_oPublishPool is not None:
+            self.m_oPublishPool.close()
+            self.m_oPublishPool.join()
+            self.m_oPublishPool = None
+
+        ReferenceCache.stopWatching()
+
+        logging.info("RiseDeamon.serve: stop requested, leaving resident mode")
+
+    def stopServing(self, iSignal=None, oFrame=None):
+        """
+        Ask the resident mode to stop after the running phase
+        :param iSignal: signal received, if any
+        :param oFrame: current stack frame, if any
+        :return:
+        """
+        logging.info("RiseDeamon.stopServing: received signal " + str(iSignal))
+        self.m_oStopEvent.set()
+
+    def initWasdi(self):
+        """
+        Initializes the WASDI lib with the user configured for the deamon
+        :return: True if the lib has been initialized, False otherwise
+        """
         wasdi.setUser(self.m_oConfig.wasdiConfig.wasdiUser)
         wasdi.setPassword(self.m_oConfig.wasdiConfig.wasdiPassword)
         wasdi.setBaseUrl(self.m_oConfig.wasdiConfig.wasdiBaseUrl)
         wasdi.setVerbose(self.m_oConfig.wasdiConfig.verbose)
-        
+
+        # A new session does not have any workspace open
+        WorkspaceTracker.resetActiveWorkspace()
 
         if not wasdi.init():
-            logging.error("RiseDeamon.run: There was an error initializing WASDI")
-        else:
-            logging.info("RiseDeamon.run: WASDI Initialized")
+            logging.error("RiseDeamon.initWasdi: There was an error initializing WASDI")
+            return False
 
-        #self.forceLayerUpdate()
+        logging.info("RiseDeamon.initWasdi: WASDI Initialized")
+        return True
 
-        if self.m_oConfig.daemon.checkResults:
-            logging.info("RiseDeamon.run: check the status of the processes scheduled")
-            self.checkResultsAndPublishLayers()
-        else:
-            logging.info("RiseDeamon.run: checkResultsAndPublishLayers Disabled by config")
+    def ensureIndexes(self):
+        """
+        Creates the indexes declared by the repositories used by the deamon, if they do not exist yet.
+        It can be disabled with daemon.ensureIndexes: false
+        :return: the number of indexes ensured
+        """
+        if not self.getDaemonConfigValue("ensureIndexes", True):
+            logging.info("RiseDeamon.ensureIndexes: disabled in the config")
+            return 0
 
+        iEnsured = 0
 
+        aoRepositories = [AreaRepository(), DaemonStateRepository(), EventRepository(), LayerRepository(), LeaseRepository(),
+                          MapRepository(), MapsParametersRepository(), PluginRepository(), PublishJobRepository(),
+                          UserRepository(), WasdiTaskRepository(), WasdiTaskRepository().getArchiveRepository(), WidgetInfoRepository()]
+
+        for oRepository in aoRepositories:
+            iEnsured += oRepository.ensureIndexes()
+
+        logging.info("RiseDeamon.ensureIndexes: ensured " + str(iEnsured) + " indexes")
+
+        return iEnsured
+
+    def checkRequiredIndexes(self):
+        """
+        Check that the indexes the deamon relies on for its correctness exist. The registration of the layers
+        relies on the unique index on the layer id, that cannot be created on a db with the old index (see --migrateLayers):
+        without it the deamon still works, but concurrent publishers can register the same layer twice
+        :return: True if the indexes are there, False otherwise
+        """
+        # The db is not there
+        if TrafficRecorder.isReplaying():
+            return True
+
+        if LayerRepository().hasUniqueIdIndex() is False:
+            logging.error("RiseDeamon.checkRequiredIndexes: the layers collection has no unique index on the layer id, "
+                          "the same layer can be registered twice by concurrent publishers. To add it, stop all the deamons "
+                          "and run once (it deletes the duplicated layers): python src/rise/RiseDeamon.py -c <configfile> --migrateLayers")
+            return False
+
+        return True
+
+    def getDaemonConfigValue(self, sKey, oDefault=None):
+        """
+        Safe read of a value of the daemon section of the config
+        :param sKey: name of the setting
+        :param oDefault: value returned when the setting is not available
+        :return: the configured value or the default
+        """
+        try:
+            oValue = getattr(self.m_oConfig.daemon, sKey, None)
+            if oValue is not None:
+                return oValue
+        except Exception:
+            pass
+
+        return oDefault
+
+    def getAreasToProcess(self):
+        """
+        Reads the active areas and splits them between the new ones and the old ones
+        :return: a tuple with the list of new areas and the list of old areas
+        """
         # Get the list of areas
         oAreaRepository = AreaRepository()
         aoAreas = oAreaRepository.listActive(True)
@@ -83,30 +308,72 @@ class RiseDeamon:
             else:
                 aoOldAreas.append(oArea)
 
+        return aoNewAreas, aoOldAreas
+
+    def runCheckResults(self):
+        if self.m_oConfig.daemon.checkResults:
+            logging.info("RiseDeamon.run: check the status of the processes scheduled")
+            self.refreshPluginEntities()
+
+            RiseSession.begin()
+            try:
+                self.checkResultsAndPublishLayers()
+            finally:
+                RiseSession.end()
+        else:
+            logging.info("RiseDeamon.run: checkResultsAndPublishLayers Disabled by config")
+
+    def runPublishJobs(self):
+        if self.isPublishPipelineEnabled():
+            logging.info("RiseDeamon.run: publish the finished tasks")
+            self.drainPublishQueue(True)
+
+    def runNewAreas(self, aoNewAreas):
         if len(aoNewAreas) > 0:
             logging.info("RiseDeamon.run: handle new areas found " + str(len(aoNewAreas)))
             if self.m_oConfig.daemon.newAreas:
+                self.refreshPluginEntities()
                 self.handleNewAreas(aoNewAreas)
             else:
                 logging.info("RiseDeamon.run: New Areas Disabled by config")
         else:
             logging.info("RiseDeamon.run: no new area found")
 
+    def runUpdateNewMaps(self, aoOldAreas):
         if len(aoOldAreas) > 0:
             if self.m_oConfig.daemon.updateNewMaps:
                 logging.info("RiseDeamon.run: Update new maps")
+                self.refreshPluginEntities()
                 self.updateNewMaps(aoOldAreas)
             else:
                 logging.info("RiseDeamon.run: updateNewMaps Disabled by config")
         else:
             logging.info("RiseDeamon.run: no areas found")
 
+    def runCleanLayers(self):
         if self.m_oConfig.daemon.cleanLayers:
             logging.info("RiseDeamon.run: Clean the old layers in geoserver")
             self.cleanLayers()
         else:
             logging.info("RiseDeamon.run: cleanLayers Disabled by config")
 
+    def runArchiveTasks(self):
+        if self.getDaemonConfigValue("archiveTasks", False):
+            iDays = int(self.getDaemonConfigValue("archiveTasksDays", 30))
+            logging.info("RiseDeamon.run: archive the tasks finished more than " + str(iDays) + " days ago")
+            iMoved = WasdiTaskRepository().archiveFinishedTasks(iDays)
+            logging.info("RiseDeamon.run: " + str(iMoved) + " tasks moved to " + WasdiTaskRepository.s_sARCHIVE_COLLECTION_NAME)
+        else:
+            logging.info("RiseDeamon.run: archiveTasks Disabled by config")
+
+    def serveNewAreas(self):
+        aoNewAreas, aoOldAreas = self.getAreasToProcess()
+        self.runNewAreas(aoNewAreas)
+
+    def serveUpdateNewMaps(self):
+        aoNewAreas, aoOldAreas = self.getAreasToProcess()
+        self.runUpdateNewMaps(aoOldAreas)
+
     def getConfig(self):
         """
         Get the RISE config object
@@ -116,12 +383,25 @@ class RiseDeamon:
 
     def getRisePluginEngine(self, sPluginId, oArea):
         """
-        Create the RISE Plugin Engines
+        Create the RISE Plugin Engines.
+        The engines are kept in memory by plugin and area and given back as long as the
+        area and the plugin documents do not change (see refreshPluginEntities and invalidatePluginEngines)
         :param sPluginId: Unique Id of the Plugin
         :param oArea: Associated Area
         :return: The plugin Engine instance configured for this specific area
         """
         try:
+            bUseCache = self.getDaemonConfigValue("pluginEngineCache", True)
+            oKey = (sPluginId, oArea.id)
+
+            if bUseCache and oKey in self.m_aoPluginEngines:
+                oCachedEngine, oAreaSnapshot = self.m_aoPluginEngines[oKey]
+
+                if oAreaSnapshot == oArea.toDocument():
+                    return oCachedEngine
+
+                # The area changed: the engine must be created again
+                del self.m_aoPluginEngines[oKey]
 
             if len(self.m_aoPluginEntities)<=0:
                 oPluginRepository = PluginRepository()
@@ -130,8 +410,11 @@ class RiseDeamon:
             for oPluginMapping in self.m_aoPluginEntities:
                 if oPluginMapping.id == sPluginId:
                     oPluginClass = RiseUtils.getClass(oPluginMapping.className)
-                    oPluginRepository = PluginRepository()
-                    oPluginEngine = oPluginClass(self.m_oConfig, oArea, oPluginRepository.getEntityById(sPluginId))
+                    oPluginEngine = oPluginClass(self.m_oConfig, oArea, oPluginMapping)
+
+                    if bUseCache:
+                        self.m_aoPluginEngines[oKey] = (oPluginEngine, oArea.toDocument())
+
                     return oPluginEngine
 
         except Exception as oEx:
@@ -139,155 +422,794 @@ class RiseDeamon:
 
         return None
 
+    def refreshPluginEntities(self):
+        """
+        Reads again the plugins from the db and drops the engines of the plugins
+        that have been changed or removed in the meantime
+        :return:
+        """
+        oPluginRepository = PluginRepository()
+        aoPluginEntities = oPluginRepository.listAllEntities()
+
+        if aoPluginEntities is None:
+            logging.warning("RiseDeamon.refreshPluginEntities: cannot read the plugins, keep the old ones")
+            return
+
+        aoOldPlugins = {}
+        for oPlugin in self.m_aoPluginEntities:
+            aoOldPlugins[oPlugin.id] = oPlugin
+
+        aoNewPlugins = {}
+        for oPlugin in aoPluginEntities:
+            aoNewPlugins[oPlugin.id] = oPlugin
+
+        for sPluginId, oOldPlugin in aoOldPlugins.items():
+            if sPluginId not in aoNewPlugins or aoNewPlugins[sPluginId].toDocument() != oOldPlugin.toDocument():
+                self.invalidatePluginEngines(sPluginId=sPluginId)
+
+        self.m_aoPluginEntities = aoPluginEntities
+
+    def invalidatePluginEngines(self, sPluginId=None, sAreaId=None):
+        """
+        Drops the cached plugin engines of a plugin, of an area, or all of them if no filter is given
+        :param sPluginId: Plugin Id or None
+        :param sAreaId: Area Id or None
+        :return:
+        """
+        for oKey in list(self.m_aoPluginEngines.keys()):
+            if sPluginId is not None and oKey[0] != sPluginId:
+                continue
+            if sAreaId is not None and oKey[1] != sAreaId:
+                continue
+            del self.m_aoPluginEngines[oKey]
+
     def handleNewAreas(self, aoNewAreas):
         """
         Trigger the execution of the processors for the new area
         :param aoNewAreas: List of new area to process
         :return:
         """
-        oAreaRepository = AreaRepository()
+        # First the short archives of all the new areas
+        aoResults = self.runOnAreas("handleNewAreaMaps", aoNewAreas)
+        self.logAreaResults("RiseDeamon.handleNewAreas", aoResults)
 
-        # For all the new area
-        for oArea in aoNewAreas:
+        # Then the archives
+        aoResults = self.runOnAreas("handleNewAreaArchives", aoNewAreas)
+        self.logAreaResults("RiseDeamon.handleNewAreas", aoResults)
 
-            logging.info("RiseDeamon.handleNewAreas: Trigger Short Archive for new area " + str(oArea.name) + " ["+oArea.id + "]")
+        logging.info("RiseDeamon.handleNewAreas: All the new area have been processed")
 
-            # For all the plugins activated
-            for sPluginId in oArea.plugins:
+    def handleNewAreaMaps(self, oArea):
+        """
+        Trigger the short archive of all the plugins of a new area
+        :param oArea: the new area
+        :return: the result dictionary of the area
+        """
+        aoResult = self.getAreaResult(oArea)
 
-                try:
-                    # Create instance of this plugin
-                    oRisePlugin = self.getRisePluginEngine(sPluginId, oArea)
+        logging.info("RiseDeamon.handleNewAreas: Trigger Short Archive for new area " + str(oArea.name) + " ["+oArea.id + "]")
 
-                    if oRisePlugin is None:
-                        # We should find it!
-                        logging.warning("RiseDeamon.handleNewAreas: Jumping plugin " + sPluginId)
-                        continue
+        # For all the plugins activated
+        for sPluginId in oArea.plugins:
 
-                    # Ask the plugin to trigger the new operations
-                    oRisePlugin.triggerNewAreaMaps()
-                except Exception as oEx:
-                    logging.warning("Error handling the new area " + oArea.name + " Plugin " + sPluginId + " - " + str(oEx))
+            try:
+                # Create instance of this plugin
+                oRisePlugin = self.getRisePluginEngine(sPluginId, oArea)
 
-            # Set the area as handled
-            oArea.newCreatedArea = False
-            oAreaRepository.updateEntity(oArea)
+                if oRisePlugin is None:
+                    # We should find it!
+                    logging.warning("RiseDeamon.handleNewAreas: Jumping plugin " + sPluginId)
+                    continue
 
-        # For all the new area
-        for oArea in aoNewAreas:
+                # Ask the plugin to trigger the new operations
+                oRisePlugin.triggerNewAreaMaps()
+            except Exception as oEx:
+                logging.warning("Error handling the new area " + oArea.name + " Plugin " + sPluginId + " - " + str(oEx))
+                aoResult["errors"].append("Plugin " + sPluginId + " - " + str(oEx))
 
-            if oArea.supportArchive is False:
-                logging.debug("RiseDeamon.handleNewAreas: Area " + str(oArea.name) + " ["+oArea.id + "] does not support archives, skipping archive trigger")
-                continue
+        # Set the area as handled
+        oArea.newCreatedArea = False
+        AreaRepository().updateEntity(oArea)
 
-            logging.info("RiseDeamon.handleNewAreas: Trigger archives for new area " + str(oArea.name) + " ["+oArea.id + "]")
+        return aoResult
 
-            # For all the plugins activated
-            for sPluginId in oArea.plugins:
+    def handleNewAreaArchives(self, oArea):
+        """
+        Trigger the long archive of all the plugins of a new area
+        :param oArea: the new area
+        :return: the result dictionary of the area
+        """
+        aoResult = self.getAreaResult(oArea)
 
-                try:
-                    # Create instance of this plugin
-                    oRisePlugin = self.getRisePluginEngine(sPluginId, oArea)
+        if oArea.supportArchive is False:
+            logging.debug("RiseDeamon.handleNewAreas: Area " + str(oArea.name) + " ["+oArea.id + "] does not support archives, skipping archive trigger")
+            return aoResult
 
-                    if oRisePlugin is None:
-                        # We should find it!
-                        logging.warning("RiseDeamon.handleNewAreas: Jumping plugin " + sPluginId)
-                        continue
+        logging.info("RiseDeamon.handleNewAreas: Trigger archives for new area " + str(oArea.name) + " ["+oArea.id + "]")
 
-                    # Ask the plugin to trigger the new operations
-                    oRisePlugin.triggerNewAreaArchives()
-                except Exception as oEx:
-                    logging.warning("Error handling the new area " + oArea.name + " Plugin " + sPluginId + " - " + str(oEx))
+        # For all the plugins activated
+        for sPluginId in oArea.plugins:
 
-            # Set the area as handled
-            oArea.newCreatedArea = False
-            oAreaRepository.updateEntity(oArea)
+            try:
+                # Create instance of this plugin
+                oRisePlugin = self.getRisePluginEngine(sPluginId, oArea)
 
-        logging.info("RiseDeamon.handleNewAreas: All the new area have been processed")
+                if oRisePlugin is None:
+                    # We should find it!
+                    logging.warning("RiseDeamon.handleNewAreas: Jumping plugin " + sPluginId)
+                    continue
+
+                # Ask the plugin to trigger the new operations
+                oRisePlugin.triggerNewAreaArchives()
+            except Exception as oEx:
+                logging.warning("Error handling the new area " + oArea.name + " Plugin " + sPluginId + " - " + str(oEx))
+                aoResult["errors"].append("Plugin " + sPluginId + " - " + str(oEx))
 
+        # Set the area as handled
+        oArea.newCreatedArea = False
+        AreaRepository().updateEntity(oArea)
 
+        return aoResult
 
     def updateNewMaps(self, aoAreas):
-        # For all the new areas
-        for oArea in aoAreas:
+        """
+        Ask all the plugins of the areas to update their maps
+        :param aoAreas: List of the areas to update
+        :return:
+        """
+        aoResults = self.runOnAreas("updateAreaMaps", aoAreas)
+        self.logAreaResults("RiseDeamon.updateNewMaps", aoResults)
 
-            logging.info("RiseDeamon.updateNewMaps: Start new maps for area " + str(oArea.name) + " ["+oArea.id + "]")
+        logging.info("RiseDeamon.updateNewMaps: new maps processed")
 
-            asFilterPlugins = None
+    def updateAreaMaps(self, oArea):
+        """
+        Ask all the plugins of one area to update their maps
+        :param oArea: the area to update
+        :return: the result dictionary of the area
+        """
+        aoResult = self.getAreaResult(oArea)
 
-            if hasattr(self.m_oConfig.daemon, 'filterPlugins'):
-                if self.m_oConfig.daemon.filterPlugins is not None and len(self.m_oConfig.daemon.filterPlugins)>0:
-                    asFilterPlugins = self.m_oConfig.daemon.filterPlugins
+        logging.info("RiseDeamon.updateNewMaps: Start new maps for area " + str(oArea.name) + " ["+oArea.id + "]")
 
-            # For all the plugins activated
-            for sPluginId in oArea.plugins:
+        asFilterPlugins = None
 
-                try:
-                    # Create instance of this plugin
-                    oRisePlugin = self.getRisePluginEngine(sPluginId, oArea)
+        if hasattr(self.m_oConfig.daemon, 'filterPlugins'):
+            if self.m_oConfig.daemon.filterPlugins is not None and len(self.m_oConfig.daemon.filterPlugins)>0:
+                asFilterPlugins = self.m_oConfig.daemon.filterPlugins
 
-                    if oRisePlugin is None:
-                        # We should find it!
-                        logging.warning("RiseDeamon.updateNewMaps: Jumping plugin " + sPluginId)
-                        continue
+        # For all the plugins activated
+        for sPluginId in oArea.plugins:
 
-                    if asFilterPlugins is not None and sPluginId not in asFilterPlugins:
-                        logging.info("RiseDeamon.updateNewMaps: Skipping plugin " + sPluginId + " not in the filter list")
-                        continue
+            try:
+                # Create instance of this plugin
+                oRisePlugin = self.getRisePluginEngine(sPluginId, oArea)
 
-                    # Ask the plugin to trigger the new operations
-                    oRisePlugin.updateNewMaps()
-                except Exception as oEx:
-                    logging.warning("RiseDeamon.updateNewMaps: Error handling the new area " + oArea.name + " Plugin " + sPluginId + " - " + str(oEx))
+                if oRisePlugin is None:
+                    # We should find it!
+                    logging.warning("RiseDeamon.updateNewMaps: Jumping plugin " + sPluginId)
+                    continue
 
-        logging.info("RiseDeamon.updateNewMaps: new maps processed")
+                if asFilterPlugins is not None and sPluginId not in asFilterPlugins:
+                    logging.info("RiseDeamon.updateNewMaps: Skipping plugin " + sPluginId + " not in the filter list")
+                    continue
+
+                # Ask the plugin to trigger the new operations
+                oRisePlugin.updateNewMaps()
+            except Exception as oEx:
+                logging.warning("RiseDeamon.updateNewMaps: Error handling the new area " + oArea.name + " Plugin " + sPluginId + " - " + str(oEx))
+                aoResult["errors"].append("Plugin " + sPluginId + " - " + str(oEx))
+
+        return aoResult
+
+    def getAreaResult(self, oArea):
+        """
+        Creates the result dictionary returned by the per-area methods
+        :param oArea: the area
+        :return: dictionary with area id, area name and the list of errors
+        """
+        return {"areaId": oArea.id, "areaName": str(oArea.name), "errors": []}
+
+    def runOnAreas(self, sMethodName, aoAreas):
+        """
+        Runs a per-area method of the deamon on a list of areas.
+        If daemon.workers is greater than 1 the areas are sharded on a pool of processes,
+        each one with its own wasdi session. Otherwise, they are processed here one after the other
+        :param sMethodName: name of the RiseDeamon method to call for each area
+        :param aoAreas: list of areas
+        :return: the list of the result dictionaries of the areas
+        """
+        if aoAreas is None or len(aoAreas) == 0:
+            return []
+
+        iWorkers = int(self.getDaemonConfigValue("workers", 1))
+
+        if iWorkers <= 1 or len(aoAreas) == 1:
+            return [self.runAreaMethod(sMethodName, oArea) for oArea in aoAreas]
+
+        iWorkers = min(iWorkers, len(aoAreas))
+        logging.info("RiseDeamon.runOnAreas: running " + sMethodName + " on " + str(len(aoAreas)) + " areas with " + str(iWorkers) + " workers")
+
+        aoResults = []
+
+        try:
+            # The wasdi lib keeps the active workspace as a global: we need processes, not threads
+            oContext = multiprocessing.get_context("spawn")
+
+            with oContext.Pool(iWorkers, initializer=_initPoolWorker, initargs=(self.m_oConfig, self.m_sLeaseOwner)) as oPool:
+                aoArguments = [(sMethodName, oArea) for oArea in aoAreas]
+                for aoResult in oPool.imap_unordered(_runAreaWorker, aoArguments, chunksize=1):
+                    aoResults.append(aoResult)
+        except Exception as oEx:
+            logging.error("RiseDeamon.runOnAreas: exception running " + sMethodName + " on the workers pool: " + str(oEx))
+
+        return aoResults
+
+    def runAreaMethod(self, sMethodName, oArea):
+        """
+        Runs a per-area method if this instance can get the lease of the area.
+        The area leases are not released at the end: they expire by themselves, so that the other
+        instances do not run again the same area in the same cycle
+        :param sMethodName: name of the RiseDeamon method to call
+        :param oArea: the area
+        :return: the result dictionary of the area
+        """
+        sLeaseId = RiseDeamon.s_asAREA_LEASE_PHASES.get(sMethodName, sMethodName) + ":" + oArea.id
+
+        if not self.acquireLease(sLeaseId):
+            logging.info("RiseDeamon.runAreaMethod: area " + str(oArea.name) + " [" + oArea.id + "] is handled by another instance")
+            aoResult = self.getAreaResult(oArea)
+            aoResult["skipped"] = True
+            return aoResult
+
+        # The answers memoized by the engines and the entities read are valid only for this run on the area
+        RunMemo.reset()
+        RiseSession.begin()
+
+        try:
+            # Another instance may have already handled this new area before we read it
+            if sMethodName == "handleNewAreaMaps" and self.isLeasingEnabled():
+                oFreshArea = AreaRepository().getEntityById(oArea.id)
+                if oFreshArea is None or not oFreshArea.newCreatedArea:
+                    aoResult = self.getAreaResult(oArea)
+                    aoResult["skipped"] = True
+                    return aoResult
+
+            # The lease of the new area may have expired after the maps step: the archives are triggered only once
+            if sMethodName == "handleNewAreaArchives" and self.isLeasingEnabled():
+                oDaemonStateRepository = DaemonStateRepository()
+                sArchivesKey = RiseDeamon.s_sNEW_AREA_ARCHIVES_KEY + oArea.id
+
+                if oDaemonStateRepository.getValue(sArchivesKey) is not None:
+                    logging.info("RiseDeamon.runAreaMethod: archives of area " + str(oArea.name) + " [" + oArea.id + "] already triggered")
+                    aoResult = self.getAreaResult(oArea)
+                    aoResult["skipped"] = True
+                    return aoResult
+
+                aoResult = self.handleNewAreaArchives(oArea)
+                oDaemonStateRepository.setValue(sArchivesKey, time.time())
+                return aoResult
+
+            return getattr(self, sMethodName)(oArea)
+        finally:
+            # The pending updates are written while we still have the lease
+            RiseSession.end()
+            self.endLease(sLeaseId, False)
+
+    def isLeasingEnabled(self):
+        return bool(self.getDaemonConfigValue("leases", False))
+
+    def acquireLease(self, sLeaseId):
+        """
+        Claims a lease shared with the other instances of the deamon. If daemon.leases is not enabled,
+        this instance is considered the only one and the lease is always obtained
+        :param sLeaseId: id of the lease
+        :return: True if the lease belongs to this instance
+        """
+        if not self.isLeasingEnabled():
+            return True
+
+        fLeaseSeconds = float(self.getDaemonConfigValue("leaseSeconds", 600))
+
+        if not LeaseRepository().tryAcquire(sLeaseId, self.m_sLeaseOwner, fLeaseSeconds):
+            return False
+
+        with self.m_oLeasesLock:
+            self.m_asActiveLeases.add(sLeaseId)
+
+        self.startHeartbeat()
+        return True
+
+    def endLease(self, sLeaseId, bRelease):
+        """
+        Stops renewing a lease and optionally releases it
+        :param sLeaseId: id of the lease
+        :param bRelease: True to delete the lease, False to let it expire
+        :return:
+        """
+        if not self.isLeasingEnabled():
+            return
+
+        with self.m_oLeasesLock:
+            self.m_asActiveLeases.discard(sLeaseId)
+
+        if bRelease:
+            LeaseRepository().release(sLeaseId, self.m_sLeaseOwner)
+
+    def startHeartbeat(self):
+        """
+        Starts, if needed, the thread that renews the leases we are working on
+        :return:
+        """
+        if self.m_oHeartbeatThread is not None and self.m_oHeartbeatThread.is_alive():
+            return
+
+        self.m_oHeartbeatThread = threading.Thread(target=self.heartbeatLoop, name="RiseLeasesHeartbeat", daemon=True)
+        self.m_oHeartbeatThread.start()
+
+    def heartbeatLoop(self):
+        fLeaseSeconds = float(self.getDaemonConfigValue("leaseSeconds", 600))
+
+        while True:
+            time.sleep(fLeaseSeconds / 3.0)
+
+            with self.m_oLeasesLock:
+                asLeaseIds = list(self.m_asActiveLeases)
+
+            if len(asLeaseIds) == 0:
+                continue
+
+            iRenewed = LeaseRepository().renew(asLeaseIds, self.m_sLeaseOwner, fLeaseSeconds)
+
+            if iRenewed < len(asLeaseIds):
+                logging.warning("RiseDeamon.heartbeatLoop: only " + str(iRenewed) + " of " + str(len(asLeaseIds)) + " leases renewed")
+
+    def logAreaResults(self, sCaller, aoResults):
+        """
+        Logs the results of a per-area method
+        :param sCaller: name of the calling method, used as log prefix
+        :param aoResults: list of result dictionaries
+        :return:
+        """
+        iErrors = 0
+        iSkipped = 0
+
+        for aoResult in aoResults:
+            if aoResult.get("skipped", False):
+                iSkipped += 1
+            for sError in aoResult["errors"]:
+                iErrors += 1
+                logging.warning(sCaller + ": area " + aoResult["areaName"] + " [" + aoResult["areaId"] + "] " + sError)
+
+        logging.info(sCaller + ": " + str(len(aoResults) - iSkipped) + " areas processed, " + str(iSkipped) + " left to other instances, " + str(iErrors) + " errors")
 
     def checkResultsAndPublishLayers(self):
         logging.info("RiseDeamon.checkResultsAndPublishLayers: check the status of on-going processes")
 
-        # Take the list of our CREATED task
+        # Take the list of our CREATED task: only the fields needed to plan the checks, streamed from the db
         oTaskRepository = WasdiTaskRepository()
-        aoTaskToProcess = oTaskRepository.getCreatedList()
+        aoTaskToProcess = list(oTaskRepository.iterCreated(aoProjection=RiseDeamon.s_aoTASK_PLAN_PROJECTION))
 
         # We need a list of task to proceed
-        if aoTaskToProcess is None:
-            logging.info("RiseDeamon.checkResultsAndPublishLayers: List of task is None, nothing to do")
+        if len(aoTaskToProcess) == 0:
+            logging.info("RiseDeamon.checkResultsAndPublishLayers: List of task is empty, nothing to do")
             return
 
+        # Emergency and daily tasks first, then the archives starting from where the last run stopped
+        aoTaskToProcess, iUrgentTasks = self.sortTasksByPriority(aoTaskToProcess)
+        WorkspaceTracker.resetSwitchCount()
+
+        fBudgetSeconds = float(self.getDaemonConfigValue("checkResultsBudgetSeconds", 0))
+        fStartTime = time.time()
+        oLastArchiveTask = None
+        iHandledTasks = 0
+        # When the tasks still running will have to be checked again, and the expected duration of each application
+        afNextChecks = {}
+        afExpectedDurations = {}
+        # With the publish pipeline the finished tasks are only queued for the publish workers
+        bPublishPipeline = self.isPublishPipelineEnabled()
+        oPublishJobRepository = PublishJobRepository()
+        iQueuedTasks = 0
+
+        # Read in bulk, workspace by workspace, the status of our tasks
+        asPrefetchedStatus = self.prefetchTaskStatuses(aoTaskToProcess)
+
         oAreaRepository = AreaRepository()
         # For each task created
-        for oTask in aoTaskToProcess:
-            try:
-                # Get the area
-                oArea = oAreaRepository.getEntityById(oTask.areaId)
+        for iTask, oTask in enumerate(aoTaskToProcess):
 
-                if oArea is not None:
-                    # Create the Plugin Engine
-                    oPluginEngine = self.getRisePluginEngine(oTask.pluginId, oArea)
+            if fBudgetSeconds > 0 and time.time() - fStartTime > fBudgetSeconds:
+                logging.info("RiseDeamon.checkResultsAndPublishLayers: time budget of " + str(fBudgetSeconds) + " seconds exceeded, " + str(len(aoTaskToProcess) - iTask) + " tasks carried over to the next run")
+                break
 
-                    if oPluginEngine is None:
-                        # We should find it!
-                        logging.warning("RiseDeamon.checkResultsAndPublishLayers:  Task " + oTask.id + " - plugin not existing " + oTask.pluginId)
-                        continue
+            if iTask >= iUrgentTasks:
+                oLastArchiveTask = oTask
 
-                    asFilterPlugins = None
+            iHandledTasks += 1
 
-                    if hasattr(self.m_oConfig.daemon, 'filterPlugins'):
-                        if self.m_oConfig.daemon.filterPlugins is not None and len(self.m_oConfig.daemon.filterPlugins)>0:
-                            asFilterPlugins = self.m_oConfig.daemon.filterPlugins
+            try:
+                # If we already know that the task is still running, there is nothing to do
+                if oTask.id in asPrefetchedStatus and asPrefetchedStatus[oTask.id] in RiseDeamon.s_asRUNNING_STATUSES:
+                    logging.debug("RiseDeamon.checkResultsAndPublishLayers: Task " + oTask.id + " still " + asPrefetchedStatus[oTask.id])
+                    afNextChecks[oTask.id] = self.getNextCheckAt(oTask, self.getExpectedDuration(oTask.application, afExpectedDurations, oTaskRepository))
+                    continue
 
-                    if asFilterPlugins is not None and oTask.pluginId not in asFilterPlugins:
-                        logging.info("RiseDeamon.checkResultsAndPublishLayers: Skipping plugin " + oTask.pluginId + " not in the filter list")
-                        continue
+                if bPublishPipeline:
+                    if oPublishJobRepository.enqueue(oTask.id):
+                        iQueuedTasks += 1
+                    continue
 
-                    # Handle this task!
-                    oPluginEngine.handleTask(oTask)
-                else:
-                    logging.warning("RiseDeamon.checkResultsAndPublishLayers: Task " + oTask.id + " belong to a not anymore existing area. We delete it")
-                    oTaskRepository.deleteEntity(oTask.id)
+                # Only one instance can handle a task
+                sLeaseId = "task:" + oTask.id
+                if not self.acquireLease(sLeaseId):
+                    logging.debug("RiseDeamon.checkResultsAndPublishLayers: Task " + oTask.id + " is handled by another instance")
+                    continue
+
+                try:
+                    oHandledTask = self.handleCreatedTask(oTask, oTaskRepository, oAreaRepository)
+
+                    # Still not finished: no need to check it at every run
+                    if oHandledTask is not None and oHandledTask.status == "CREATED":
+                        afNextChecks[oHandledTask.id] = self.getNextCheckAt(oHandledTask, self.getExpectedDuration(oHandledTask.application, afExpectedDurations, oTaskRepository))
+                finally:
+                    self.endLease(sLeaseId, True)
             except Exception as oEx:
                 logging.error(f"RiseDeamon.checkResultsAndPublishLayers: exception {oEx}")
 
+        oTaskRepository.setNextChecks(afNextChecks)
+
+        # Save where we arrived with the archives: if we reached the end the next run starts again from the first one
+        if iHandledTasks >= len(aoTaskToProcess):
+            self.saveArchiveTasksCursor(None)
+        elif oLastArchiveTask is not None:
+            self.saveArchiveTasksCursor(oLastArchiveTask)
+
+        logging.info("RiseDeamon.checkResultsAndPublishLayers: " + str(iHandledTasks) + "/" + str(len(aoTaskToProcess)) + " tasks checked with " + str(WorkspaceTracker.getSwitchCount()) + " workspace switches, " + str(iQueuedTasks) + " queued for publishing")
+
+    def handleCreatedTask(self, oTask, oTaskRepository, oAreaRepository, bReload=True):
+        """
+        Gives a CREATED task to its plugin engine
+        :param oTask: the task
+        :param oTaskRepository: the tasks repository
+        :param oAreaRepository: the areas repository
+        :param bReload: True to read again the whole task from the db before handling it (i.e. the task has only the planning fields)
+        :return: the task given to the plugin engine, None if it was not handled
+        """
+        # Another instance may have already handled this task before we got the lease
+        if bReload or self.isLeasingEnabled():
+            oFreshTask = oTaskRepository.getEntityById(oTask.id)
+            if oFreshTask is None or oFreshTask.status != "CREATED":
+                return
+            oTask = oFreshTask
+
+        # Get the area
+        oArea = oAreaRepository.getEntityById(oTask.areaId)
+
+        if oArea is not None:
+            # Create the Plugin Engine
+            oPluginEngine = self.getRisePluginEngine(oTask.pluginId, oArea)
+
+            if oPluginEngine is None:
+                # We should find it!
+                logging.warning("RiseDeamon.checkResultsAndPublishLayers:  Task " + oTask.id + " - plugin not existing " + oTask.pluginId)
+                return
+
+            asFilterPlugins = None
+
+            if hasattr(self.m_oConfig.daemon, 'filterPlugins'):
+                if self.m_oConfig.daemon.filterPlugins is not None and len(self.m_oConfig.daemon.filterPlugins)>0:
+                    asFilterPlugins = self.m_oConfig.daemon.filterPlugins
+
+            if asFilterPlugins is not None and oTask.pluginId not in asFilterPlugins:
+                logging.info("RiseDeamon.checkResultsAndPublishLayers: Skipping plugin " + oTask.pluginId + " not in the filter list")
+                return
+
+            # Handle this task!
+            oPluginEngine.handleTask(oTask)
+            return oTask
+        else:
+            logging.warning("RiseDeamon.checkResultsAndPublishLayers: Task " + oTask.id + " belong to a not anymore existing area. We delete it")
+            oTaskRepository.deleteEntity(oTask.id)
+
+        return None
+
+    def getExpectedDuration(self, sApplication, afExpectedDurations, oTaskRepository):
+        """
+        Get the expected duration of an application, as the median of the durations of its last DONE tasks
+        :param sApplication: name of the application
+        :param afExpectedDurations: durations already computed in this run, by application
+        :param oTaskRepository: the tasks repository
+        :return: expected duration in seconds, or None if there is no history
+        """
+        if sApplication not in afExpectedDurations:
+            # The last DONE tasks of the applications that run rarely can be already archived
+            afDurations = sorted(oTaskRepository.getDoneDurations(sApplication, bIncludeArchive=self.getDaemonConfigValue("archiveTasks", False)))
+
+            if len(afDurations) > 0:
+                afExpectedDurations[sApplication] = afDurations[len(afDurations) // 2]
+            else:
+                afExpectedDurations[sApplication] = None
+
+        return afExpectedDurations[sApplication]
+
+    def getNextCheckAt(self, oTask, fExpectedDuration):
+        """
+        Computes when a running task has to be checked again.
+        If the application usually takes longer, we wait for most of the remaining expected time.
+        Otherwise (no history, or the task is late) the delay grows with the age of the task.
+        The delay is always between daemon.pollMinSeconds and daemon.pollMaxSeconds
+        :param oTask: the running task
+        :param fExpectedDuration: expected duration of the application or None
+        :return: timestamp of the next check
+        """
+        fNow = time.time()
+        fMinDelay = float(self.getDaemonConfigValue("pollMinSeconds", 60))
+        fMaxDelay = float(self.getDaemonConfigValue("pollMaxSeconds", 3600))
+
+        fElapsed = 0.0
+        if self.getTaskStartDate(oTask) > 0:
+            fElapsed = max(0.0, fNow - self.getTaskStartDate(oTask))
+
+        if fExpectedDuration is not None and fElapsed < fExpectedDuration:
+            fDelay = (fExpectedDuration - fElapsed) * 0.8
+        else:
+            fDelay = fElapsed * 0.1
+
+        return fNow + max(fMinDelay, min(fMaxDelay, fDelay))
+
+    def isPublishPipelineEnabled(self):
+        return bool(self.getDaemonConfigValue("publishPipeline", False))
+
+    def drainPublishQueue(self, bAllowInProcess):
+        """
+        Runs the publish jobs in the queue until it is empty.
+        The jobs are shared among daemon.publishWorkers processes: this is also the max number
+        of layers published in parallel to GeoServer by this instance.
+        In resident mode the processes of the publish pool started by serve are used, otherwise a pool is created for this drain
+        :param bAllowInProcess: True to run the jobs in this process when one worker is enough
+        :return: number of jobs executed
+        """
+        fTimeoutSeconds = float(self.getDaemonConfigValue("publishJobTimeoutSeconds", 3600))
+        iJobs = PublishJobRepository().countClaimable(fTimeoutSeconds)
+
+        if iJobs == 0:
+            return 0
+
+        iWorkers = max(1, min(int(self.getDaemonConfigValue("publishWorkers", 2)), iJobs))
+
+        if iWorkers == 1 and bAllowInProcess:
+            return self.runPublishJobsLoop()
+
+        logging.info("RiseDeamon.drainPublishQueue: " + str(iJobs) + " publish jobs for " + str(iWorkers) + " workers")
+
+        iDone = 0
+
+        try:
+            if self.m_oPublishPool is not None:
+                # One call for each worker that has to run: each one loops on the queue until it is empty
+                iDone = sum(self.m_oPublishPool.map(_runPublishWorker, range(iWorkers), chunksize=1))
+            else:
+                # The wasdi lib keeps the active workspace as a global: we need processes, not threads
+                oContext = multiprocessing.get_context("spawn")
+
+                with oContext.Pool(iWorkers, initializer=_initPoolWorker, initargs=(self.m_oConfig, self.m_sLeaseOwner)) as oPool:
+                    iDone = sum(oPool.map(_runPublishWorker, range(iWorkers)))
+        except Exception as oEx:
+            logging.error("RiseDeamon.drainPublishQueue: exception running the publish workers pool: " + str(oEx))
+
+        logging.info("RiseDeamon.drainPublishQueue: " + str(iDone) + " publish jobs done")
+        return iDone
+
+    def runPublishJobsLoop(self):
+        """
+        Takes the publish jobs from the queue, one by one, until it is empty
+        :return: number of jobs executed
+        """
+        sWorkerId = self.m_sLeaseOwner + "-" + str(os.getpid())
+        fTimeoutSeconds = float(self.getDaemonConfigValue("publishJobTimeoutSeconds", 3600))
+
+        oPublishJobRepository = PublishJobRepository()
+        oTaskRepository = WasdiTaskRepository()
+        oAreaRepository = AreaRepository()
+        iJobs = 0
+
+        while not self.m_oStopEvent.is_set():
+            oJob = oPublishJobRepository.claimNext(sWorkerId, fTimeoutSeconds)
+
+            if oJob is None:
+                break
+
+            RiseSession.begin()
+            try:
+                self.processPublishJob(oJob.taskId, oTaskRepository, oAreaRepository)
+            except Exception as oEx:
+                logging.error("RiseDeamon.runPublishJobsLoop: exception handling task " + str(oJob.taskId) + ": " + str(oEx))
+            finally:
+                RiseSession.end()
+
+            oPublishJobRepository.complete(oJob.id, sWorkerId)
+            iJobs += 1
+
+        return iJobs
+
+    def processPublishJob(self, sTaskId, oTaskRepository, oAreaRepository):
+        """
+        Handles the task of a publish job: the plugin engine reads the results and publishes the layers
+        :param sTaskId: id of the task
+        :param oTaskRepository: the tasks repository
+        :param oAreaRepository: the areas repository
+        :return:
+        """
+        oTask = oTaskRepository.getEntityById(sTaskId)
+
+        # Maybe it has already been handled
+        if oTask is None or oTask.status != "CREATED":
+            return
+
+        # Only one instance can handle a task: the same lease of the inline path of checkResultsAndPublishLayers
+        sLeaseId = "task:" + oTask.id
+        if not self.acquireLease(sLeaseId):
+            logging.debug("RiseDeamon.processPublishJob: Task " + oTask.id + " is handled by another instance")
+            return
+
+        try:
+            oHandledTask = self.handleCreatedTask(oTask, oTaskRepository, oAreaRepository, False)
+
+            # Still not finished: it will be checked again later
+            if oHandledTask is not None and oHandledTask.status == "CREATED":
+                fExpectedDuration = self.getExpectedDuration(oHandledTask.application, {}, oTaskRepository)
+                oTaskRepository.setNextChecks({oHandledTask.id: self.getNextCheckAt(oHandledTask, fExpectedDuration)})
+        finally:
+            self.endLease(sLeaseId, True)
+
+    def publishLoop(self, iIntervalSeconds):
+        """
+        Resident mode: drains the publish queue every iIntervalSeconds, until the deamon is stopped
+        :param iIntervalSeconds: seconds between two checks of the queue
+        :return:
+        """
+        while not self.m_oStopEvent.is_set():
+            try:
+                self.drainPublishQueue(False)
+            except Exception as oEx:
+                logging.error("RiseDeamon.publishLoop: exception " + str(oEx))
+
+            self.m_oStopEvent.wait(iIntervalSeconds)
+
+    def sortTasksByPriority(self, aoTasks):
+        """
+        Sorts the tasks to check. First the urgent ones: tasks of areas with an on going event, then the daily maps.
+        Inside these groups the tasks of the same workspace are kept together.
+        Then the archive tasks, oldest first, starting after the last archive task reached by the previous run
+        :param aoTasks: list of CREATED tasks
+        :return: a tuple with the sorted list and the number of urgent tasks at its beginning
+        """
+        asAreasWithEvents = EventRepository().getAreaIdsWithOngoingEvents()
+
+        aoUrgentTasks = []
+        aoArchiveTasks = []
+
+        for oTask in aoTasks:
+            if oTask.areaId not in asAreasWithEvents and self.isArchiveTask(oTask):
+                aoArchiveTasks.append(oTask)
+            else:
+                aoUrgentTasks.append(oTask)
+
+        aoUrgentTasks.sort(key=lambda oTask: (oTask.areaId not in asAreasWithEvents, str(oTask.workspaceId), self.getTaskStartDate(oTask)))
+        aoArchiveTasks.sort(key=self.getArchiveTaskCursorKey)
+
+        # Rotate the archives to start after the cursor saved by the last run
+        aoCursor = DaemonStateRepository().getValue(RiseDeamon.s_sARCHIVE_CURSOR_KEY)
+
+        if aoCursor is not None and len(aoArchiveTasks) > 0:
+            try:
+                aoCursorKey = (float(aoCursor[0]), str(aoCursor[1]))
+                iStart = 0
+                while iStart < len(aoArchiveTasks) and self.getArchiveTaskCursorKey(aoArchiveTasks[iStart]) <= aoCursorKey:
+                    iStart += 1
+                aoArchiveTasks = aoArchiveTasks[iStart:] + aoArchiveTasks[:iStart]
+            except Exception as oEx:
+                logging.warning("RiseDeamon.sortTasksByPriority: invalid archive cursor " + str(aoCursor) + ": " + str(oEx))
+
+        logging.info("RiseDeamon.sortTasksByPriority: " + str(len(aoUrgentTasks)) + " urgent tasks (" + str(len(asAreasWithEvents)) + " areas with events), " + str(len(aoArchiveTasks)) + " archive tasks")
+
+        return aoUrgentTasks + aoArchiveTasks, len(aoUrgentTasks)
+
+    @staticmethod
+    def isArchiveTask(oTask):
+        """
+        Check if a task belongs to a (short or full) archive and not to the daily maps
+        :param oTask: the task
+        :return: True if it is an archive task
+        """
+        if getattr(oTask, "isShortArchive", False):
+            return True
+
+        aoPayload = getattr(oTask, "pluginPayload", None)
+
+        if isinstance(aoPayload, dict):
+            if aoPayload.get("integratedArchive", False) or aoPayload.get("fullArchive", False):
+                return True
+
+        return False
+
+    @staticmethod
+    def getTaskStartDate(oTask):
+        try:
+            return float(oTask.startDate)
+        except Exception:
+            return 0.0
+
+    @staticmethod
+    def getArchiveTaskCursorKey(oTask):
+        return RiseDeamon.getTaskStartDate(oTask), str(oTask.id)
+
+    def saveArchiveTasksCursor(self, oLastArchiveTask):
+        """
+        Saves the last archive task reached, so that the next run can start from the following one
+        :param oLastArchiveTask: last archive task reached or None to start again from the beginning
+        :return:
+        """
+        aoCursor = None
+
+        if oLastArchiveTask is not None:
+            aoCursor = list(self.getArchiveTaskCursorKey(oLastArchiveTask))
+
+        DaemonStateRepository().setValue(RiseDeamon.s_sARCHIVE_CURSOR_KEY, aoCursor)
+
+    def prefetchTaskStatuses(self, aoTasks):
+        """
+        Reads the status of the tasks with one paged call per WASDI workspace, instead of one call per task.
+        Tasks not found here (i.e. pseudo tasks, or tasks beyond the last page read) are not in the
+        returned dictionary and will be checked one by one by the plugins, as usual
+        :param aoTasks: list of CREATED tasks
+        :return: dictionary task id -> WASDI status
+        """
+        asStatuses = {}
+
+        if not self.getDaemonConfigValue("batchStatusPolling", True):
+            return asStatuses
+
+        iPageSize = int(self.getDaemonConfigValue("statusPollPageSize", 100))
+        iMaxPages = int(self.getDaemonConfigValue("statusPollMaxPages", 10))
+
+        # Group the task ids by workspace
+        aasTaskIdsByWorkspace = {}
+        for oTask in aoTasks:
+            if RiseUtils.isNoneOrEmpty(oTask.workspaceId) or RiseUtils.isNoneOrEmpty(oTask.id):
+                continue
+            aasTaskIdsByWorkspace.setdefault(oTask.workspaceId, set()).add(oTask.id)
+
+        for sWorkspaceId, asTaskIds in aasTaskIdsByWorkspace.items():
+            try:
+                if RiseUtils.isNoneOrEmpty(WorkspaceTracker.openWorkspaceById(sWorkspaceId)):
+                    logging.debug("RiseDeamon.prefetchTaskStatuses: cannot open workspace " + sWorkspaceId)
+                    continue
+
+                asMissingIds = set(asTaskIds)
+
+                for iPage in range(iMaxPages):
+                    aoProcesses = wasdi.getProcessesByWorkspace(iStartIndex=iPage * iPageSize, iEndIndex=(iPage + 1) * iPageSize, sOperationType="RUNPROCESSOR")
+
+                    if aoProcesses is None:
+                        break
+
+                    for oProcess in aoProcesses:
+                        sProcessId = oProcess.get("processObjId")
+                        if sProcessId in asMissingIds:
+                            asStatuses[sProcessId] = oProcess.get("status")
+                            asMissingIds.discard(sProcessId)
+
+                    if len(asMissingIds) == 0 or len(aoProcesses) < iPageSize:
+                        break
+
+            except Exception as oEx:
+                logging.warning("RiseDeamon.prefetchTaskStatuses: exception reading workspace " + sWorkspaceId + ": " + str(oEx))
+
+        iRunning = len([sStatus for sStatus in asStatuses.values() if sStatus in RiseDeamon.s_asRUNNING_STATUSES])
+        logging.info("RiseDeamon.prefetchTaskStatuses: read " + str(len(asStatuses)) + " statuses from " + str(len(aasTaskIdsByWorkspace)) + " workspaces, " + str(iRunning) + " still running")
+
+        return asStatuses
 
     def cleanLayers(self):
 
@@ -309,12 +1231,17 @@ class RiseDeamon:
             iRetentionTimestampLimit = RiseUtils.getTimestampBackInDays(iRetentionDays)
 
             oLayerRepo = LayerRepository()
-            aoLayerEntities = oLayerRepo.getLayersIdsOlderThanDate(iRetentionTimestampLimit)
+            # Only the ids are needed: the layers are streamed and handled in chunks, in constant memory.
+            # Small batches: the cursor must not stay idle too long while we call Geoserver
+            oLayerEntities = oLayerRepo.iterLayersOlderThanDate(iRetentionTimestampLimit, aoProjection={"_id": 0, "id": 1, "layerId": 1}, iBatchSize=100)
 
             oGeoService = GeoserverService()
             aoDeletedEntitiesIds = []
+            iChunkSize = oLayerRepo.getBulkChunkSize()
+            iMatchedLayers = 0
+            iDeletedLayers = 0
 
-            for oEntity in aoLayerEntities:
+            for oEntity in oLayerEntities:
                 sLayerId = oEntity.layerId
 
                 if RiseUtils.isNoneOrEmpty(sLayerId):
@@ -329,19 +1256,36 @@ class RiseDeamon:
                         logging.info("RiseDeamon.cleanLayers: the layer " + sLayerId + " does not exists in Geoserver, we consider it deleted")
                         aoDeletedEntitiesIds.append(oEntity.id)
 
-            iDeletedLayers = 0
-            # to be sure that the Layer entities have not been updated while we were deleting the layers from Geoserver,
-            # we reload the entities, before updating them
-            if len(aoDeletedEntitiesIds)>0:
-                aoDeletedLayers = oLayerRepo.getAllEntitiesById(aoDeletedEntitiesIds)
-                list(map(lambda oLayer: setattr(oLayer, "published", False), aoDeletedLayers))
-                iDeletedLayers = oLayerRepo.updateAllEntities(aoDeletedLayers)
-            logging.info(f"RiseDeamon.cleanLayers: number of cleaned layers is equal to {iDeletedLayers}")
+                if len(aoDeletedEntitiesIds) >= iChunkSize:
+                    iMatched, iModified = self.unpublishLayers(oLayerRepo, aoDeletedEntitiesIds)
+                    iMatchedLayers += iMatched
+                    iDeletedLayers += iModified
+                    aoDeletedEntitiesIds = []
+
+            if len(aoDeletedEntitiesIds) > 0:
+                iMatched, iModified = self.unpublishLayers(oLayerRepo, aoDeletedEntitiesIds)
+                iMatchedLayers += iMatched
+                iDeletedLayers += iModified
+
+            logging.info(f"RiseDeamon.cleanLayers: number of cleaned layers is equal to {iDeletedLayers} ({iMatchedLayers} layers matched)")
 
         except Exception as oEx:
             logging.error(f"RiseDeamon.cleanLayers: exception {oEx}")
 
 
+    def unpublishLayers(self, oLayerRepo, asLayerIds):
+        """
+        Sets as not published the layers deleted from Geoserver
+        :param oLayerRepo: the layers repository
+        :param asLayerIds: ids of the deleted layers
+        :return: a tuple (number of matched layers, number of modified layers)
+        """
+        # to be sure that the Layer entities have not been updated while we were deleting the layers from Geoserver,
+        # we reload the entities, before updating them
+        aoDeletedLayers = list(oLayerRepo.iterEntitiesByField({"id": {"$in": asLayerIds}}))
+        list(map(lambda oLayer: setattr(oLayer, "published", False), aoDeletedLayers))
+        return oLayerRepo.bulkUpdate(aoDeletedLayers)
+
     @staticmethod
     def readConfigFile(sConfigFilePath):
         with open(sConfigFilePath, "r") as oConfigFile:
@@ -455,24 +1399,132 @@ class RiseDeamon:
 
         return False
 
+# Deamon instance of a worker process of the areas and publish pools
+s_oWorkerDeamon = None
+# When the wasdi session of the worker process has been initialized
+s_fWorkerWasdiInit = 0.0
+
+
+def _initPoolWorker(oConfig, sLeaseOwner):
+    """
+    Initializer of the processes of the areas and publish pools: each worker has its own clients and wasdi session
+    :param oConfig: the RISE config object
+    :param sLeaseOwner: lease owner id of the parent deamon, shared by all its workers
+    :return:
+    """
+    global s_oWorkerDeamon
+    global s_fWorkerWasdiInit
+
+    MongoDBClient._s_oConfig = oConfig
+    MongoDBClient._s_oInstance = None
+    MongoDBClient._s_oAsyncClient = None
+    GeoserverClient._s_oConfig = oConfig
+    GeoserverClient._s_oInstance = None
+
+    sLogLevel = getattr(oConfig, "logLevel", None)
+    if sLogLevel is None:
+        sLogLevel = "INFO"
+
+    logging.basicConfig(format="{asctime} - {levelname} - [" + str(os.getpid()) + "] {message}", style="{", datefmt="%Y-%m-%d %H:%M", level=logging.getLevelName(sLogLevel))
+    logging.getLogger("pymongo").setLevel(logging.ERROR)
+    logging.getLogger("requests").propagate = False
+    logging.getLogger("urllib3").propagate = False
+
+    TrafficRecorder.startFromConfig(oConfig)
+    QueryExplainer.startFromConfig(oConfig)
+    ReferenceCache.startFromConfig(oConfig)
+
+    s_oWorkerDeamon = RiseDeamon(oConfig)
+    s_oWorkerDeamon.m_sLeaseOwner = sLeaseOwner
+    s_oWorkerDeamon.initWasdi()
+    s_fWorkerWasdiInit = time.time()
+
+
+def _runAreaWorker(aoArguments):
+    """
+    Runs a per-area method of the deamon in a worker process of the areas pool
+    :param aoArguments: tuple with the name of the method and the area
+    :return: the result dictionary of the area
+    """
+    sMethodName, oArea = aoArguments
+
+    try:
+        return s_oWorkerDeamon.runAreaMethod(sMethodName, oArea)
+    except Exception as oEx:
+        logging.error("RiseDeamon._runAreaWorker: exception in " + sMethodName + ": " + str(oEx))
+        return {"areaId": oArea.id, "areaName": str(oArea.name), "errors": [sMethodName + " - " + str(oEx)]}
+    finally:
+        # The pool terminates its workers without running atexit
+        TrafficRecorder.flush()
+
+
+def _runPublishWorker(iWorkerIndex):
+    """
+    Runs the publish jobs in a worker process of the publish pool, until the queue is empty
+    :param iWorkerIndex: index of the worker in the pool
+    :return: number of jobs executed
+    """
+    global s_fWorkerWasdiInit
+
+    try:
+        # The workers of the resident publish pool live as long as the deamon: refresh the wasdi session and the plugins
+        if time.time() - s_fWorkerWasdiInit >= s_oWorkerDeamon.getDaemonConfigValue("wasdiSessionRefreshSeconds", 3600):
+            s_oWorkerDeamon.initWasdi()
+            s_fWorkerWasdiInit = time.time()
+
+        s_oWorkerDeamon.refreshPluginEntities()
+
+        return s_oWorkerDeamon.runPublishJobsLoop()
+    except Exception as oEx:
+        logging.error("RiseDeamon._runPublishWorker: exception in worker " + str(iWorkerIndex) + ": " + str(oEx))
+        return 0
+    finally:
+        TrafficRecorder.flush()
+
+
 if __name__ == '__main__':
     # Default configuration file Path
     sConfigFilePath = '/etc/rise/riseConfig.json'
+    # By default we run the cycle once and exit
+    bServe = False
+    # Optional record or replay of the WASDI, GeoServer and Mongo traffic
+    sTrafficMode = ""
+    sTrafficPath = ""
+    fLatencyScale = 1.0
+    # Optional check of the query plans of the repositories
+    bExplain = False
+    # One-off migration of the layers to the unique index on the layer id
+    bMigrateLayers = False
 
     try:
         # Read the command line args
-        aoOpts, asArgs = getopt.getopt(sys.argv[1:], "hc:", ["config="])
+        aoOpts, asArgs = getopt.getopt(sys.argv[1:], "hc:s", ["config=", "serve", "record=", "replay=", "latency=", "explain", "migrateLayers"])
     except getopt.GetoptError:
-        print('RISE Deamon: python RiseDeamon.py -c <configfile>')
+        print('RISE Deamon: python RiseDeamon.py -c <configfile> [-s] [--record <folder> | --replay <folder> [--latency <scale>]] [--explain] [--migrateLayers]')
         sys.exit(2)
 
     for sOpt, sArg in aoOpts:
         if sOpt == '-h':
-            print('RISE Deamon: python RiseDeamon.py -c <configfile>')
+            print('RISE Deamon: python RiseDeamon.py -c <configfile> [-s] [--record <folder> | --replay <folder> [--latency <scale>]] [--explain] [--migrateLayers]')
             sys.exit()
         if sOpt in ("-c", "--config"):
             # Override the config file path
             sConfigFilePath = sArg
+        if sOpt in ("-s", "--serve"):
+            # Stay resident and run each phase with its own cadence
+            bServe = True
+        if sOpt in ("--record", "--replay"):
+            sTrafficMode = sOpt[2:]
+            sTrafficPath = sArg
+        if sOpt == "--latency":
+            # Replay only: 1 waits the recorded latencies, 0 answers immediately
+            fLatencyScale = float(sArg)
+        if sOpt == "--explain":
+            # Logs the daemon queries that do a collection scan
+            bExplain = True
+        if sOpt == "--migrateLayers":
+            # Removes the duplicated layers and creates the unique index on the layer id, then exits
+            bMigrateLayers = True
 
     # Get the config as an object
     oRiseConfig = RiseDeamon.readConfigFile(sConfigFilePath)
@@ -488,12 +1540,38 @@ if __name__ == '__main__':
     logging.basicConfig(format="{asctime} - {levelname} - {message}", style="{", datefmt="%Y-%m-%d %H:%M", level=logging.getLevelName(oRiseConfig.logLevel))
     logging.getLogger("pymongo").setLevel(logging.ERROR)
 
+    # The workers of the pools read it from the config
+    if sTrafficMode != "":
+        oRiseConfig.traffic = SimpleNamespace(mode=sTrafficMode, path=sTrafficPath, latencyScale=fLatencyScale)
+    TrafficRecorder.startFromConfig(oRiseConfig)
+    ReferenceCache.startFromConfig(oRiseConfig)
+
+    if bExplain:
+        if getattr(oRiseConfig, "daemon", None) is None:
+            oRiseConfig.daemon = SimpleNamespace()
+        oRiseConfig.daemon.explainQueries = True
+
     try:
         # Create the Deamon class
         oDemon = RiseDeamon(oRiseConfig)
 
+        if bMigrateLayers:
+            iDeleted = LayerRepository().migrateUniqueIdIndex()
+            sys.exit(0 if iDeleted is not None else 1)
+
+        # The indexes must be there before the first query
+        oDemon.ensureIndexes()
+
+        oDemon.checkRequiredIndexes()
+        QueryExplainer.startFromConfig(oRiseConfig)
+
         # And start!
-        oDemon.run()
+        if bServe:
+            oDemon.serve()
+        else:
+            oDemon.run()
+
+        QueryExplainer.logSummary()
 
         logging.info("RiseDeamon finished! bye bye")
     except Exception as oEx:
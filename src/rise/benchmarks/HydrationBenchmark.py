@@ -0,0 +1,191 @@
+import gc
+import getopt
+import sys
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+from src.rise.business.RiseEntity import RiseEntity
+from src.rise.data.LayerRepository import LayerRepository
+from src.rise.utils import RiseUtils
+
+# The hydration of the slots can cost at most twice the fast path it replaced, the dictionary swap
+s_fMAX_DICT_SWAP_RATIO = 2.0
+
+
+class _DictLayer:
+    # Entity with a __dict__, as the layers were before the slots: the reference of the old paths
+    def __init__(self, aoDefaults, **kwargs):
+        for sKey, oValue in aoDefaults.items():
+            setattr(self, sKey, RiseEntity.copyValue(oValue))
+
+        for sKey, oValue in kwargs.items():
+            setattr(self, sKey, oValue)
+
+
+def getLayerDocuments(iDocuments):
+    """
+    Creates documents similar to the ones of the layers collection
+    :param iDocuments: number of documents
+    :return: list of documents
+    """
+    aoDocuments = []
+
+    for iIndex in range(iDocuments):
+        sLayerId = "area" + str(iIndex % 20) + "_rise_flood_plugin_sar_flood_" + str(iIndex)
+        aoDocuments.append({
+            "_id": ObjectId(),
+            "layerId": sLayerId,
+            "geoserverUrl": "https://geoserver.example/geoserver/rise/wms",
+            "referenceDate": 1700000000.0 + iIndex,
+            "source": "",
+            "properties": {"idx": iIndex},
+            "mapId": "sar_flood",
+            "pluginId": "rise_flood_plugin",
+            "areaId": "area" + str(iIndex % 20),
+            "id": sLayerId,
+            "published": True,
+            "keepLayer": False,
+            "dataSource": "Sentinel-1",
+            "createdDate": 1700000000.0,
+            "resolution": "20m",
+            "inputData": "",
+            "workspaceId": "ws" + str(iIndex % 20)
+        })
+
+    return aoDocuments
+
+
+def hydrateWithGetClass(oRepository, aoDocuments):
+    # The old path: class resolved and constructor with kwargs for each document
+    aoEntities = []
+    for aoDocument in aoDocuments:
+        oEntityClass = RiseUtils.getClass(oRepository.m_sEntityClassName)
+        aoEntities.append(oEntityClass(**aoDocument))
+    return aoEntities
+
+
+def hydrateWithDictSwap(oRepository, aoDocuments):
+    # The dictionary swap path, used before the slots: defaults and document merged in the __dict__ of the entity
+    aoDefaults = oRepository.getEntityClass()().toDocument()
+    asMutableKeys = [sKey for sKey, oValue in aoDefaults.items() if isinstance(oValue, (list, dict, set))]
+    aoEntities = []
+
+    for aoDocument in aoDocuments:
+        oEntity = object.__new__(_DictLayer)
+        oEntity.__dict__ = {**aoDefaults, **aoDocument}
+
+        for sKey in asMutableKeys:
+            if sKey not in aoDocument:
+                oEntity.__dict__[sKey] = RiseEntity.copyValue(aoDefaults[sKey])
+
+        aoEntities.append(oEntity)
+
+    return aoEntities
+
+
+def hydrateDictLayers(oRepository, aoDocuments):
+    # The layers as they were before the slots, created with the constructor: the reference for the memory
+    aoDefaults = oRepository.getEntityClass()().toDocument()
+    return [_DictLayer(aoDefaults, **aoDocument) for aoDocument in aoDocuments]
+
+
+def iterateOnly(oRepository, aoDocuments):
+    # The lower bound: only the iteration on the documents
+    return [aoDocument for aoDocument in aoDocuments]
+
+
+def measureMemory(oFunction, oRepository, iDocuments):
+    """
+    Memory kept by the hydrated layers, once their documents have been released
+    :param oFunction: the function that creates the layers
+    :param oRepository: the layer repository
+    :param iDocuments: number of layers
+    :return: bytes per layer
+    """
+    gc.collect()
+    tracemalloc.start()
+
+    aoEntities = oFunction(oRepository, getLayerDocuments(iDocuments))
+    gc.collect()
+    iBytes = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+    del aoEntities
+
+    return iBytes / iDocuments
+
+
+def measure(oFunction, oRepository, aoDocuments, iRepetitions):
+    fBest = None
+
+    for iRepetition in range(iRepetitions):
+        fStart = time.perf_counter()
+        oFunction(oRepository, aoDocuments)
+        fElapsed = time.perf_counter() - fStart
+
+        if fBest is None or fElapsed < fBest:
+            fBest = fElapsed
+
+    return fBest
+
+
+if __name__ == '__main__':
+    # Number of documents and repetitions of each measure
+    iDocuments = 50000
+    iRepetitions = 5
+
+    try:
+        aoOpts, asArgs = getopt.getopt(sys.argv[1:], "hn:r:", ["documents=", "repetitions="])
+    except getopt.GetoptError:
+        print('Hydration benchmark: python -m src.rise.benchmarks.HydrationBenchmark [-n <documents>] [-r <repetitions>]')
+        sys.exit(2)
+
+    for sOpt, sArg in aoOpts:
+        if sOpt == '-h':
+            print('Hydration benchmark: python -m src.rise.benchmarks.HydrationBenchmark [-n <documents>] [-r <repetitions>]')
+            sys.exit()
+        if sOpt in ("-n", "--documents"):
+            iDocuments = int(sArg)
+        if sOpt in ("-r", "--repetitions"):
+            iRepetitions = int(sArg)
+
+    oLayerRepository = LayerRepository()
+    aoLayerDocuments = getLayerDocuments(iDocuments)
+
+    # Same attributes in both ways
+    if oLayerRepository.hydrateEntity(aoLayerDocuments[0]).toDocument() != hydrateWithGetClass(oLayerRepository, aoLayerDocuments[:1])[0].toDocument():
+        print("Hydration benchmark: the two paths give different entities!")
+        sys.exit(1)
+
+    fIterate = measure(iterateOnly, oLayerRepository, aoLayerDocuments, iRepetitions)
+    fGetClass = measure(hydrateWithGetClass, oLayerRepository, aoLayerDocuments, iRepetitions)
+    fDictSwap = measure(hydrateWithDictSwap, oLayerRepository, aoLayerDocuments, iRepetitions)
+    fHydrate = measure(lambda oRepository, aoDocuments: oRepository.hydrateEntities(aoDocuments), oLayerRepository, aoLayerDocuments, iRepetitions)
+
+    print("Hydration benchmark: " + str(iDocuments) + " layers, best of " + str(iRepetitions))
+    print("  iteration only        : " + str(round(fIterate * 1000, 2)) + " ms")
+    print("  getClass + kwargs     : " + str(round(fGetClass * 1000, 2)) + " ms")
+    print("  dictionary swap       : " + str(round(fDictSwap * 1000, 2)) + " ms")
+    print("  hydrateEntities       : " + str(round(fHydrate * 1000, 2)) + " ms")
+    print("  speed up              : " + str(round(fGetClass / fHydrate, 1)) + "x (dictionary swap " + str(round(fGetClass / fDictSwap, 1)) + "x)")
+
+    fDictMemory = measureMemory(hydrateDictLayers, oLayerRepository, iDocuments)
+    fMemory = measureMemory(lambda oRepository, aoDocuments: oRepository.hydrateEntities(aoDocuments), oLayerRepository, iDocuments)
+
+    print("  memory per layer      : " + str(round(fMemory)) + " bytes (with __dict__ " + str(round(fDictMemory)) + " bytes)")
+
+    bOverBudget = False
+
+    if fHydrate / fDictSwap > s_fMAX_DICT_SWAP_RATIO:
+        print("Hydration benchmark: hydrateEntities is over budget, it should cost at most " + str(s_fMAX_DICT_SWAP_RATIO) + "x the dictionary swap")
+        bOverBudget = True
+
+    # The slots are there to save memory
+    if fMemory > fDictMemory:
+        print("Hydration benchmark: the hydrated layers take more memory than the layers with a __dict__")
+        bOverBudget = True
+
+    if bOverBudget:
+        sys.exit(1)
@@ -2,6 +2,10 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Area(RiseEntity):
+    __slots__ = ("name", "description", "plugins", "fieldOperators", "creationDate", "subscriptionId",
+                 "organizationId", "bbox", "markerCoordinates", "shapeFileMask", "supportArchive",
+                 "archiveStartDate", "archiveEndDate", "newCreatedArea", "active", "firstShortArchivesReady",
+                 "allShortArchivesReady", "firstFullArchivesReady", "allFullArchivesReady", "id")
 
     def __init__(self, **kwargs):
         self.name = str()
@@ -0,0 +1,13 @@
+from src.rise.business.RiseEntity import RiseEntity
+
+
+class DaemonState(RiseEntity):
+    __slots__ = ("id", "value", "lastUpdate")
+
+    def __init__(self, **kwargs):
+        self.id = str()
+        self.value = None
+        self.lastUpdate = float()
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
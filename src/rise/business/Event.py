@@ -2,6 +2,8 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Event(RiseEntity):
+    __slots__ = ("name", "type", "bbox", "startDate", "endDate", "peakDate", "peakStringDate", "id", "areaId",
+                 "description", "publicEvent", "inGoing", "markerCoordinates")
 
     def __init__(self, **kwargs):
         self.name = str()
@@ -2,6 +2,9 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Layer(RiseEntity):
+    __slots__ = ("layerId", "geoserverUrl", "referenceDate", "source", "properties", "mapId", "pluginId", "areaId",
+                 "id", "published", "keepLayer", "dataSource", "createdDate", "resolution", "inputData",
+                 "workspaceId", "publishingStartDate")
 
     def __init__(self, **kwargs):
         self.layerId = str()
@@ -20,6 +23,8 @@ class Layer(RiseEntity):
         self.resolution = ""
         self.inputData = ""
         self.workspaceId = ""
+        # When the publication of the layer started, 0 if it is not being published
+        self.publishingStartDate = 0.0
 
         for key, value in kwargs.items():
             setattr(self, key, value)
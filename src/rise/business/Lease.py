@@ -0,0 +1,14 @@
+from src.rise.business.RiseEntity import RiseEntity
+
+
+class Lease(RiseEntity):
+    __slots__ = ("id", "owner", "heartbeatAt", "expiresAt")
+
+    def __init__(self, **kwargs):
+        self.id = str()
+        self.owner = str()
+        self.heartbeatAt = float()
+        self.expiresAt = float()
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
@@ -2,6 +2,7 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Map(RiseEntity):
+    __slots__ = ("name", "description", "layerBaseName", "icon", "id", "dateFiltered", "className")
 
     def __init__(self, **kwargs):
         self.name = str()
@@ -2,6 +2,8 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class MapsParameter(RiseEntity):
+    __slots__ = ("id", "areaId", "pluginId", "mapId", "payload", "creationUserId", "creationTimestamp",
+                 "lastModifyUserId", "lastModifyTimestamp")
 
     def __init__(self, **kwargs):
         self.id = str()
@@ -2,6 +2,7 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class OTP(RiseEntity):
+    __slots__ = ("userId", "secretCode", "validated", "operation", "timestamp", "id")
 
     def __init__(self, **kwargs):
         self.userId = str()
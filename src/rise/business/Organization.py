@@ -2,6 +2,8 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Organization(RiseEntity):
+    __slots__ = ("name", "type", "phone", "county", "city", "street", "number", "postalCode", "vat", "creationDate",
+                 "id")
 
     def __init__(self, **kwargs):
         self.name = str()
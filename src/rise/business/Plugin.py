@@ -2,6 +2,8 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Plugin(RiseEntity):
+    __slots__ = ("name", "shortDescription", "longDescription", "supportArchive", "archivePrice", "emergencyPrice",
+                 "stringCode", "maps", "id", "className")
 
     def __init__(self, **kwargs):
         self.name = str()
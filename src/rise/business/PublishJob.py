@@ -0,0 +1,16 @@
+from src.rise.business.RiseEntity import RiseEntity
+
+
+class PublishJob(RiseEntity):
+    __slots__ = ("id", "taskId", "status", "owner", "createdAt", "startedAt")
+
+    def __init__(self, **kwargs):
+        self.id = str()
+        self.taskId = str()
+        self.status = str()
+        self.owner = str()
+        self.createdAt = float()
+        self.startedAt = float()
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
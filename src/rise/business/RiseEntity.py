@@ -1,5 +1,458 @@
+from types import MappingProxyType
+
+# Value of the fields not set, or not present in a document
+_s_oMissing = object()
+# Loaded state of an entity read from (or saved to) the db, and not changed since then
+_s_aoNotChanged = MappingProxyType({})
+
+
+class _ContainerField:
+    # Field that can contain a list or a dict: it wraps the slot of the field. The containers of an entity read from
+    # the db are the ones of the document: they are copied only at their first access, when the original goes in the
+    # loaded state of the entity to find also the changes made in place. The entities only read never copy them
+    __slots__ = ("m_sField", "m_oSlot")
+
+    def __init__(self, sField, oSlot):
+        self.m_sField = sField
+        self.m_oSlot = oSlot
+
+    def __get__(self, oEntity, oOwner=None):
+        if oEntity is None:
+            return self
+
+        oValue = self.m_oSlot.__get__(oEntity, oOwner)
+        oType = type(oValue)
+
+        if oType is dict or oType is list or oType is set:
+            aoLoadedState = oEntity.getLoadedState()
+
+            if aoLoadedState is not None and self.m_sField not in aoLoadedState:
+                oEntity.getChangesState()[self.m_sField] = oValue
+                oValue = RiseEntity.copyValue(oValue)
+                self.m_oSlot.__set__(oEntity, oValue)
+
+        return oValue
+
+    def __set__(self, oEntity, oValue):
+        self.m_oSlot.__set__(oEntity, oValue)
+
+    def __delete__(self, oEntity):
+        self.m_oSlot.__delete__(oEntity)
+
+
 class RiseEntity:
+    # The fields of the entities are declared with the __slots__ of each class: this is the schema of the entity,
+    # and the instances have no __dict__. The fields of a document not in the schema are kept in _m_aoExtraFields.
+    # _id is the Mongo id, set only when the entity has been read from (or inserted in) the db.
+    # _m_aoLoadedState keeps the values in the db of the fields changed (or opened, for the containers) since
+    # the entity was read from (or saved to) the db: the fields not in it still have the value of the db
+    __slots__ = ("_id", "_m_aoExtraFields", "_m_aoLoadedState", "__weakref__")
+    # Schema of the entities, by class. See getSchema
+    _s_aoSchemaByClass = {}
+    # Function that fills the entities from the documents, by class. See getHydrator
+    _s_aoHydratorByClass = {}
+
+    def __new__(cls, *args, **kwargs):
+        oEntity = super().__new__(cls)
+        # A new entity is not tracked until it is saved (or read) and marked clean
+        object.__setattr__(oEntity, "_m_aoLoadedState", None)
+        return oEntity
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Without __slots__ the class would have a __dict__, and its fields would not be in the schema
+        if "__slots__" not in cls.__dict__:
+            raise TypeError(f"RiseEntity: {cls.__qualname__} must declare its fields with __slots__")
+
+    @classmethod
+    def getSchema(cls):
+        """
+        Get the schema of the entities of this class, computed once per class: the fields are the __slots__
+        of the entity classes, _id first, and their default values are the ones set by the constructor.
+        The fields that can contain a list or a dict (the ones with a container or None as default value)
+        are wrapped by a _ContainerField, that copies the containers only when they are accessed
+        :return: a tuple (field names, dictionary of the slots by field name, slots, default values,
+        True for the fields that can contain a list or a dict)
+        """
+        aoSchema = RiseEntity._s_aoSchemaByClass.get(cls)
+
+        if aoSchema is None:
+            asFields = ["_id"]
+
+            for oClass in reversed(cls.__mro__):
+                if oClass is RiseEntity or not issubclass(oClass, RiseEntity):
+                    continue
+
+                asSlots = oClass.__dict__.get("__slots__", ())
+
+                if isinstance(asSlots, str):
+                    asSlots = (asSlots,)
+
+                asFields.extend([sSlot for sSlot in asSlots if sSlot not in asFields])
+
+            aoSlots = []
+
+            for sField in asFields:
+                oSlot = getattr(cls, sField)
+                if isinstance(oSlot, _ContainerField):
+                    oSlot = oSlot.m_oSlot
+                aoSlots.append(oSlot)
+
+            oTemplate = cls()
+            aoDefaults = tuple(RiseEntity.getSlotValue(oTemplate, oSlot) for oSlot in aoSlots)
+            abContainers = tuple(oDefault is None or isinstance(oDefault, (dict, list, set)) for oDefault in aoDefaults)
+
+            for sField, oSlot, bContainer in zip(asFields, aoSlots, abContainers):
+                if not bContainer:
+                    continue
+
+                # The field is wrapped in the class that declares its slot
+                for oClass in cls.__mro__:
+                    if oClass.__dict__.get(sField) is oSlot:
+                        setattr(oClass, sField, _ContainerField(sField, oSlot))
+                        break
+
+            aoSchema = (tuple(asFields), dict(zip(asFields, aoSlots)), tuple(aoSlots), aoDefaults, abContainers)
+            RiseEntity._s_aoSchemaByClass[cls] = aoSchema
+
+        return aoSchema
+
+    @staticmethod
+    def getSlotValue(oEntity, oSlot):
+        """
+        Get the value of a slot of an entity, without copying the containers
+        :param oEntity: the entity
+        :param oSlot: the slot
+        :return: the value, _s_oMissing if it is not set
+        """
+        try:
+            return oSlot.__get__(oEntity)
+        except AttributeError:
+            return _s_oMissing
+
+    @classmethod
+    def getHydrator(cls):
+        """
+        Get the function that fills a new entity of this class with the fields of a document, built once per class.
+        It is one straight sequence on the fields of the schema: each field is read once from the document and set
+        with its slot, and only the fields missing from the document take their default value.
+        The values are the ones of the document: the containers are copied only if they are accessed (see _ContainerField)
+        :return: a function (entity, document) that returns the number of fields of the schema missing from the document
+        """
+        oHydrator = RiseEntity._s_aoHydratorByClass.get(cls)
+
+        if oHydrator is None:
+            asFields, aoSlotByField, aoSlots, aoDefaults, abContainers = cls.getSchema()
+            aoNamespace = {"oMissing": _s_oMissing, "copyValue": RiseEntity.copyValue}
+            asLines = ["def hydrate(oEntity, aoDocument):", "    get = aoDocument.get", "    iMissing = 0"]
+
+            for iField, sField in enumerate(asFields):
+                aoNamespace["oSetter" + str(iField)] = aoSlots[iField].__set__
+                aoNamespace["oDefault" + str(iField)] = aoDefaults[iField]
+
+                asLines.append(f"    oValue = get({sField!r}, oMissing)")
+                asLines.append(f"    if oValue is oMissing:")
+                asLines.append(f"        iMissing += 1")
+
+                oDefault = aoDefaults[iField]
+
+                if oDefault is not _s_oMissing:
+                    sDefault = "oDefault" + str(iField)
+                    # Each entity has its own containers
+                    if isinstance(oDefault, (dict, list, set)):
+                        sDefault = "copyValue(" + sDefault + ")"
+                    asLines.append(f"        oSetter{iField}(oEntity, {sDefault})")
+
+                asLines.append(f"    else:")
+                asLines.append(f"        oSetter{iField}(oEntity, oValue)")
+
+            asLines.append("    return iMissing")
+
+            exec("\n".join(asLines), aoNamespace)
+            oHydrator = aoNamespace["hydrate"]
+            RiseEntity._s_aoHydratorByClass[cls] = oHydrator
+
+        return oHydrator
+
+    @classmethod
+    def fromDocument(cls, aoDocument):
+        """
+        Creates the entity of a document read from the db, without calling the constructor.
+        The fields not in the document have their default value, the ones not in the schema go to the extra fields
+        :param aoDocument: the document
+        :return: the entity, that knows the values of the document as its loaded state
+        """
+        return RiseEntity._fromDocument(cls, cls.getHydrator(), cls.getSchema()[1], aoDocument)
+
+    @classmethod
+    def fromDocuments(cls, aoDocuments):
+        """
+        Creates the entities of a list (or a cursor) of documents
+        :param aoDocuments: the documents
+        :return: the list of entities
+        """
+        oHydrator = cls.getHydrator()
+        aoSlotByField = cls.getSchema()[1]
+        oFromDocument = RiseEntity._fromDocument
+        return [oFromDocument(cls, oHydrator, aoSlotByField, aoDocument) for aoDocument in aoDocuments]
+
+    @staticmethod
+    def _fromDocument(oClass, oHydrator, aoSlotByField, aoDocument):
+        oEntity = object.__new__(oClass)
+        iMissing = oHydrator(oEntity, aoDocument)
+        aoLoadedState = _s_aoNotChanged
+
+        if len(aoDocument) > len(aoSlotByField) - iMissing:
+            aoExtraFields = {sKey: oValue for sKey, oValue in aoDocument.items() if sKey not in aoSlotByField}
+            # The extra fields are not wrapped: their containers are copied now, and the originals are in the loaded state
+            aoLoadedState = {sKey: oValue for sKey, oValue in aoExtraFields.items() if isinstance(oValue, (dict, list, set))} or _s_aoNotChanged
+            object.__setattr__(oEntity, "_m_aoExtraFields", RiseEntity.copyValue(aoExtraFields))
+
+        object.__setattr__(oEntity, "_m_aoLoadedState", aoLoadedState)
+
+        return oEntity
+
+    def toDocument(self):
+        """
+        Get the document of the entity: the fields set, followed by the extra fields.
+        The values are the ones of the entity, not copies
+        :return: a new dictionary with the fields of the entity
+        """
+        aoDocument = {}
+        asFields, aoSlotByField, aoSlots = self.getSchema()[:3]
+
+        for sField, oSlot in zip(asFields, aoSlots):
+            oValue = RiseEntity.getSlotValue(self, oSlot)
+
+            if oValue is not _s_oMissing:
+                aoDocument[sField] = oValue
+
+        aoExtraFields = self.getExtraFields()
+
+        if aoExtraFields:
+            aoDocument.update(aoExtraFields)
+
+        return aoDocument
+
+    def getValue(self, sName):
+        """
+        Get the value of a field, or of an extra field, without copying the containers
+        :param sName: name of the field
+        :return: the value, _s_oMissing if it is not set
+        """
+        oSlot = self.getSchema()[1].get(sName)
+
+        if oSlot is not None:
+            return RiseEntity.getSlotValue(self, oSlot)
+
+        aoExtraFields = self.getExtraFields()
+
+        if aoExtraFields is not None:
+            return aoExtraFields.get(sName, _s_oMissing)
+
+        return _s_oMissing
+
+    def getExtraFields(self):
+        """
+        Get the fields of the entity not declared in its schema
+        :return: dictionary of the extra fields, None if there are none
+        """
+        try:
+            return object.__getattribute__(self, "_m_aoExtraFields")
+        except AttributeError:
+            return None
+
+    def getLoadedState(self):
+        """
+        Get the values in the db of the fields changed, or opened, since the entity was read from (or saved to) the db
+        :return: the loaded state (read only), None if the entity is not tracked
+        """
+        try:
+            return object.__getattribute__(self, "_m_aoLoadedState")
+        except AttributeError:
+            return None
+
+    def getChangesState(self):
+        """
+        Get the loaded state of a tracked entity, to add the value in the db of a field that is going to change
+        :return: the loaded state, that can be changed
+        """
+        aoLoadedState = object.__getattribute__(self, "_m_aoLoadedState")
+
+        # The entities not changed share the same empty state
+        if aoLoadedState is _s_aoNotChanged:
+            aoLoadedState = {}
+            object.__setattr__(self, "_m_aoLoadedState", aoLoadedState)
+
+        return aoLoadedState
+
+    def __getattr__(self, sName):
+        # Called only when the name is not a field set: it can be an extra field
+        if not sName.startswith("_m_") and not sName.startswith("__"):
+            aoExtraFields = self.getExtraFields()
+
+            if aoExtraFields is not None and sName in aoExtraFields:
+                return aoExtraFields[sName]
+
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{sName}'")
+
+    def __setattr__(self, sName, oValue):
+        try:
+            aoLoadedState = object.__getattribute__(self, "_m_aoLoadedState")
+        except AttributeError:
+            aoLoadedState = None
+
+        # First change of the field: remember the value it has in the db
+        if aoLoadedState is not None and sName not in aoLoadedState and not sName.startswith("_m_"):
+            self.getChangesState()[sName] = self.getValue(sName)
+
+        try:
+            object.__setattr__(self, sName, oValue)
+        except AttributeError:
+            # Not in the schema: it is an extra field
+            aoExtraFields = self.getExtraFields()
+
+            if aoExtraFields is None:
+                aoExtraFields = {}
+                object.__setattr__(self, "_m_aoExtraFields", aoExtraFields)
+
+            aoExtraFields[sName] = oValue
+
+    def __delattr__(self, sName):
+        aoExtraFields = self.getExtraFields()
+
+        if aoExtraFields is not None and sName in aoExtraFields:
+            del aoExtraFields[sName]
+        else:
+            object.__delattr__(self, sName)
+
+    def markClean(self, aoLoadedState=None):
+        """
+        Remembers the actual values of the fields as the ones saved in the db:
+        from now on getChangedFields will return only the fields changed after this call
+        :param aoLoadedState: the document read from the db, if the entity has a copy of its mutable values.
+        None to take the actual values of the entity
+        :return:
+        """
+        aoPreviousState = self.getLoadedState()
+        aoNewState = {}
+
+        for sKey, oValue in self.toDocument().items():
+            if aoLoadedState is not None:
+                oLoadedValue = aoLoadedState.get(sKey, _s_oMissing)
+
+                if oLoadedValue is not oValue:
+                    aoNewState[sKey] = oLoadedValue
+
+            elif aoPreviousState is None or sKey in aoPreviousState:
+                # The containers the caller can have a reference to: their actual value is copied now
+                if isinstance(oValue, (dict, list, set)):
+                    aoNewState[sKey] = RiseEntity.copyValue(oValue)
+
+        object.__setattr__(self, "_m_aoLoadedState", aoNewState or _s_aoNotChanged)
+
+    def isTracked(self):
+        """
+        Check if the entity knows the values it has in the db
+        :return: True if the entity has been read from or saved to the db
+        """
+        return self.getLoadedState() is not None
+
+    def getLoadedDocument(self):
+        """
+        Get the values of the fields when the entity was read from (or saved to) the db
+        :return: the document, None if the entity is not tracked
+        """
+        aoLoadedState = self.getLoadedState()
+
+        if aoLoadedState is None:
+            return None
+
+        aoDocument = self.toDocument()
+
+        for sKey, oLoadedValue in aoLoadedState.items():
+            if oLoadedValue is _s_oMissing:
+                aoDocument.pop(sKey, None)
+            else:
+                aoDocument[sKey] = oLoadedValue
+
+        return aoDocument
+
+    def getChangedFields(self):
+        """
+        Get the fields changed, also in place (i.e. a key added to a dictionary), since the entity was read or saved
+        :return: dictionary of the changed fields with their new value, or None if the entity is not tracked (all the fields must be saved)
+        """
+        aoLoadedState = self.getLoadedState()
+
+        if aoLoadedState is None:
+            return None
+
+        aoChanged = {}
+
+        for sKey, oLoadedValue in aoLoadedState.items():
+            oValue = self.getValue(sKey)
+
+            if oValue is _s_oMissing:
+                continue
+
+            if oLoadedValue is _s_oMissing or oLoadedValue != oValue:
+                aoChanged[sKey] = oValue
+
+        return aoChanged
+
+    def getDefaultValues(self):
+        """
+        Get the values of the fields of a new entity of the same class
+        :return: dictionary of the default values
+        """
+        aoSchema = self.getSchema()
+        return {sField: oDefault for sField, oDefault in zip(aoSchema[0], aoSchema[3]) if oDefault is not _s_oMissing}
+
+    @staticmethod
+    def copyValue(oValue):
+        """
+        Copy of the values of a document: dictionaries, lists and sets are copied at every level, the other values are shared
+        :param oValue: the value
+        :return: the copy
+        """
+        oType = type(oValue)
+
+        if oType is dict:
+            oCopy = oValue.copy()
+            # Only the containers need a deeper copy
+            for sKey, oChild in oCopy.items():
+                oChildType = type(oChild)
+                if oChildType is dict or oChildType is list or oChildType is set:
+                    oCopy[sKey] = RiseEntity.copyValue(oChild)
+            return oCopy
+
+        if oType is list:
+            oCopy = oValue.copy()
+            for iIndex, oChild in enumerate(oCopy):
+                oChildType = type(oChild)
+                if oChildType is dict or oChildType is list or oChildType is set:
+                    oCopy[iIndex] = RiseEntity.copyValue(oChild)
+            return oCopy
+
+        if oType is set:
+            return set(oValue)
+
+        return oValue
+
+    def __getstate__(self):
+        # The entities sent to the worker processes keep track of their changes
+        return self.toDocument(), self.getLoadedDocument()
+
+    def __setstate__(self, aoState):
+        if isinstance(aoState, tuple) and len(aoState) == 2:
+            aoValues, aoLoadedState = aoState
+        else:
+            aoValues, aoLoadedState = aoState, None
 
-    pass        # so far, the superclass has no specific functionalities
+        for sKey, oValue in aoValues.items():
+            setattr(self, sKey, oValue)
 
-        
\ No newline at end of file
+        if aoLoadedState is not None:
+            self.markClean(aoLoadedState)
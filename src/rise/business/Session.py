@@ -2,6 +2,7 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Session(RiseEntity):
+    __slots__ = ("token", "userId", "loginDate", "lastTouch")
 
     def __init__(self, **kwargs):
         self.token = str()
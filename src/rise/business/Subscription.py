@@ -2,6 +2,8 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class Subscription(RiseEntity):
+    __slots__ = ("organizationId", "name", "type", "description", "creationDate", "buyDate", "valid", "expireDate",
+                 "plugins", "paymentType", "price", "currency", "supportsArchive", "id")
 
     def __init__(self, **kwargs):
         self.organizationId = str()
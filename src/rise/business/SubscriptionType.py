@@ -2,6 +2,7 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class SubscriptionType(RiseEntity):
+    __slots__ = ("description", "stringCode", "id")
 
     def __init__(self, **kwargs):
         self.description = str()
@@ -2,6 +2,11 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class User(RiseEntity):
+    __slots__ = ("userId", "email", "name", "surname", "mobile", "role", "registrationDate", "confirmationDate",
+                 "acceptedTermsAndConditions", "termsAndConditionAcceptedDate", "acceptedPrivacy",
+                 "privacyAcceptedDate", "lastPasswordUpdateDate", "lastLoginDate", "lastResetPasswordRequest",
+                 "notifyNewsletter", "notifyMaintenance", "notifyActivities", "defaultLanguage", "organizationId",
+                 "confirmationCode", "password")
 
     def __init__(self, **kwargs):
         self.userId = str()
@@ -2,6 +2,8 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class WasdiTask(RiseEntity):
+    __slots__ = ("id", "areaId", "mapId", "pluginId", "startDate", "workspaceId", "pluginPayload", "inputParams",
+                 "status", "application", "referenceDate", "isShortArchive", "endDate", "nextCheckAt")
 
     def __init__(self, **kwargs):
         self.id = str()
@@ -16,6 +18,8 @@ class WasdiTask(RiseEntity):
         self.application = str()
         self.referenceDate = str()
         self.isShortArchive = False
+        self.endDate = float()
+        self.nextCheckAt = float()
 
         for key, value in kwargs.items():
             setattr(self, key, value)
@@ -5,6 +5,9 @@ from src.rise.business.RiseEntity import RiseEntity
 
 
 class WidgetInfo(RiseEntity):
+    __slots__ = ("id", "organizationId", "areaId", "widget", "bbox", "type", "icon", "title", "content",
+                 "referenceTime", "referenceDate", "payload")
+
     def __init__(self, **kwargs):
         self.id: str = None
         self.organizationId: str = None
@@ -2,7 +2,6 @@ import logging
 
 from src.rise.business.Area import Area
 from src.rise.data.RiseMongoRepository import RiseMongoRepository
-from src.rise.utils import RiseUtils
 
 
 class AreaRepository(RiseMongoRepository):
@@ -11,10 +10,18 @@ class AreaRepository(RiseMongoRepository):
         super().__init__()
         self.m_sCollectionName = "areas"
         self.m_sEntityClassName = f"{Area.__module__}.{Area.__qualname__}"
-
-    def listActive(self, bActive=None):
+        # The area is read again by each task and engine of the area
+        self.m_bIdentityMap = True
+        self.m_aoIndexes.extend([
+            # listActive
+            {"keys": [("active", 1)]}
+        ])
+
+    def listActive(self, bActive=None, aoProjection=None):
         """
         List all the entities in a collection
+        :param bActive: True or False to filter the areas by their active flag, None for all
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
         :return: the full list of entities in a collection
         """
         oCollection = self.getCollection()
@@ -28,16 +35,13 @@ class AreaRepository(RiseMongoRepository):
             if bActive is not None:
                 aoFilters["active"] = bActive
 
-            oRetrievedResult = oCollection.find(aoFilters)
+            oRetrievedResult = oCollection.find(aoFilters, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"RiseMongoRepository.listAllEntities. No results retrieved from db")
                 return None
 
-            aoRetrievedEntities = []
-            for oResEntity in oRetrievedResult:
-                oEntityClass = RiseUtils.getClass(self.m_sEntityClassName)
-                aoRetrievedEntities.append(oEntityClass(**oResEntity))
+            aoRetrievedEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoRetrievedEntities
 
@@ -0,0 +1,60 @@
+import logging
+
+from src.rise.data.AsyncRiseMongoRepository import AsyncRiseMongoRepository
+from src.rise.data.EventRepository import EventRepository
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+
+
+class AsyncEventRepository(AsyncRiseMongoRepository):
+    """
+    Async twin of EventRepository
+    """
+    def __init__(self):
+        super().__init__(EventRepository())
+
+    async def existsByParams(self, sAreaId="", sPeakStringDate="", sType=""):
+        """
+        Check if there is at least one event matching the parameters of findByParams, without reading them
+        :return: True if there is at least one event
+        """
+        return await self.exists(self.m_oRepository.getParamsFilter(sAreaId, sPeakStringDate, sType))
+
+    async def findByParams(self, sAreaId="", sPeakStringDate="", sType="", aoProjection=None):
+        try:
+            aoFilters = self.m_oRepository.getParamsFilter(sAreaId, sPeakStringDate, sType)
+            return await self.findEntities(aoFilters, aoProjection)
+        except Exception as oEx:
+            logging.error("AsyncEventRepository.findByParams. Exception " + str(oEx))
+
+        return []
+
+    async def getOngoing(self, sAreaId="", aoProjection=None):
+        try:
+            aoEntities = await self.findEntities({"areaId": sAreaId, "inGoing": True}, aoProjection)
+
+            if aoEntities is None:
+                return []
+
+            return aoEntities
+        except Exception as oEx:
+            logging.error("AsyncEventRepository.getOngoing. Exception " + str(oEx))
+
+        return []
+
+    async def getAreaIdsWithOngoingEvents(self):
+        """
+        Get the ids of the areas that have at least one on going event
+        :return: a set of area ids
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncEventRepository.getAreaIdsWithOngoingEvents. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return set()
+
+            return set(await oCollection.distinct("areaId", {"inGoing": True}))
+        except Exception as oEx:
+            logging.error("AsyncEventRepository.getAreaIdsWithOngoingEvents. Exception " + str(oEx))
+
+        return set()
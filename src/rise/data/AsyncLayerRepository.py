@@ -0,0 +1,114 @@
+import logging
+
+from pymongo.errors import DuplicateKeyError
+
+from src.rise.data.AsyncRiseMongoRepository import AsyncRiseMongoRepository
+from src.rise.data.LayerRepository import LayerRepository
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+
+
+class AsyncLayerRepository(AsyncRiseMongoRepository):
+    """
+    Async twin of LayerRepository
+    """
+    def __init__(self):
+        super().__init__(LayerRepository())
+
+    async def getLayersIdsOlderThanDate(self, fTimeStamp, aoProjection=None):
+        """
+        Retrieves all the layers where the reference date is strictly less than the time stamp.
+        If the timestamp is None or a negative value, then it returns all the layers
+        :param fTimeStamp: the timestamp used to fetch documents dated before it
+        :param aoProjection: optional Mongo projection, i.e. {"_id": 0, "id": 1, "layerId": 1}
+        :return: the list of layers dated before the time stamp
+        """
+        if fTimeStamp is None or fTimeStamp < 0.0:
+            return await self.listAllEntities(aoProjection)
+
+        try:
+            return await self.findEntities(self.m_oRepository.getOlderThanDateFilter(fTimeStamp), aoProjection)
+        except Exception as oEx:
+            logging.error(f"AsyncLayerRepository.getLayersIdsOlderThanDate. Exception {oEx}")
+
+        return None
+
+    def iterLayersOlderThanDate(self, fTimeStamp, aoProjection=None, iBatchSize=None):
+        """
+        Streams, to use with async for, the published layers, not to keep, with a reference date strictly
+        less than the time stamp. If the timestamp is None or a negative value, then it streams all the layers
+        :param fTimeStamp: the timestamp used to fetch documents dated before it
+        :param aoProjection: optional Mongo projection, i.e. {"_id": 0, "id": 1, "layerId": 1}
+        :param iBatchSize: number of documents of each batch. None to use the default one
+        :return: async generator of layers
+        """
+        if fTimeStamp is None or fTimeStamp < 0.0:
+            return self.iterEntitiesByField({}, iBatchSize, aoProjection)
+
+        return self.iterEntitiesByField(self.m_oRepository.getOlderThanDateFilter(fTimeStamp), iBatchSize, aoProjection)
+
+    async def upsertLayer(self, oLayer, bReplace=False):
+        """
+        Registers a layer with a single atomic upsert on its id. See LayerRepository.upsertLayer
+        :param oLayer: the layer to register
+        :param bReplace: True to replace the layer already registered with the same id (force republish)
+        :return: True if the layer has been inserted, False if a layer with the same id was already registered, None in case of error
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncLayerRepository.upsertLayer. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            aoDocument = self.m_oRepository.getUpsertDocument(oLayer)
+
+            if bReplace:
+                aoPrevious = await oCollection.find_one_and_replace({"id": oLayer.id}, aoDocument, projection={"_id": 1}, upsert=True)
+            else:
+                aoPrevious = await oCollection.find_one_and_update({"id": oLayer.id}, {"$setOnInsert": aoDocument}, projection={"_id": 1}, upsert=True)
+
+            self.invalidateCache()
+
+            if aoPrevious is None or bReplace:
+                oLayer.markClean()
+
+            return aoPrevious is None
+
+        except DuplicateKeyError:
+            return False
+        except Exception as oEx:
+            logging.error(f"AsyncLayerRepository.upsertLayer. Exception {oEx}")
+
+        return None
+
+    async def bulkUpsertLayers(self, aoLayers, iChunkSize=None):
+        """
+        Registers a list of layers with unordered bulk writes of upserts on their id. See LayerRepository.bulkUpsertLayers
+        :param aoLayers: the layers to register
+        :param iChunkSize: max number of upserts for each bulk write. None to use the configured one
+        :return: the number of inserted layers
+        """
+        iUpserted = 0
+        # The layers already registered are matched: they are not an error
+        iMatched = 0
+
+        if aoLayers is None or len(aoLayers) < 1:
+            return iUpserted
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"AsyncLayerRepository.bulkUpsertLayers. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return iUpserted
+
+        aoOperations = self.m_oRepository.getBulkUpsertOperations(aoLayers)
+
+        for aoChunk, aoChunkLayers in self.m_oRepository.getEntityChunks(aoOperations, aoLayers, iChunkSize):
+            aoCounts = await self.bulkWrite(oCollection, aoChunk, "bulkUpsertLayers")
+            iUpserted += aoCounts.get("nUpserted", 0)
+            iMatched += aoCounts.get("nMatched", 0)
+            self.m_oRepository.markChunkUpserted(aoCounts, aoChunkLayers)
+
+        self.m_oRepository.logBulkResult("bulkUpsertLayers", iUpserted + iMatched, len(aoOperations))
+
+        return iUpserted
@@ -0,0 +1,451 @@
+import logging
+
+from pymongo.errors import BulkWriteError
+
+from src.rise.data.MongoDBClient import MongoDBClient
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+
+
+class AsyncRiseMongoRepository:
+    """
+    Async twin of a RiseMongoRepository, for the code running in an asyncio event loop.
+    The methods have the same names and parameters of the sync ones, but they are coroutines
+    (the iter methods are async generators) and use the AsyncMongoClient of MongoDBClient.
+    Collection, entity class, indexes, hydration and the filters of the queries are taken from the sync
+    repository: the entities are the same.
+    The queries are not checked by the QueryExplainer, not recorded by the TrafficRecorder and do not
+    use the ReferenceCache and the RiseSession (that are bound to the thread, not to the asyncio task)
+    """
+
+    def __init__(self, oRepository):
+        """
+        :param oRepository: the sync repository of the same collection
+        """
+        self.m_oRepository = oRepository
+        self.m_sCollectionName = oRepository.m_sCollectionName
+        self.m_sEntityClassName = oRepository.m_sEntityClassName
+        self.m_aoIndexes = oRepository.m_aoIndexes
+
+    def getCollection(self):
+        """
+        Retrieves from the database a collection. Getting the collection does not need the server, so it is not a coroutine
+        :return: the async collection if present, None otherwise
+        """
+        try:
+            oMongoClient = MongoDBClient.getAsyncClient()
+
+            if oMongoClient is None:
+                return None
+
+            oDatabase = oMongoClient[RiseMongoRepository.s_sDB_NAME]
+
+            if oDatabase is None:
+                logging.warning(f"AsyncRiseMongoRepository.getCollection. Database named '{RiseMongoRepository.s_sDB_NAME}' not found in Mongo")
+                return None
+
+            return oDatabase[self.m_sCollectionName]
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.getCollection. Exception retrieving the collection {oEx}")
+
+        return None
+
+    async def ensureIndexes(self):
+        """
+        Creates, if they do not exist yet, the indexes declared in m_aoIndexes
+        :return: the number of indexes ensured
+        """
+        iEnsured = 0
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"AsyncRiseMongoRepository.ensureIndexes. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return iEnsured
+
+        for aoIndex in self.m_aoIndexes:
+            try:
+                await oCollection.create_index(aoIndex["keys"], unique=aoIndex.get("unique", False))
+                iEnsured += 1
+            except Exception as oEx:
+                logging.warning(f"AsyncRiseMongoRepository.ensureIndexes. Index {aoIndex['keys']} not created on {self.m_sCollectionName}: {oEx}")
+
+        return iEnsured
+
+    def getEntityClass(self):
+        return self.m_oRepository.getEntityClass()
+
+    def hydrateEntity(self, aoDocument):
+        return self.m_oRepository.hydrateEntity(aoDocument)
+
+    def hydrateEntities(self, aoDocuments):
+        return self.m_oRepository.hydrateEntities(aoDocuments)
+
+    def invalidateCache(self):
+        """
+        Removes the collection from the ReferenceCache of this process, after a write
+        :return:
+        """
+        self.m_oRepository.invalidateCache()
+
+    async def findEntities(self, aoFilter, aoProjection=None, aoSort=None, iLimit=0):
+        """
+        Reads and hydrates the entities matching a filter
+        :param aoFilter: the Mongo filter
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
+        :param aoSort: optional list of (field, direction) tuples
+        :param iLimit: max number of entities, 0 for all
+        :return: the list of entities, None if the collection is not available
+        """
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"AsyncRiseMongoRepository.findEntities. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return None
+
+        oCursor = oCollection.find(aoFilter, aoProjection)
+
+        if aoSort:
+            oCursor = oCursor.sort(aoSort)
+
+        if iLimit > 0:
+            oCursor = oCursor.limit(iLimit)
+
+        return self.hydrateEntities(await oCursor.to_list(None))
+
+    async def getEntityById(self, sEntityId, aoProjection=None):
+        """
+        Given the id of an entity, retrieves it from the database
+        :param sEntityId: the id of the entity (not the Mongo _id, but the RISE internal id of the entity)
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
+        :return: the entity with the required id, None otherwise
+        """
+        try:
+            aoRetrievedEntities = await self.findEntities({"id": sEntityId}, aoProjection, iLimit=1)
+
+            if aoRetrievedEntities is not None and len(aoRetrievedEntities) > 0:
+                return aoRetrievedEntities[0]
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.getEntityById. Exception {oEx}")
+
+        return None
+
+    async def listAllEntities(self, aoProjection=None):
+        """
+        List all the entities in a collection
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
+        :return: the full list of entities in a collection
+        """
+        try:
+            return await self.findEntities({}, aoProjection)
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.listAllEntities. Exception {oEx}")
+
+        return None
+
+    async def getAllEntitiesById(self, asEntityIds, aoProjection=None):
+        """
+        Given a list of entities' ids, retrieves from a collection the list of entities matching those ids
+        :param asEntityIds: list of entities' ids to retrieve (not the Mongo _id, but the RISE internal id of the entity)
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
+        :return: the list of entities matching the ids passed as parameters
+        """
+        if asEntityIds is None or len(asEntityIds) == 0:
+            logging.warning("AsyncRiseMongoRepository.getAllEntitiesById. No ids specified")
+            return None
+
+        try:
+            return await self.findEntities({"id": {"$in": asEntityIds}}, aoProjection)
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.getAllEntitiesById. Exception {oEx}")
+
+        return None
+
+    async def getEntitiesByField(self, aoAttributeMap, aoProjection=None):
+        """
+        Given a dictionary, returns the list of the entities matching all the key-value pairs in the dictionary
+        :param aoAttributeMap: a dictionary of all the key-value pairs that the retrieved entities should match
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
+        :return: the list of entities matching the ket-value pairs in the dictionary
+        """
+        if aoAttributeMap is None:
+            return None
+
+        try:
+            return await self.findEntities(aoAttributeMap, aoProjection)
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.getEntitiesByField. Exception {oEx}")
+
+        return None
+
+    async def exists(self, aoFilter):
+        """
+        Check if at least one document matches a filter, without reading the documents
+        :param aoFilter: the Mongo filter
+        :return: True if there is at least a document matching the filter, False otherwise
+        """
+        if aoFilter is None:
+            return False
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncRiseMongoRepository.exists. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            return await oCollection.find_one(aoFilter, {"_id": 1}) is not None
+
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.exists. Exception {oEx}")
+
+        return False
+
+    async def count(self, aoFilter, iLimit=0):
+        """
+        Counts the documents matching a filter, without reading them
+        :param aoFilter: the Mongo filter. {} for all the documents
+        :param iLimit: if greater than 0, the count stops at this number
+        :return: the number of documents matching the filter, up to iLimit. 0 in case of error
+        """
+        if aoFilter is None:
+            return 0
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncRiseMongoRepository.count. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return 0
+
+            if iLimit > 0:
+                return await oCollection.count_documents(aoFilter, limit=iLimit)
+
+            return await oCollection.count_documents(aoFilter)
+
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.count. Exception {oEx}")
+
+        return 0
+
+    async def iterEntitiesByField(self, aoAttributeMap, iBatchSize=None, aoProjection=None, aoSort=None):
+        """
+        Streams the entities matching all the key-value pairs in the dictionary, to use with async for:
+        the documents are read from Mongo in batches and each entity is created only when the caller asks for it
+        :param aoAttributeMap: a dictionary of all the key-value pairs that the retrieved entities should match. {} for all
+        :param iBatchSize: number of documents of each batch. None to use the default one
+        :param aoProjection: optional Mongo projection, i.e. {"_id": 0, "id": 1, "layerId": 1}
+        :param aoSort: optional list of (field, direction) tuples
+        :return: async generator of entities
+        """
+        if aoAttributeMap is None:
+            return
+
+        if iBatchSize is None or iBatchSize < 1:
+            iBatchSize = RiseMongoRepository.s_iITER_BATCH_SIZE
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"AsyncRiseMongoRepository.iterEntitiesByField. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return
+
+        oEntityClass = self.m_oRepository.getEntityClass()
+
+        try:
+            oCursor = oCollection.find(aoAttributeMap, aoProjection)
+
+            if aoSort:
+                oCursor = oCursor.sort(aoSort)
+
+            oCursor = oCursor.batch_size(iBatchSize)
+
+            async for aoDocument in oCursor:
+                yield oEntityClass.fromDocument(aoDocument)
+
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.iterEntitiesByField. Exception {oEx}")
+
+    async def addEntity(self, oEntity):
+        """
+        Insert an entity in a collection
+        :param oEntity: the entity to add to the collection
+        :return: True if the entity was successfully added to the collection, False otherwise
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncRiseMongoRepository.addEntity. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            aoDocument = oEntity.toDocument()
+            await oCollection.insert_one(aoDocument)
+            self.invalidateCache()
+            oEntity._id = aoDocument["_id"]
+            oEntity.markClean()
+
+            return True
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.addEntity. Exception {oEx}")
+
+        return False
+
+    async def updateEntity(self, oEntity):
+        """
+        Given an entity, updates the entry with the same id in the database: only the changed fields are set
+        :param oEntity: the entity to update
+        :return: True if the update was successful, False otherwise
+        """
+        if oEntity is None or not hasattr(oEntity, 'id'):
+            logging.warning("AsyncRiseMongoRepository.updateEntity. The provided entity is None or is missing the 'id' filed")
+            return False
+
+        aoSet = self.m_oRepository.getFieldsToUpdate(oEntity)
+
+        if len(aoSet) == 0:
+            logging.debug(f"AsyncRiseMongoRepository.updateEntity. Entity {oEntity.id} not changed, nothing to update")
+            return True
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncRiseMongoRepository.updateEntity. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oResult = await oCollection.update_one({"id": oEntity.id}, {"$set": aoSet})
+            self.invalidateCache()
+
+            if oResult.modified_count > 0:
+                oEntity.markClean()
+                return True
+
+            logging.warning("AsyncRiseMongoRepository.updateEntity. No document updated in the database")
+
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.updateEntity. Exception {oEx}")
+
+        return False
+
+    async def updateAllEntities(self, aoEntities):
+        """
+        Given a list of entities, updates them in the collection, based on their 'id' field
+        :param aoEntities: the list of entities to update
+        :return: the number of updated entities
+        """
+        if aoEntities is None or len(aoEntities) < 1:
+            logging.warning("AsyncRiseMongoRepository.updateAllEntities. The provided list of entities is None or empty")
+            return 0
+
+        iMatched, iModified = await self.bulkUpdate(aoEntities)
+
+        return iModified
+
+    async def bulkUpdate(self, aoEntities, iChunkSize=None):
+        """
+        Given a list of entities, updates them in the collection, based on their 'id' field,
+        with unordered bulk writes of (at most) iChunkSize operations
+        :param aoEntities: the list of entities to update
+        :param iChunkSize: max number of updates for each bulk write. None to use the configured one
+        :return: a tuple (number of matched entities, number of modified entities)
+        """
+        iMatched = 0
+        iModified = 0
+
+        if aoEntities is None or len(aoEntities) < 1:
+            return iMatched, iModified
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"AsyncRiseMongoRepository.bulkUpdate. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return iMatched, iModified
+
+        aoOperations, aoUpdatedEntities = self.m_oRepository.getBulkUpdateOperations(aoEntities)
+
+        for aoChunk, aoChunkEntities in self.m_oRepository.getEntityChunks(aoOperations, aoUpdatedEntities, iChunkSize):
+            aoCounts = await self.bulkWrite(oCollection, aoChunk, "bulkUpdate")
+            iMatched += aoCounts.get("nMatched", 0)
+            iModified += aoCounts.get("nModified", 0)
+            self.m_oRepository.markChunkWritten(aoCounts, "nMatched", aoChunkEntities)
+
+        self.m_oRepository.logBulkResult("bulkUpdate", iMatched, len(aoOperations))
+
+        return iMatched, iModified
+
+    async def bulkWrite(self, oCollection, aoOperations, sCaller):
+        """
+        Executes an unordered bulk write. See RiseMongoRepository.bulkWrite
+        :param oCollection: the async collection
+        :param aoOperations: the operations to execute
+        :param sCaller: name of the calling method, for the logs
+        :return: dictionary with the nInserted, nMatched, nModified, nUpserted counts and the upserted operations
+        """
+        try:
+            return self.m_oRepository.getBulkWriteCounts(await oCollection.bulk_write(aoOperations, ordered=False))
+        except BulkWriteError as oEx:
+            return self.m_oRepository.getBulkWriteErrorCounts(oEx, aoOperations, sCaller)
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.{sCaller}. Exception {oEx}")
+
+        return {}
+
+    async def deleteEntity(self, sEntityId):
+        """
+        Given an entity id, delete the corresponding entry in the database
+        :param sEntityId: the id of the entity to delete
+        :return: True if the deletion was successful, False otherwise
+        """
+        if sEntityId is None or sEntityId == '':
+            logging.warning("AsyncRiseMongoRepository.deleteEntity. The provided entity is None or empty")
+            return False
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncRiseMongoRepository.deleteEntity. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oResult = await oCollection.delete_one({"id": sEntityId})
+            self.invalidateCache()
+
+            if oResult.deleted_count > 0:
+                return True
+
+            logging.warning("AsyncRiseMongoRepository.deleteEntity. No entity deleted from the database")
+
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.deleteEntity. Exception {oEx}")
+
+        return False
+
+    async def deleteAllEntitesById(self, asEntityIds):
+        """
+        Given a list of entity ids, delete the corresponding entries in the database
+        :param asEntityIds: the list of ids of the entity to delete
+        :return: True if the deletion was successful, False otherwise
+        """
+        if asEntityIds is None or len(asEntityIds) == 0:
+            logging.warning("AsyncRiseMongoRepository.deleteAllEntitiesById. The provided entity is None or empty")
+            return False
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncRiseMongoRepository.deleteAllEntitiesById. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oResult = await oCollection.delete_many({"id": {"$in": asEntityIds}})
+            self.invalidateCache()
+
+            if oResult.deleted_count > 0:
+                return True
+
+            logging.warning("AsyncRiseMongoRepository.deleteAllEntitiesById. No entity deleted from the database")
+
+        except Exception as oEx:
+            logging.error(f"AsyncRiseMongoRepository.deleteAllEntitiesById. Exception {oEx}")
+
+        return False
@@ -0,0 +1,204 @@
+import logging
+
+from pymongo.errors import BulkWriteError
+
+from src.rise.data.AsyncRiseMongoRepository import AsyncRiseMongoRepository
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
+
+
+class AsyncWasdiTaskRepository(AsyncRiseMongoRepository):
+    """
+    Async twin of WasdiTaskRepository
+    """
+    def __init__(self, bIncludeArchive=False):
+        """
+        :param bIncludeArchive: True to search also the archived tasks in getEntityById, findByParams,
+        existsByParams and getDoneDurations
+        """
+        super().__init__(WasdiTaskRepository(bIncludeArchive))
+        self.m_bIncludeArchive = bIncludeArchive
+
+    def getArchiveRepository(self):
+        """
+        Get the async repository of the archived tasks
+        :return: the repository of the archive
+        """
+        oArchiveRepository = AsyncWasdiTaskRepository()
+        oArchiveRepository.m_oRepository = self.m_oRepository.getArchiveRepository()
+        oArchiveRepository.m_sCollectionName = oArchiveRepository.m_oRepository.m_sCollectionName
+        return oArchiveRepository
+
+    async def getEntityById(self, sEntityId, aoProjection=None):
+        oTask = await super().getEntityById(sEntityId, aoProjection)
+
+        if oTask is None and self.m_bIncludeArchive:
+            oTask = await self.getArchiveRepository().getEntityById(sEntityId, aoProjection)
+
+        return oTask
+
+    async def getCreatedList(self, bOnlyDue=True, aoProjection=None):
+        """
+        Get the list of the CREATED tasks
+        :param bOnlyDue: True to get only the tasks that must be checked now (see nextCheckAt)
+        :param aoProjection: optional Mongo projection, to read only some fields of the tasks
+        :return: list of tasks
+        """
+        return [oTask async for oTask in self.iterCreated(bOnlyDue, aoProjection)]
+
+    def iterCreated(self, bOnlyDue=True, aoProjection=None, iBatchSize=None):
+        """
+        Streams, to use with async for, the CREATED tasks
+        :param bOnlyDue: True to get only the tasks that must be checked now (see nextCheckAt)
+        :param aoProjection: optional Mongo projection, to read only some fields of the tasks
+        :param iBatchSize: number of documents of each batch. None to use the default one
+        :return: async generator of tasks
+        """
+        return self.iterEntitiesByField(self.m_oRepository.getCreatedFilter(bOnlyDue), iBatchSize, aoProjection)
+
+    async def existsByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+        """
+        Check if there is at least one task matching the parameters of findByParams, without reading the tasks
+        :return: True if there is at least one task
+        """
+        aoFilters = self.m_oRepository.getParamsFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
+
+        if await self.exists(aoFilters):
+            return True
+
+        return self.m_bIncludeArchive and await self.getArchiveRepository().exists(aoFilters)
+
+    async def existsNotFinishedByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+        """
+        Check if there is at least one task matching the parameters of findByParams that is not finished
+        :return: True if there is a task not finished, False if all the tasks are finished (or there are no tasks), None in case of error
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncWasdiTaskRepository.existsNotFinishedByParams. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            aoFilters = self.m_oRepository.getNotFinishedFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
+
+            return await oCollection.find_one(aoFilters, {"_id": 1}) is not None
+        except Exception as oEx:
+            logging.error(f"AsyncWasdiTaskRepository.existsNotFinishedByParams. Exception {oEx}")
+
+        return None
+
+    async def findByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None, aoProjection=None):
+        try:
+            aoFilters = self.m_oRepository.getParamsFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
+
+            aoEntities = await self.findEntities(aoFilters, aoProjection)
+
+            if aoEntities is None:
+                return None
+
+            if self.m_bIncludeArchive:
+                aoEntities.extend(await self.getArchiveRepository().findByParams(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive, aoProjection))
+
+            return aoEntities
+        except Exception as oEx:
+            logging.error(f"AsyncWasdiTaskRepository.findByParams. Exception {oEx}")
+
+        return []
+
+    async def getDoneDurations(self, sApplication, iLimit=50, bIncludeArchive=None):
+        """
+        Get the durations of the last DONE tasks of an application
+        :param sApplication: name of the WASDI application
+        :param iLimit: max number of tasks to consider
+        :param bIncludeArchive: True to complete the list with the archived tasks. None to use the flag of the repository
+        :return: list of durations in seconds, the most recent first
+        """
+        if bIncludeArchive is None:
+            bIncludeArchive = self.m_bIncludeArchive
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncWasdiTaskRepository.getDoneDurations. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return []
+
+            aoFilter, aoProjection, aoSort = self.m_oRepository.getDoneDurationsQuery(sApplication)
+            afDurations = self.m_oRepository.getDurations(await oCollection.find(aoFilter, aoProjection).sort(aoSort).limit(iLimit).to_list(None))
+
+            if bIncludeArchive and len(afDurations) < iLimit:
+                afDurations.extend(await self.getArchiveRepository().getDoneDurations(sApplication, iLimit - len(afDurations), False))
+
+            return afDurations
+        except Exception as oEx:
+            logging.error("AsyncWasdiTaskRepository.getDoneDurations: Exception " + str(oEx))
+
+        return []
+
+    async def setNextChecks(self, afNextChecks):
+        """
+        Saves, with a single bulk write, when each task will have to be checked again
+        :param afNextChecks: dictionary task id -> nextCheckAt timestamp
+        :return: number of tasks updated
+        """
+        if afNextChecks is None or len(afNextChecks) == 0:
+            return 0
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"AsyncWasdiTaskRepository.setNextChecks. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return 0
+
+            oResult = await oCollection.bulk_write(self.m_oRepository.getNextChecksOperations(afNextChecks), ordered=False)
+            return oResult.modified_count
+        except Exception as oEx:
+            logging.error("AsyncWasdiTaskRepository.setNextChecks: Exception " + str(oEx))
+
+        return 0
+
+    async def archiveFinishedTasks(self, iDays, iBatchSize=None):
+        """
+        Moves to wasdi_tasks_archive the finished tasks older than iDays days. See WasdiTaskRepository.archiveFinishedTasks
+        :param iDays: age in days of the tasks to archive
+        :param iBatchSize: number of tasks moved with each batch. None to use the default one
+        :return: number of tasks moved
+        """
+        iMoved = 0
+        aoFilters, iBatchSize = self.m_oRepository.getArchivePlan(iDays, iBatchSize)
+
+        if aoFilters is None:
+            return iMoved
+
+        try:
+            oCollection = self.getCollection()
+            oArchiveCollection = self.getArchiveRepository().getCollection()
+
+            if oCollection is None or oArchiveCollection is None:
+                logging.warning(f"AsyncWasdiTaskRepository.archiveFinishedTasks. collections {self.m_sCollectionName} or {WasdiTaskRepository.s_sARCHIVE_COLLECTION_NAME} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return iMoved
+
+            while True:
+                aoDocuments = await oCollection.find(aoFilters).limit(iBatchSize).to_list(None)
+
+                if len(aoDocuments) == 0:
+                    break
+
+                try:
+                    await oArchiveCollection.insert_many(aoDocuments, ordered=False)
+                except BulkWriteError as oEx:
+                    if not self.m_oRepository.isArchiveCopyComplete(oEx):
+                        break
+
+                oResult = await oCollection.delete_many(self.m_oRepository.getDocumentsFilter(aoDocuments))
+                iMoved += oResult.deleted_count
+
+                if self.m_oRepository.isLastArchiveBatch(aoDocuments, iBatchSize):
+                    break
+
+        except Exception as oEx:
+            logging.error("AsyncWasdiTaskRepository.archiveFinishedTasks: Exception " + str(oEx))
+
+        return iMoved
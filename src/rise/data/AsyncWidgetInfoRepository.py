@@ -0,0 +1,28 @@
+import logging
+
+from src.rise.data.AsyncRiseMongoRepository import AsyncRiseMongoRepository
+from src.rise.data.WidgetInfoRepository import WidgetInfoRepository
+
+
+class AsyncWidgetInfoRepository(AsyncRiseMongoRepository):
+    """
+    Async twin of WidgetInfoRepository
+    """
+    def __init__(self):
+        super().__init__(WidgetInfoRepository())
+
+    async def existsByParams(self, sWidget="", sAreaId="", sReferenceDate=0, sTitle=""):
+        """
+        Check if there is at least one widget matching the parameters of findByParams, without reading them
+        :return: True if there is at least one widget
+        """
+        return await self.exists(self.m_oRepository.getParamsFilter(sWidget, sAreaId, sReferenceDate, sTitle))
+
+    async def findByParams(self, sWidget="", sAreaId="", sReferenceDate=0, sTitle="", aoProjection=None):
+        try:
+            aoFilters = self.m_oRepository.getParamsFilter(sWidget, sAreaId, sReferenceDate, sTitle)
+            return await self.findEntities(aoFilters, aoProjection)
+        except Exception as oEx:
+            logging.error(f"AsyncWidgetInfoRepository.findByParams. Exception: {str(oEx)}")
+
+        return []
@@ -0,0 +1,49 @@
+import logging
+from datetime import datetime
+
+from src.rise.business.DaemonState import DaemonState
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+
+
+class DaemonStateRepository(RiseMongoRepository):
+
+    def __init__(self):
+        super().__init__()
+        self.m_sCollectionName = "daemon_state"
+        self.m_sEntityClassName = f"{DaemonState.__module__}.{DaemonState.__qualname__}"
+
+    def getValue(self, sKey, oDefault=None):
+        """
+        Read a value that the deamon saved between two runs
+        :param sKey: key of the value
+        :param oDefault: value to return if the key has never been saved
+        :return: the saved value or the default
+        """
+        oState = self.getEntityById(sKey)
+
+        if oState is None:
+            return oDefault
+
+        return oState.value
+
+    def setValue(self, sKey, oValue):
+        """
+        Save a value of the deamon for the next runs
+        :param sKey: key of the value
+        :param oValue: value to save
+        :return: True if the value has been saved, False otherwise
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"DaemonStateRepository.setValue. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oCollection.update_one({"id": sKey}, {"$set": {"id": sKey, "value": oValue, "lastUpdate": datetime.now().timestamp()}}, upsert=True)
+            return True
+
+        except Exception as oEx:
+            logging.error(f"DaemonStateRepository.setValue. Exception {oEx}")
+
+        return False
@@ -8,8 +8,44 @@ class EventRepository(RiseMongoRepository):
         super().__init__()
         self.m_sCollectionName = "events"
         self.m_sEntityClassName = f"{Event.__module__}.{Event.__qualname__}"
-
-    def findByParams(self, sAreaId="", sPeakStringDate="", sType=""):
+        self.m_aoIndexes.extend([
+            # findByParams
+            {"keys": [("areaId", 1), ("peakStringDate", 1), ("type", 1)]},
+            # getOngoing and getAreaIdsWithOngoingEvents
+            {"keys": [("inGoing", 1), ("areaId", 1)]}
+        ])
+
+    def getParamsFilter(self, sAreaId="", sPeakStringDate="", sType=""):
+        """
+        Get the Mongo filter of findByParams: the empty parameters are not filtered
+        :return: the filter
+        """
+        aoFilters = {}
+
+        if sAreaId is None:
+            sAreaId = ""
+        if sPeakStringDate is None:
+            sPeakStringDate = ""
+        if sType is None:
+            sType = ""
+
+        if sAreaId != "":
+            aoFilters["areaId"] = sAreaId
+        if sPeakStringDate != "":
+            aoFilters["peakStringDate"] = sPeakStringDate
+        if sType != "":
+            aoFilters["type"] = sType
+
+        return aoFilters
+
+    def existsByParams(self, sAreaId="", sPeakStringDate="", sType=""):
+        """
+        Check if there is at least one event matching the parameters of findByParams, without reading them
+        :return: True if there is at least one event
+        """
+        return self.exists(self.getParamsFilter(sAreaId, sPeakStringDate, sType))
+
+    def findByParams(self, sAreaId="", sPeakStringDate="", sType="", aoProjection=None):
         try:
             oCollection = self.getCollection()
 
@@ -17,31 +53,15 @@ class EventRepository(RiseMongoRepository):
                 logging.warning(f"EventRepository.findByParams. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            aoFilters = {}
-
-            if sAreaId is None:
-                sAreaId = ""
-            if sPeakStringDate is None:
-                sPeakStringDate = ""
-            if sType is None:
-                sType = ""
+            aoFilters = self.getParamsFilter(sAreaId, sPeakStringDate, sType)
 
-            if sAreaId != "":
-                aoFilters["areaId"] = sAreaId
-            if sPeakStringDate != "":
-                aoFilters["peakStringDate"] = sPeakStringDate
-            if sType != "":
-                aoFilters["type"] = sType
-
-            oRetrievedResult = oCollection.find(aoFilters)
+            oRetrievedResult = oCollection.find(aoFilters, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"EventRepository.findByParams. no results retrieved from db")
                 return None
 
-            aoEntities = []
-            for oRes in oRetrievedResult:
-                aoEntities.append(Event(**oRes))
+            aoEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoEntities
         except Exception as oEx:
@@ -49,7 +69,7 @@ class EventRepository(RiseMongoRepository):
 
         return []        
     
-    def getOngoing(self, sAreaId=""):
+    def getOngoing(self, sAreaId="", aoProjection=None):
         try:
             oCollection = self.getCollection()
 
@@ -62,18 +82,34 @@ class EventRepository(RiseMongoRepository):
             aoFilters["areaId"] = sAreaId            
             aoFilters["inGoing"] = True
 
-            oRetrievedResult = oCollection.find(aoFilters)
+            oRetrievedResult = oCollection.find(aoFilters, aoProjection)
 
             if oRetrievedResult is None:
                 logging.debug(f"EventRepository.getOngoing. no results retrieved from db")
                 return None
 
-            aoEntities = []
-            for oRes in oRetrievedResult:
-                aoEntities.append(Event(**oRes))
+            aoEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoEntities
         except Exception as oEx:
             logging.error("EventRepository.findByParams. Exception " + str(oEx))
 
-        return []            
\ No newline at end of file
+        return []
+
+    def getAreaIdsWithOngoingEvents(self):
+        """
+        Get the ids of the areas that have at least one on going event
+        :return: a set of area ids
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"EventRepository.getAreaIdsWithOngoingEvents. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return set()
+
+            return set(oCollection.distinct("areaId", {"inGoing": True}))
+        except Exception as oEx:
+            logging.error("EventRepository.getAreaIdsWithOngoingEvents. Exception " + str(oEx))
+
+        return set()
@@ -1,30 +1,42 @@
 import logging
 
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
 from src.rise.business.Layer import Layer
 from src.rise.data.RiseMongoRepository import RiseMongoRepository
 
 
 class LayerRepository(RiseMongoRepository):
+    # publishingStartDate of a layer whose publication failed: older than any timeout, so the publication is retried
+    s_fFAILED_PUBLISHING_START_DATE = 1.0
 
     def __init__(self):
         super().__init__()
         self.m_sCollectionName = "layers"
         self.m_sEntityClassName = f"{Layer.__module__}.{Layer.__qualname__}"
+        # upsertLayer relies on the unique layer id
+        self.m_aoIndexes = [{"keys": [("id", 1)], "unique": True}]
+        self.m_aoIndexes.extend([
+            # getLayersIdsOlderThanDate: equalities first, then the range
+            {"keys": [("keepLayer", 1), ("published", 1), ("referenceDate", 1)]}
+        ])
 
 
-    def getLayersIdsOlderThanDate(self, fTimeStamp):
+    def getLayersIdsOlderThanDate(self, fTimeStamp, aoProjection=None):
         """
         Given a timestamp representing a date, retrieves all the documents where the reference date is
         strictly less than the time stamp. If the timestamp is None or a negative value,
         then it returns the ids of all the layers stored in the database
         :param fTimeStamp: the timestamp used to fetch documents dated before it
+        :param aoProjection: optional Mongo projection, i.e. {"_id": 0, "id": 1, "layerId": 1}
         :return: the list of ids of layers dated before the time stamp
         """
 
         if fTimeStamp is None or fTimeStamp < 0.0:
             logging.info("LayerRepository.getLayersIdsOlderThanDate. Timestamp none or negative. "
                          "Returning all layers ids.")
-            return self.listAllEntities()
+            return self.listAllEntities(aoProjection)
 
         try:
             oCollection = self.getCollection()
@@ -34,12 +46,12 @@ class LayerRepository(RiseMongoRepository):
                                 f"Collection {self.m_sCollectionName} not in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResults = oCollection.find({"referenceDate": {"$lt": fTimeStamp}, "keepLayer": False, "published": True})
+            oRetrievedResults = oCollection.find(self.getOlderThanDateFilter(fTimeStamp), aoProjection)
 
             if oRetrievedResults is None:
                 return None
 
-            aoRetrievedLayers = list(map(lambda oLayerRes: Layer(**oLayerRes), oRetrievedResults))
+            aoRetrievedLayers = self.hydrateEntities(oRetrievedResults)
 
             logging.debug(f"LayerRepository.getLayersIdsOlderThanDate. Found {len(aoRetrievedLayers)} layers")
             return aoRetrievedLayers
@@ -49,3 +61,301 @@ class LayerRepository(RiseMongoRepository):
 
         return None
 
+    def iterLayersOlderThanDate(self, fTimeStamp, aoProjection=None, iBatchSize=None):
+        """
+        Streams the published layers, not to keep, with a reference date strictly less than the time stamp.
+        If the timestamp is None or a negative value, then it streams all the layers
+        :param fTimeStamp: the timestamp used to fetch documents dated before it
+        :param aoProjection: optional Mongo projection, i.e. {"_id": 0, "id": 1, "layerId": 1}
+        :param iBatchSize: number of documents of each batch. None to use the default one
+        :return: generator of layers
+        """
+        if fTimeStamp is None or fTimeStamp < 0.0:
+            logging.info("LayerRepository.iterLayersOlderThanDate. Timestamp none or negative. Streaming all layers.")
+            return self.iterEntitiesByField({}, iBatchSize, aoProjection)
+
+        return self.iterEntitiesByField(self.getOlderThanDateFilter(fTimeStamp), iBatchSize, aoProjection)
+
+    def getOlderThanDateFilter(self, fTimeStamp):
+        """
+        Get the Mongo filter of the published layers, not to keep, with a reference date strictly less than the time stamp
+        :param fTimeStamp: the timestamp used to fetch documents dated before it
+        :return: the filter
+        """
+        return {"referenceDate": {"$lt": fTimeStamp}, "keepLayer": False, "published": True}
+
+    def getUpsertDocument(self, oLayer):
+        """
+        Get the document written by upsertLayer: the fields of the layer, without the Mongo _id
+        :param oLayer: the layer
+        :return: the document
+        """
+        aoDocument = oLayer.toDocument()
+        aoDocument.pop("_id", None)
+        return aoDocument
+
+    def getPublicationFilter(self, sLayerId, fPublishingStartDate):
+        """
+        Get the Mongo filter of a layer being published by the caller: the one with its publication start date
+        :param sLayerId: id of the layer
+        :param fPublishingStartDate: publishingStartDate written when the publication started
+        :return: the filter
+        """
+        return {"id": sLayerId, "publishingStartDate": fPublishingStartDate}
+
+    def takeLayerPublication(self, sLayerId, fPublishingStartDate, fStaleSeconds):
+        """
+        Takes, with a single atomic update, the publication of a layer already registered but not published:
+        the layer is taken only if its publication started more than fStaleSeconds ago (i.e. the publisher died before
+        finishing) or failed (see releaseLayerPublication). The layers only registered, or unpublished by the retention,
+        have no publication started (publishingStartDate missing or 0) and are left as they are
+        :param sLayerId: id of the layer
+        :param fPublishingStartDate: timestamp of the new publication
+        :param fStaleSeconds: seconds after which a publication not finished is considered dead
+        :return: True if the publication has been taken, False if the layer is published or being published by another publisher, None in case of error
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LayerRepository.takeLayerPublication. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            aoFilter = {
+                "id": sLayerId,
+                "published": {"$ne": True},
+                "publishingStartDate": {"$gt": 0.0, "$lt": fPublishingStartDate - fStaleSeconds}
+            }
+
+            oResult = oCollection.update_one(aoFilter, {"$set": {"publishingStartDate": fPublishingStartDate}})
+            self.invalidateCache()
+
+            return oResult.modified_count == 1
+
+        except Exception as oEx:
+            logging.error(f"LayerRepository.takeLayerPublication. Exception {oEx}")
+
+        return None
+
+    def setLayerPublished(self, oLayer, fPublishingStartDate):
+        """
+        Marks as published a layer whose publication, started at fPublishingStartDate, succeeded
+        :param oLayer: the layer
+        :param fPublishingStartDate: publishingStartDate written when the publication started
+        :return: True if the layer has been updated, False if the publication had been taken by another publisher in the meantime
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LayerRepository.setLayerPublished. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oResult = oCollection.update_one(self.getPublicationFilter(oLayer.id, fPublishingStartDate), {"$set": {"published": True, "publishingStartDate": 0.0}})
+            self.invalidateCache()
+
+            oLayer.published = True
+            oLayer.publishingStartDate = 0.0
+
+            if oResult.matched_count == 1:
+                oLayer.markClean()
+                return True
+
+        except Exception as oEx:
+            logging.error(f"LayerRepository.setLayerPublished. Exception {oEx}")
+
+        return False
+
+    def releaseLayerPublication(self, sLayerId, fPublishingStartDate, bDelete):
+        """
+        Called when the publication of a layer failed: the layer is removed, if it has been registered for this publication,
+        otherwise it is left as not published, with a publication start date older than any timeout: the next publisher
+        of the layer retries the publication. Nothing changes if another publisher took the layer in the meantime
+        :param sLayerId: id of the layer
+        :param fPublishingStartDate: publishingStartDate written when the publication started
+        :param bDelete: True to remove the layer
+        :return: True if the layer has been released
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LayerRepository.releaseLayerPublication. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            aoFilter = self.getPublicationFilter(sLayerId, fPublishingStartDate)
+
+            if bDelete:
+                oResult = oCollection.delete_one(aoFilter)
+                bReleased = oResult.deleted_count == 1
+            else:
+                oResult = oCollection.update_one(aoFilter, {"$set": {"publishingStartDate": LayerRepository.s_fFAILED_PUBLISHING_START_DATE}})
+                bReleased = oResult.matched_count == 1
+
+            self.invalidateCache()
+            return bReleased
+
+        except Exception as oEx:
+            logging.error(f"LayerRepository.releaseLayerPublication. Exception {oEx}")
+
+        return False
+
+    def hasUniqueIdIndex(self):
+        """
+        Check if the layers collection has the unique index on the layer id, that upsertLayer relies on
+        :return: True if the index exists, False if it does not, None in case of error
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LayerRepository.hasUniqueIdIndex. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            for sName, aoIndex in oCollection.index_information().items():
+                if list(aoIndex.get("key", [])) == [("id", 1)] and aoIndex.get("unique", False):
+                    return True
+
+            return False
+
+        except Exception as oEx:
+            logging.error(f"LayerRepository.hasUniqueIdIndex. Exception {oEx}")
+
+        return None
+
+    def migrateUniqueIdIndex(self):
+        """
+        One-off migration of the layers collections created before the unique index on the layer id.
+        For each id registered more than once it keeps one layer (the last published one, or the last one if none is published)
+        and deletes the others; then it drops the old, not unique, index on the id and creates the unique one.
+        It must run with the deamons stopped
+        :return: the number of duplicated layers deleted, None if the migration failed
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LayerRepository.migrateUniqueIdIndex. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            aoPipeline = [
+                {"$group": {"_id": "$id", "count": {"$sum": 1}, "layers": {"$push": {"_id": "$_id", "published": "$published"}}}},
+                {"$match": {"count": {"$gt": 1}}}
+            ]
+
+            iDeleted = 0
+
+            for aoDuplicated in oCollection.aggregate(aoPipeline, allowDiskUse=True):
+                # The ObjectIds grow with the insertion time: published first, then the most recent
+                aoLayers = sorted(aoDuplicated["layers"], key=lambda aoLayer: (aoLayer.get("published") is True, aoLayer["_id"]), reverse=True)
+                aoToDelete = [aoLayer["_id"] for aoLayer in aoLayers[1:]]
+
+                oResult = oCollection.delete_many({"_id": {"$in": aoToDelete}})
+                iDeleted += oResult.deleted_count
+                logging.info(f"LayerRepository.migrateUniqueIdIndex. Layer {aoDuplicated['_id']}: {oResult.deleted_count} duplicates deleted")
+
+            for sName, aoIndex in oCollection.index_information().items():
+                if list(aoIndex.get("key", [])) == [("id", 1)] and not aoIndex.get("unique", False):
+                    logging.info(f"LayerRepository.migrateUniqueIdIndex. Dropping the index {sName}")
+                    oCollection.drop_index(sName)
+
+            oCollection.create_index([("id", 1)], unique=True)
+            self.invalidateCache()
+
+            logging.info(f"LayerRepository.migrateUniqueIdIndex. Unique index on the layer id created, {iDeleted} duplicated layers deleted")
+            return iDeleted
+
+        except Exception as oEx:
+            logging.error(f"LayerRepository.migrateUniqueIdIndex. Exception {oEx}")
+
+        return None
+
+    def upsertLayer(self, oLayer, bReplace=False):
+        """
+        Registers a layer with a single atomic upsert on its id: the layer is inserted only if no layer
+        with the same id exists, so concurrent publishers cannot add it twice
+        :param oLayer: the layer to register
+        :param bReplace: True to replace the layer already registered with the same id (force republish)
+        :return: True if the layer has been inserted, False if a layer with the same id was already registered
+        (and, with bReplace, it has been replaced), None in case of error
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LayerRepository.upsertLayer. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            aoDocument = self.getUpsertDocument(oLayer)
+
+            # The pre-image tells if the layer was already there: None means that it has been inserted now
+            if bReplace:
+                aoPrevious = oCollection.find_one_and_replace({"id": oLayer.id}, aoDocument, projection={"_id": 1}, upsert=True)
+            else:
+                aoPrevious = oCollection.find_one_and_update({"id": oLayer.id}, {"$setOnInsert": aoDocument}, projection={"_id": 1}, upsert=True)
+
+            self.invalidateCache()
+
+            if aoPrevious is None or bReplace:
+                oLayer.markClean()
+
+            return aoPrevious is None
+
+        except DuplicateKeyError:
+            # Another publisher inserted the same layer between the match and the insert of our upsert
+            return False
+        except Exception as oEx:
+            logging.error(f"LayerRepository.upsertLayer. Exception {oEx}")
+
+        return None
+
+    def bulkUpsertLayers(self, aoLayers, iChunkSize=None):
+        """
+        Registers a list of layers with unordered bulk writes of (at most) iChunkSize upserts on their id:
+        as in upsertLayer, a layer is inserted only if no layer with the same id exists
+        :param aoLayers: the layers to register
+        :param iChunkSize: max number of upserts for each bulk write. None to use the configured one
+        :return: the number of inserted layers
+        """
+        iUpserted = 0
+        # The layers already registered are matched: they are not an error
+        iMatched = 0
+
+        if aoLayers is None or len(aoLayers) < 1:
+            return iUpserted
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"LayerRepository.bulkUpsertLayers. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return iUpserted
+
+        aoOperations = self.getBulkUpsertOperations(aoLayers)
+
+        for aoChunk, aoChunkLayers in self.getEntityChunks(aoOperations, aoLayers, iChunkSize):
+            aoCounts = self.bulkWrite(oCollection, aoChunk, "bulkUpsertLayers")
+            iUpserted += aoCounts.get("nUpserted", 0)
+            iMatched += aoCounts.get("nMatched", 0)
+            self.markChunkUpserted(aoCounts, aoChunkLayers)
+
+        self.logBulkResult("bulkUpsertLayers", iUpserted + iMatched, len(aoOperations))
+
+        return iUpserted
+
+    def getBulkUpsertOperations(self, aoLayers):
+        """
+        Get the operations of bulkUpsertLayers: an upsert that writes the layer only when it is inserted
+        :param aoLayers: the layers to register
+        :return: list of UpdateOne
+        """
+        return [UpdateOne({"id": oLayer.id}, {"$setOnInsert": self.getUpsertDocument(oLayer)}, upsert=True) for oLayer in aoLayers]
+
+    def markChunkUpserted(self, aoCounts, aoLayers):
+        """
+        Marks clean the layers of a chunk that have been inserted. The ones already registered are left as they are, as in upsertLayer
+        :param aoCounts: the counts returned by bulkWrite
+        :param aoLayers: the layers of the chunk
+        :return:
+        """
+        for aoUpserted in aoCounts.get("upserted", []):
+            aoLayers[aoUpserted["index"]].markClean()
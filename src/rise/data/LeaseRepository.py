@@ -0,0 +1,113 @@
+import logging
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from src.rise.business.Lease import Lease
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+
+
+class LeaseRepository(RiseMongoRepository):
+    # True when the unique index on the lease id has been checked by this process
+    s_bIndexReady = False
+
+    def __init__(self):
+        super().__init__()
+        self.m_sCollectionName = "leases"
+        self.m_sEntityClassName = f"{Lease.__module__}.{Lease.__qualname__}"
+        # The claims rely on the unique lease id
+        self.m_aoIndexes = [{"keys": [("id", 1)], "unique": True}]
+
+    def ensureIndex(self, oCollection):
+        """
+        The claims rely on a unique index on the lease id: without it two instances could insert the same lease
+        :param oCollection: the leases collection
+        :return:
+        """
+        if LeaseRepository.s_bIndexReady:
+            return
+
+        oCollection.create_index("id", unique=True)
+        LeaseRepository.s_bIndexReady = True
+
+    def tryAcquire(self, sLeaseId, sOwner, fLeaseSeconds):
+        """
+        Atomically claims a lease. The lease is obtained if it does not exist, if it is already
+        of the same owner or if the previous owner did not renew it in time
+        :param sLeaseId: id of the lease (i.e. "task:<taskId>")
+        :param sOwner: id of the deamon instance
+        :param fLeaseSeconds: validity of the lease in seconds
+        :return: True if the lease now belongs to sOwner, False otherwise
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LeaseRepository.tryAcquire. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            self.ensureIndex(oCollection)
+
+            fNow = datetime.now().timestamp()
+            oQuery = {"id": sLeaseId, "$or": [{"owner": sOwner}, {"expiresAt": {"$lt": fNow}}]}
+            oUpdate = {"$set": {"id": sLeaseId, "owner": sOwner, "heartbeatAt": fNow, "expiresAt": fNow + fLeaseSeconds}}
+
+            # If the lease is held by another valid owner the query does not match and the upsert hits the unique index
+            oCollection.find_one_and_update(oQuery, oUpdate, upsert=True)
+            return True
+
+        except DuplicateKeyError:
+            return False
+        except Exception as oEx:
+            logging.error(f"LeaseRepository.tryAcquire. Exception {oEx}")
+
+        return False
+
+    def renew(self, asLeaseIds, sOwner, fLeaseSeconds):
+        """
+        Heartbeat: extends the validity of the leases still held by sOwner
+        :param asLeaseIds: ids of the leases
+        :param sOwner: id of the deamon instance
+        :param fLeaseSeconds: validity of the leases in seconds, from now
+        :return: number of leases renewed
+        """
+        if asLeaseIds is None or len(asLeaseIds) == 0:
+            return 0
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LeaseRepository.renew. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return 0
+
+            fNow = datetime.now().timestamp()
+            oResult = oCollection.update_many({"id": {"$in": list(asLeaseIds)}, "owner": sOwner}, {"$set": {"heartbeatAt": fNow, "expiresAt": fNow + fLeaseSeconds}})
+            return oResult.matched_count
+
+        except Exception as oEx:
+            logging.error(f"LeaseRepository.renew. Exception {oEx}")
+
+        return 0
+
+    def release(self, sLeaseId, sOwner):
+        """
+        Releases a lease, only if it still belongs to sOwner
+        :param sLeaseId: id of the lease
+        :param sOwner: id of the deamon instance
+        :return: True if the lease has been deleted
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"LeaseRepository.release. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oResult = oCollection.delete_one({"id": sLeaseId, "owner": sOwner})
+            return oResult.deleted_count > 0
+
+        except Exception as oEx:
+            logging.error(f"LeaseRepository.release. Exception {oEx}")
+
+        return False
@@ -10,28 +10,34 @@ class MapRepository(RiseMongoRepository):
         super().__init__()
         self.m_sCollectionName = "maps"
         self.m_sEntityClassName = f"{Map.__module__}.{Map.__qualname__}"
+        # Few documents that change rarely, read by every plugin engine
+        self.m_bReferenceCache = True
+        self.m_bIdentityMap = True
 
-    def findAllMapsById(self, asMapIdsList):
+    def findAllMapsById(self, asMapIdsList, aoProjection=None):
         try:
             if asMapIdsList is None or len(asMapIdsList) == 0:
                 logging.warning("MapRepository.findAllMapsById. No map ids specified")
                 return None
 
+            aoCachedMaps = self.getCachedEntities({"id": {"$in": asMapIdsList}})
+
+            if aoCachedMaps is not None:
+                return aoCachedMaps
+
             oCollection = self.getCollection()
 
             if oCollection is None:
                 logging.warning(f"MapRepository.findAllMapsById. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find({"id": {"$in": asMapIdsList}})
+            oRetrievedResult = oCollection.find({"id": {"$in": asMapIdsList}}, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"MapRepository.findAllMapsById. no results retrieved from db")
                 return None
 
-            aoRetrievedMaps = []
-            for oResMap in oRetrievedResult:
-                aoRetrievedMaps.append(Map(**oResMap))
+            aoRetrievedMaps = self.hydrateEntities(oRetrievedResult)
 
             logging.info(f"MapRepository.findAllMapsById. retrieved {len(aoRetrievedMaps)} maps")
             return aoRetrievedMaps
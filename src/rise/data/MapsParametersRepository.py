@@ -7,4 +7,10 @@ class MapsParametersRepository(RiseMongoRepository):
     def __init__(self):
         super().__init__()
         self.m_sCollectionName = "maps_parameters"
-        self.m_sEntityClassName = f"{MapsParameter.__module__}.{MapsParameter.__qualname__}"
\ No newline at end of file
+        self.m_sEntityClassName = f"{MapsParameter.__module__}.{MapsParameter.__qualname__}"
+        # Few documents that change rarely, read by every plugin engine
+        self.m_bReferenceCache = True
+        self.m_aoIndexes.extend([
+            # custom parameters of a map in an area
+            {"keys": [("areaId", 1), ("mapId", 1)]}
+        ])
@@ -1,7 +1,14 @@
+import importlib.util
 import logging
 
 from pymongo import MongoClient
 
+try:
+    # Native asyncio client of pymongo (4.9 and later)
+    from pymongo import AsyncMongoClient
+except ImportError:
+    AsyncMongoClient = None
+
 
 class MongoDBClient:
     """
@@ -10,18 +17,61 @@ class MongoDBClient:
 
     _s_oConfig = None
     _s_oInstance = None
+    # Client of the async repositories, created at the first use
+    _s_oAsyncClient = None
+
+    # Options of the mongoMain config passed as they are to MongoClient: config key -> (MongoClient option, type)
+    s_aoCLIENT_OPTIONS = {
+        "maxPoolSize": ("maxPoolSize", int),
+        "minPoolSize": ("minPoolSize", int),
+        "maxIdleTimeMS": ("maxIdleTimeMS", int),
+        "waitQueueTimeoutMS": ("waitQueueTimeoutMS", int),
+        "connectTimeoutMS": ("connectTimeoutMS", int),
+        "socketTimeoutMS": ("socketTimeoutMS", int),
+        "serverSelectionTimeoutMS": ("serverSelectionTimeoutMS", int),
+        "readPreference": ("readPreference", str),
+        "retryReads": ("retryReads", bool),
+        "retryWrites": ("retryWrites", bool),
+        "appName": ("appname", str)
+    }
+
+    # Compressors supported by pymongo and the python module each one needs (None: always available)
+    s_asCOMPRESSOR_MODULES = {
+        "zstd": "zstandard",
+        "snappy": "snappy",
+        "zlib": None
+    }
 
     def __new__(cls):
         if cls._s_oInstance is None:
             cls._s_oInstance = super(MongoDBClient, cls).__new__(cls)
             sConnectionString = cls._getConnectionString()
             try:
-                cls._s_oInstance.client = MongoClient(sConnectionString)
+                cls._s_oInstance.client = MongoClient(sConnectionString, **cls._getClientOptions())
             except Exception as oEx:
                 logging.error("MongoDBClient.__new__: exception " + str(oEx))
 
         return cls._s_oInstance
 
+    @classmethod
+    def getAsyncClient(cls):
+        """
+        Get the asyncio Mongo client of the async repositories, with the same connection string and options
+        of the sync one. The client is bound to the event loop that uses it first
+        :return: the AsyncMongoClient, None if the installed pymongo does not support asyncio or the creation failed
+        """
+        if cls._s_oAsyncClient is None:
+            if AsyncMongoClient is None:
+                logging.error("MongoDBClient.getAsyncClient: the installed pymongo has no AsyncMongoClient, pymongo 4.9 or later is needed")
+                return None
+
+            try:
+                cls._s_oAsyncClient = AsyncMongoClient(cls._getConnectionString(), **cls._getClientOptions())
+            except Exception as oEx:
+                logging.error("MongoDBClient.getAsyncClient: exception " + str(oEx))
+
+        return cls._s_oAsyncClient
+
 
     @staticmethod
     def _getConnectionString():
@@ -31,10 +81,93 @@ class MongoDBClient:
             sConnectionString = sConnectionString + "/?authSource=" + MongoDBClient._s_oConfig.mongoMain.dbName
 
             if getattr(MongoDBClient._s_oConfig.mongoMain, 'directConnection', False) == True:
-                sConnectionString = sConnectionString + "&directConnection=true&serverSelectionTimeoutMS=5000"
+                sConnectionString = sConnectionString + "&directConnection=true"
+
+                if getattr(MongoDBClient._s_oConfig.mongoMain, 'serverSelectionTimeoutMS', None) is None:
+                    sConnectionString = sConnectionString + "&serverSelectionTimeoutMS=5000"
 
             return sConnectionString
 
         return "mongodb://localhost:27017"
 
+    @staticmethod
+    def _getClientOptions():
+        """
+        Get the options of the Mongo client from the mongoMain section of the config:
+        pool size, timeouts, read preference, retryable reads and writes and wire compression
+        :return: dictionary of the MongoClient keyword arguments. Empty if nothing is configured
+        """
+        aoOptions = {}
+
+        if MongoDBClient._s_oConfig is None:
+            return aoOptions
+
+        oMongoConfig = getattr(MongoDBClient._s_oConfig, "mongoMain", None)
+
+        if oMongoConfig is None:
+            return aoOptions
+
+        for sKey, aoOption in MongoDBClient.s_aoCLIENT_OPTIONS.items():
+            oValue = getattr(oMongoConfig, sKey, None)
+
+            if oValue is None:
+                continue
+
+            sOption, oType = aoOption
+
+            try:
+                if oType is bool and isinstance(oValue, str):
+                    aoOptions[sOption] = oValue.lower() == "true"
+                else:
+                    aoOptions[sOption] = oType(oValue)
+            except Exception as oEx:
+                logging.warning("MongoDBClient._getClientOptions: invalid value " + str(oValue) + " for " + sKey + ", ignored: " + str(oEx))
+
+        asCompressors = MongoDBClient._getCompressors(getattr(oMongoConfig, "compressors", None))
+
+        if len(asCompressors) > 0:
+            aoOptions["compressors"] = ",".join(asCompressors)
+
+            iZlibLevel = getattr(oMongoConfig, "zlibCompressionLevel", None)
+            if iZlibLevel is not None and "zlib" in asCompressors:
+                aoOptions["zlibCompressionLevel"] = int(iZlibLevel)
+
+        logging.debug("MongoDBClient._getClientOptions: " + str(aoOptions))
+
+        return aoOptions
+
+    @staticmethod
+    def _getCompressors(oCompressors):
+        """
+        Filters the configured compressors: the unknown ones and the ones whose python module is not installed are skipped.
+        The order is kept: it is the order of preference sent to the server
+        :param oCompressors: list of compressors or comma separated string (i.e. "zstd,snappy,zlib")
+        :return: list of the usable compressors
+        """
+        if not oCompressors:
+            return []
+
+        if isinstance(oCompressors, str):
+            asRequested = [sCompressor.strip() for sCompressor in oCompressors.split(",")]
+        else:
+            asRequested = [str(sCompressor).strip() for sCompressor in oCompressors]
+
+        asCompressors = []
+
+        for sCompressor in asRequested:
+            if sCompressor == "" or sCompressor in asCompressors:
+                continue
+
+            if sCompressor not in MongoDBClient.s_asCOMPRESSOR_MODULES:
+                logging.warning("MongoDBClient._getCompressors: unknown compressor " + sCompressor + ", skipped")
+                continue
+
+            sModule = MongoDBClient.s_asCOMPRESSOR_MODULES[sCompressor]
+
+            if sModule is not None and importlib.util.find_spec(sModule) is None:
+                logging.warning("MongoDBClient._getCompressors: compressor " + sCompressor + " needs the " + sModule + " package, skipped")
+                continue
+
+            asCompressors.append(sCompressor)
 
+        return asCompressors
@@ -10,29 +10,34 @@ class PluginRepository(RiseMongoRepository):
         super().__init__()
         self.m_sCollectionName = "plugins"
         self.m_sEntityClassName = f"{Plugin.__module__}.{Plugin.__qualname__}"
+        # Few documents that change rarely, read by every plugin engine
+        self.m_bReferenceCache = True
         
     
-    def findPluginById(self, sPluginId):
+    def findPluginById(self, sPluginId, aoProjection=None):
         try:
             if sPluginId is None:
                 logging.warning("PluginRepository.findPluginById. No plugin id specified")
                 return None
 
+            aoCachedPlugins = self.getCachedEntities({"id": sPluginId})
+
+            if aoCachedPlugins is not None:
+                return aoCachedPlugins[0] if len(aoCachedPlugins) > 0 else None
+
             oCollection = self.getCollection()
 
             if oCollection is None:
                 logging.warning(f"PluginRepository.findPluginById. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find({"id": sPluginId})
+            oRetrievedResult = oCollection.find({"id": sPluginId}, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"PluginRepository.findPluginById. no results retrieved from db")
                 return None
 
-            aoRetrievedPlugins = []
-            for oResPlugin in oRetrievedResult:
-                aoRetrievedPlugins.append(Plugin(**oResPlugin))
+            aoRetrievedPlugins = self.hydrateEntities(oRetrievedResult)
 
             if len(aoRetrievedPlugins) > 0:
                 return aoRetrievedPlugins[0]
@@ -44,23 +49,26 @@ class PluginRepository(RiseMongoRepository):
 
         return None
 
-    def listAllPlugins(self):
+    def listAllPlugins(self, aoProjection=None):
         try:
+            aoCachedPlugins = self.getCachedEntities({})
+
+            if aoCachedPlugins is not None:
+                return aoCachedPlugins
+
             oCollection = self.getCollection()
 
             if oCollection is None:
                 logging.warning(f"PluginRepository.listAllPlugins. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find({})
+            oRetrievedResult = oCollection.find({}, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"PluginRepository.listAllPlugins. No results retrieved from db")
                 return None
 
-            aoRetrievedPlugins = []
-            for oResPlugin in oRetrievedResult:
-                aoRetrievedPlugins.append(Plugin(**oResPlugin))
+            aoRetrievedPlugins = self.hydrateEntities(oRetrievedResult)
 
             logging.info(f"PluginRepository.listAllPlugins. found {len(aoRetrievedPlugins)} plugins")
             return aoRetrievedPlugins
@@ -0,0 +1,123 @@
+import logging
+from datetime import datetime
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from src.rise.business.PublishJob import PublishJob
+from src.rise.data.RiseMongoRepository import RiseMongoRepository
+
+
+class PublishJobRepository(RiseMongoRepository):
+
+    def __init__(self):
+        super().__init__()
+        self.m_sCollectionName = "publish_jobs"
+        self.m_sEntityClassName = f"{PublishJob.__module__}.{PublishJob.__qualname__}"
+        self.m_aoIndexes.extend([
+            # One job for each task, also when two instances queue it at the same time
+            {"keys": [("id", 1)], "unique": True},
+            # claimNext and countClaimable
+            {"keys": [("status", 1), ("createdAt", 1)]},
+            {"keys": [("status", 1), ("startedAt", 1)]}
+        ])
+
+    def enqueue(self, sTaskId):
+        """
+        Adds the publish job of a task, if it is not already in the queue
+        :param sTaskId: id of the WASDI task to handle
+        :return: True if the job is in the queue
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"PublishJobRepository.enqueue. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oCollection.update_one({"id": sTaskId},
+                                   {"$setOnInsert": {"id": sTaskId, "taskId": sTaskId, "status": "PENDING", "owner": "", "createdAt": datetime.now().timestamp(), "startedAt": 0.0}},
+                                   upsert=True)
+            return True
+
+        except DuplicateKeyError:
+            # Another instance queued the same task between the match and the insert of our upsert
+            return True
+        except Exception as oEx:
+            logging.error(f"PublishJobRepository.enqueue. Exception {oEx}")
+
+        return False
+
+    def claimNext(self, sOwner, fTimeoutSeconds):
+        """
+        Atomically takes the oldest job to run. A job taken by a worker that did not complete it
+        in fTimeoutSeconds is considered abandoned and can be taken again
+        :param sOwner: id of the worker
+        :param fTimeoutSeconds: timeout of a running job
+        :return: the PublishJob claimed or None if the queue is empty
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"PublishJobRepository.claimNext. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            fNow = datetime.now().timestamp()
+            oQuery = {"$or": [{"status": "PENDING"}, {"status": "RUNNING", "startedAt": {"$lt": fNow - fTimeoutSeconds}}]}
+            oUpdate = {"$set": {"status": "RUNNING", "owner": sOwner, "startedAt": fNow}}
+
+            oResult = oCollection.find_one_and_update(oQuery, oUpdate, sort=[("createdAt", 1)], return_document=ReturnDocument.AFTER)
+
+            if oResult is None:
+                return None
+
+            return self.hydrateEntity(oResult)
+
+        except Exception as oEx:
+            logging.error(f"PublishJobRepository.claimNext. Exception {oEx}")
+
+        return None
+
+    def complete(self, sJobId, sOwner):
+        """
+        Removes a job from the queue, if it still belongs to the worker
+        :param sJobId: id of the job
+        :param sOwner: id of the worker
+        :return: True if the job has been removed
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"PublishJobRepository.complete. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            oResult = oCollection.delete_one({"id": sJobId, "owner": sOwner})
+            return oResult.deleted_count > 0
+
+        except Exception as oEx:
+            logging.error(f"PublishJobRepository.complete. Exception {oEx}")
+
+        return False
+
+    def countClaimable(self, fTimeoutSeconds):
+        """
+        Number of jobs that a worker can take now: the pending ones and the abandoned ones
+        :param fTimeoutSeconds: timeout of a running job
+        :return: number of jobs
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"PublishJobRepository.countClaimable. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return 0
+
+            fNow = datetime.now().timestamp()
+            return oCollection.count_documents({"$or": [{"status": "PENDING"}, {"status": "RUNNING", "startedAt": {"$lt": fNow - fTimeoutSeconds}}]})
+
+        except Exception as oEx:
+            logging.error(f"PublishJobRepository.countClaimable. Exception {oEx}")
+
+        return 0
@@ -1,22 +1,47 @@
 import logging
 
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from src.rise.business.RiseEntity import RiseEntity
 from src.rise.data.MongoDBClient import MongoDBClient
+from src.rise.data.RiseSession import RiseSession
+from src.rise.utils import QueryExplainer
+from src.rise.utils import ReferenceCache
 from src.rise.utils import RiseUtils
+from src.rise.utils import TrafficRecorder
 
 
 class RiseMongoRepository:
     # name of the database connected to this repository
     s_sDB_NAME = "rise"
+    # Entity classes already resolved, by class name
+    s_aoEntityClasses = {}
+    # default max number of operations of a single bulk write
+    s_iBULK_CHUNK_SIZE = 1000
+    # default number of documents read from Mongo with each batch of a cursor
+    s_iITER_BATCH_SIZE = 500
 
     def __init__(self):
         self.m_sCollectionName = None
         self.m_sEntityClassName = None
+        # Indexes needed by the queries of the repository: list of dictionaries with the "keys",
+        # as a list of (field, direction) tuples, and optionally "unique". See ensureIndexes
+        self.m_aoIndexes = [{"keys": [("id", 1)]}]
+        # True for the small collections that change rarely: they are read through the ReferenceCache
+        self.m_bReferenceCache = False
+        # True for the entities read many times in the same run: getEntityById gives back the instance of the RiseSession
+        self.m_bIdentityMap = False
 
     def getCollection(self):
         """
         Retrieves from the database a collection
         :return: the collection if present, None otherwise
         """
+        # Replaying a recorded run: no need of the database
+        if TrafficRecorder.isReplaying():
+            return TrafficRecorder.wrap(None, "mongo." + self.m_sCollectionName)
+
         oCollection = None
         try:
             oMongoClient = MongoDBClient()
@@ -30,15 +55,172 @@ class RiseMongoRepository:
         except Exception as oEx:
             logging.error(f"RiseMongoRepository.getCollection. Exception retrieving the collection {oEx}")
 
-        return oCollection
+        if oCollection is None:
+            return None
+
+        oCollection = QueryExplainer.wrap(oCollection, self.m_sCollectionName)
+
+        return TrafficRecorder.wrap(oCollection, "mongo." + self.m_sCollectionName)
+
+    def ensureIndexes(self):
+        """
+        Creates, if they do not exist yet, the indexes declared in m_aoIndexes
+        :return: the number of indexes ensured
+        """
+        iEnsured = 0
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"RiseMongoRepository.ensureIndexes. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return iEnsured
+
+        for aoIndex in self.m_aoIndexes:
+            try:
+                oCollection.create_index(aoIndex["keys"], unique=aoIndex.get("unique", False))
+                iEnsured += 1
+            except Exception as oEx:
+                # i.e. an index with the same keys but different options already exists
+                logging.warning(f"RiseMongoRepository.ensureIndexes. Index {aoIndex['keys']} not created on {self.m_sCollectionName}: {oEx}")
+
+        return iEnsured
+
+
+    def getEntityClass(self):
+        """
+        Get the class of the entities of this repository, resolved only once per process
+        :return: the entity class
+        """
+        oEntityClass = RiseMongoRepository.s_aoEntityClasses.get(self.m_sEntityClassName)
+
+        if oEntityClass is None:
+            oEntityClass = RiseUtils.getClass(self.m_sEntityClassName)
+            RiseMongoRepository.s_aoEntityClasses[self.m_sEntityClassName] = oEntityClass
 
+        return oEntityClass
+
+    def hydrateEntity(self, aoDocument):
+        """
+        Creates the entity of a document read from the db.
+        It gives the same result of EntityClass(**aoDocument), but without resolving the class
+        and calling setattr for each field
+        :param aoDocument: the document
+        :return: the entity
+        """
+        return self.getEntityClass().fromDocument(aoDocument)
+
+    def hydrateEntities(self, aoDocuments):
+        """
+        Creates the entities of a list (or a cursor) of documents
+        :param aoDocuments: the documents
+        :return: the list of entities
+        """
+        return self.getEntityClass().fromDocuments(aoDocuments)
+
+    def getCachedEntities(self, aoFilter):
+        """
+        Get the entities matching a filter from the ReferenceCache, if the repository uses it.
+        The cached entities have all the fields: the projections are not applied
+        :param aoFilter: the Mongo filter
+        :return: the list of entities, None if the query must go to the db
+        """
+        if not self.m_bReferenceCache or not ReferenceCache.isEnabled():
+            return None
+
+        # The recorded traffic must contain the same queries in record and replay
+        if TrafficRecorder.isRecording() or TrafficRecorder.isReplaying():
+            return None
+
+        aoDocuments = ReferenceCache.getDocuments(self.m_sCollectionName, self.loadAllDocuments)
+
+        if aoDocuments is None:
+            return None
+
+        aoMatching = ReferenceCache.filterDocuments(aoDocuments, aoFilter)
+
+        if aoMatching is None:
+            return None
+
+        # The cached documents are shared: each entity has its own copy
+        return self.hydrateEntities([RiseEntity.copyValue(aoDocument) for aoDocument in aoMatching])
+
+    def loadAllDocuments(self):
+        """
+        Reads all the documents of the collection, to fill the ReferenceCache
+        :return: the list of documents, None in case of error
+        """
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"RiseMongoRepository.loadAllDocuments. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return None
+
+            return list(oCollection.find({}))
+        except Exception as oEx:
+            logging.error(f"RiseMongoRepository.loadAllDocuments. Exception {oEx}")
+
+        return None
 
-    def getEntityById(self, sEntityId):
+    def discardFromSession(self, asEntityIds):
+        """
+        Removes the deleted entities from the RiseSession
+        :param asEntityIds: ids of the entities
+        :return:
+        """
+        oSession = RiseSession.getCurrent()
+
+        if oSession is None:
+            return
+
+        for sEntityId in asEntityIds:
+            oSession.discard(self.m_sCollectionName, sEntityId)
+
+    def invalidateCache(self):
+        """
+        Removes the collection from the ReferenceCache, after a write
+        :return:
+        """
+        if self.m_bReferenceCache:
+            ReferenceCache.invalidate(self.m_sCollectionName)
+
+    def getEntityById(self, sEntityId, aoProjection=None):
         """
         Given the id of an entity, retrieves it from the database
         :param sEntityId: the id of the entity (not the Mongo _id, but the RISE internal id of the entity)
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
         :return: the entity with the required id, None otherwise
         """
+        oSession = RiseSession.getCurrent() if self.m_bIdentityMap else None
+
+        if oSession is not None:
+            oEntity = oSession.get(self.m_sCollectionName, sEntityId)
+
+            if oEntity is not None:
+                return oEntity
+
+            oEntity = self.readEntityById(sEntityId, aoProjection)
+
+            # The partial entities are not shared
+            if aoProjection is None:
+                oSession.put(self.m_sCollectionName, oEntity)
+
+            return oEntity
+
+        return self.readEntityById(sEntityId, aoProjection)
+
+    def readEntityById(self, sEntityId, aoProjection=None):
+        """
+        Reads an entity from the database (or the ReferenceCache), without looking in the RiseSession
+        :param sEntityId: the id of the entity (not the Mongo _id, but the RISE internal id of the entity)
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
+        :return: the entity with the required id, None otherwise
+        """
+        aoCachedEntities = self.getCachedEntities({"id": sEntityId})
+
+        if aoCachedEntities is not None:
+            return aoCachedEntities[0] if len(aoCachedEntities) > 0 else None
+
         try:
             oCollection = self.getCollection()
 
@@ -46,16 +228,13 @@ class RiseMongoRepository:
                 logging.warning(f"RiseMongoRepository.findEntityById. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find({"id": sEntityId})
+            oRetrievedResult = oCollection.find({"id": sEntityId}, aoProjection).limit(1)
 
             if oRetrievedResult is None:
                 logging.info(f"RiseMongoRepository.findEntityById. No results retrieved from db")
                 return None
 
-            aoRetrievedEntities = []
-            for oResEntity in oRetrievedResult:
-                oEntityClass = RiseUtils.getClass(self.m_sEntityClassName)
-                aoRetrievedEntities.append(oEntityClass(**oResEntity))
+            aoRetrievedEntities = self.hydrateEntities(oRetrievedResult)
 
             if len(aoRetrievedEntities) > 0:
                 return aoRetrievedEntities[0]
@@ -66,11 +245,17 @@ class RiseMongoRepository:
 
         return None
 
-    def listAllEntities(self):
+    def listAllEntities(self, aoProjection=None):
         """
         List all the entities in a collection
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
         :return: the full list of entities in a collection
         """
+        aoCachedEntities = self.getCachedEntities({})
+
+        if aoCachedEntities is not None:
+            return aoCachedEntities
+
         oCollection = self.getCollection()
 
         if oCollection is None:
@@ -78,16 +263,13 @@ class RiseMongoRepository:
             return None
 
         try:
-            oRetrievedResult = oCollection.find({})
+            oRetrievedResult = oCollection.find({}, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"RiseMongoRepository.listAllEntities. No results retrieved from db")
                 return None
 
-            aoRetrievedEntities = []
-            for oResEntity in oRetrievedResult:
-                oEntityClass = RiseUtils.getClass(self.m_sEntityClassName)
-                aoRetrievedEntities.append(oEntityClass(**oResEntity))
+            aoRetrievedEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoRetrievedEntities
 
@@ -96,10 +278,11 @@ class RiseMongoRepository:
 
         return None
 
-    def getAllEntitiesById(self, asEntityIds):
+    def getAllEntitiesById(self, asEntityIds, aoProjection=None):
         """
         Given a list of entities' ids, retrieves from a collection the list of entities matching those ids
         :param asEntityIds: list of entities' ids to retrieve (not the Mongo _id, but the RISE internal id of the entity)
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
         :return: the list of entities matching the ids passed as parameters
         """
         try:
@@ -107,22 +290,24 @@ class RiseMongoRepository:
                 logging.warning("RiseMongoRepository.findAllEntitiesById. No ids specified")
                 return None
 
+            aoCachedEntities = self.getCachedEntities({"id": {"$in": asEntityIds}})
+
+            if aoCachedEntities is not None:
+                return aoCachedEntities
+
             oCollection = self.getCollection()
 
             if oCollection is None:
                 logging.warning(f"RiseMongoRepository.findAllEntitiesById. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find({"id": {"$in": asEntityIds}})
+            oRetrievedResult = oCollection.find({"id": {"$in": asEntityIds}}, aoProjection)
 
             if oRetrievedResult is None:
                 logging.debug(f"RiseMongoRepository.findAllEntitiesById. No results retrieved from db")
                 return None
 
-            aoRetrievedEntities = []
-            for oResMap in oRetrievedResult:
-                oEntityClass = RiseUtils.getClass(self.m_sEntityClassName)
-                aoRetrievedEntities.append(oEntityClass(**oResMap))
+            aoRetrievedEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoRetrievedEntities
 
@@ -131,16 +316,22 @@ class RiseMongoRepository:
 
         return None
 
-    def getEntitiesByField(self, aoAttributeMap):
+    def getEntitiesByField(self, aoAttributeMap, aoProjection=None):
         """
         Given a dictionary, returns the list of the entities matching all the key-value pairs in the dictionary
         :param aoAttributeMap: a dictionary of all the key-value pairs that the retrieved entities should match
+        :param aoProjection: optional Mongo projection. The fields not projected keep their default values
         :return: the list of entities matching the ket-value pairs in the dictionary
         """
 
         if aoAttributeMap is None or aoAttributeMap.items() == 0:
             return None
 
+        aoCachedEntities = self.getCachedEntities(aoAttributeMap)
+
+        if aoCachedEntities is not None:
+            return aoCachedEntities
+
         try:
             oCollection = self.getCollection()
 
@@ -148,16 +339,13 @@ class RiseMongoRepository:
                 logging.warning(f"RiseMongoRepository.getEntitiesByField. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find(aoAttributeMap)
+            oRetrievedResult = oCollection.find(aoAttributeMap, aoProjection)
 
             if oRetrievedResult is None:
                 logging.info(f"RiseMongoRepository.findEntityById. No results retrieved from db")
                 return None
 
-            aoRetrievedEntities = []
-            for oResEntity in oRetrievedResult:
-                oEntityClass = RiseUtils.getClass(self.m_sEntityClassName)
-                aoRetrievedEntities.append(oEntityClass(**oResEntity))
+            aoRetrievedEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoRetrievedEntities
 
@@ -166,6 +354,106 @@ class RiseMongoRepository:
 
         return None
 
+    def exists(self, aoFilter):
+        """
+        Check if at least one document matches a filter, without reading the documents
+        :param aoFilter: the Mongo filter
+        :return: True if there is at least a document matching the filter, False otherwise
+        """
+        if aoFilter is None:
+            return False
+
+        aoCachedEntities = self.getCachedEntities(aoFilter)
+
+        if aoCachedEntities is not None:
+            return len(aoCachedEntities) > 0
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"RiseMongoRepository.exists. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return False
+
+            # Only the _id of the first match comes back from the server
+            return oCollection.find_one(aoFilter, {"_id": 1}) is not None
+
+        except Exception as oEx:
+            logging.error(f"RiseMongoRepository.exists. Exception {oEx}")
+
+        return False
+
+    def count(self, aoFilter, iLimit=0):
+        """
+        Counts the documents matching a filter, without reading them
+        :param aoFilter: the Mongo filter. {} for all the documents
+        :param iLimit: if greater than 0, the count stops at this number: count(filter, 2) > 1 checks if there are more matches
+        :return: the number of documents matching the filter, up to iLimit. 0 in case of error
+        """
+        if aoFilter is None:
+            return 0
+
+        aoCachedEntities = self.getCachedEntities(aoFilter)
+
+        if aoCachedEntities is not None:
+            return min(len(aoCachedEntities), iLimit) if iLimit > 0 else len(aoCachedEntities)
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"RiseMongoRepository.count. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return 0
+
+            if iLimit > 0:
+                return oCollection.count_documents(aoFilter, limit=iLimit)
+
+            return oCollection.count_documents(aoFilter)
+
+        except Exception as oEx:
+            logging.error(f"RiseMongoRepository.count. Exception {oEx}")
+
+        return 0
+
+    def iterEntitiesByField(self, aoAttributeMap, iBatchSize=None, aoProjection=None, aoSort=None):
+        """
+        Streams the entities matching all the key-value pairs in the dictionary: the documents are read
+        from Mongo in batches and each entity is created only when the caller asks for it.
+        With a projection the entities have only the projected fields (and the default values for the others)
+        :param aoAttributeMap: a dictionary of all the key-value pairs that the retrieved entities should match. {} for all
+        :param iBatchSize: number of documents of each batch. None to use the default one
+        :param aoProjection: optional Mongo projection, i.e. {"_id": 0, "id": 1, "layerId": 1}
+        :param aoSort: optional list of (field, direction) tuples
+        :return: generator of entities
+        """
+        if aoAttributeMap is None:
+            return
+
+        if iBatchSize is None or iBatchSize < 1:
+            iBatchSize = RiseMongoRepository.s_iITER_BATCH_SIZE
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"RiseMongoRepository.iterEntitiesByField. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return
+
+        oEntityClass = self.getEntityClass()
+
+        try:
+            oCursor = oCollection.find(aoAttributeMap, aoProjection)
+
+            if aoSort:
+                oCursor = oCursor.sort(aoSort)
+
+            oCursor = oCursor.batch_size(iBatchSize)
+
+            for aoDocument in oCursor:
+                yield oEntityClass.fromDocument(aoDocument)
+
+        except Exception as oEx:
+            logging.error(f"RiseMongoRepository.iterEntitiesByField. Exception {oEx}")
+
     def addEntity(self, oEntity):
         """
         Insert an entity in a collection
@@ -179,7 +467,12 @@ class RiseMongoRepository:
                 logging.warning(f"RiseMongoRepository.addEntity. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return False
 
-            oCollection.insert_one(vars(oEntity))
+            aoDocument = oEntity.toDocument()
+            oCollection.insert_one(aoDocument)
+            self.invalidateCache()
+            # The driver adds the _id to the document
+            oEntity._id = aoDocument["_id"]
+            oEntity.markClean()
 
             return True
         except Exception as oEx:
@@ -193,18 +486,18 @@ class RiseMongoRepository:
         :param oEntity: the entity to update
         :return: True if the update was successful, False otherwise
         """
-        if oEntity is None or 'id' not in vars(oEntity):
+        if oEntity is None or not hasattr(oEntity, 'id'):
             logging.warning("RiseMongoRepository.updateEntity. The provided entity is None or is missing the 'id' filed")
             return False
 
         oQuery = {"id": oEntity.id}
-        oUpdatedDocument = {"$set": vars(oEntity)}
+        aoSet = self.getFieldsToUpdate(oEntity)
 
-        try:
-            if "_id" in oUpdatedDocument["$set"]:
-                del oUpdatedDocument["$set"]["_id"]
-        except Exception as oEx:
-            logging.error(f"RiseMongoRepository.updateEntity. Exception removing _id from updated document: {oEx}")
+        if len(aoSet) == 0:
+            logging.debug(f"RiseMongoRepository.updateEntity. Entity {oEntity.id} not changed, nothing to update")
+            return True
+
+        oUpdatedDocument = {"$set": aoSet}
 
         try:
             oCollection = self.getCollection()
@@ -214,8 +507,10 @@ class RiseMongoRepository:
                 return False
 
             oResult = oCollection.update_one(oQuery, oUpdatedDocument)
+            self.invalidateCache()
 
             if oResult.modified_count > 0:
+                oEntity.markClean()
                 return True
 
             logging.warning("RiseMongoRepository.updateEntity. No document updated in the database")
@@ -226,55 +521,227 @@ class RiseMongoRepository:
         return False
 
 
+    def updateEntityLater(self, oEntity):
+        """
+        Updates an entity at the end of the RiseSession, with the other pending updates of the collection.
+        Without a session the entity is updated now
+        :param oEntity: the entity to update
+        :return: True if the update was registered (or done), False otherwise
+        """
+        if oEntity is None or not hasattr(oEntity, 'id'):
+            logging.warning("RiseMongoRepository.updateEntityLater. The provided entity is None or is missing the 'id' filed")
+            return False
+
+        oSession = RiseSession.getCurrent()
+
+        if oSession is None:
+            return self.updateEntity(oEntity)
+
+        oSession.addPendingUpdate(self, oEntity)
+
+        return True
+
+    def getFieldsToUpdate(self, oEntity):
+        """
+        Get the fields of an entity to $set in the db: only the changed ones if the entity
+        has been read from (or saved to) the db, all of them otherwise. The _id is never updated
+        :param oEntity: the entity
+        :return: dictionary of the fields to set
+        """
+        aoSet = oEntity.getChangedFields()
+
+        if aoSet is None:
+            aoSet = oEntity.toDocument()
+
+        aoSet.pop("_id", None)
+
+        return aoSet
+
     def updateAllEntities(self, aoEntities):
         """
         Given a list of entities, updates them in the collection, based on their 'id' field
         :param aoEntities: the list of entities to update
         :return: the number of updated entities
         """
-        iUpdatedEntities = 0
-
         if aoEntities is None or len(aoEntities) < 1:
             logging.warning("RiseMongoRepository.updateAllEntities. The provided list of entities is None or empty")
-            return iUpdatedEntities
+            return 0
+
+        iMatched, iModified = self.bulkUpdate(aoEntities)
+
+        return iModified
 
+    def getBulkChunkSize(self):
+        """
+        Get the max number of operations sent to Mongo with a single bulk write.
+        It can be set in the mongoMain section of the config with the bulkChunkSize key
+        :return: the chunk size
+        """
         try:
-            oCollection = self.getCollection()
+            if MongoDBClient._s_oConfig is not None:
+                iChunkSize = int(getattr(MongoDBClient._s_oConfig.mongoMain, "bulkChunkSize", RiseMongoRepository.s_iBULK_CHUNK_SIZE))
+                if iChunkSize > 0:
+                    return iChunkSize
+        except Exception as oEx:
+            logging.warning(f"RiseMongoRepository.getBulkChunkSize. Exception reading the chunk size {oEx}")
 
-            if oCollection is None:
-                logging.warning(
-                    f"RiseMongoRepository.updateAllEntities. Collection {self.m_sCollectionName} not "
-                    f"found in {RiseMongoRepository.s_sDB_NAME} database")
-                return iUpdatedEntities
-
-            for oEntity in aoEntities:
-
-                try: 
-                    if not hasattr(oEntity, 'id'):
-                        logging.warning(f"RiseMongoRepository.updateAllEntities. Entity missing 'id' {oEntity}")
-                        continue
-                    oQuery = {"id": oEntity.id}
-                    oUpdatedDocument = {"$set": vars(oEntity)}
-
-                    try:
-                        if "_id" in oUpdatedDocument["$set"]:
-                            del oUpdatedDocument["$set"]["_id"]
-                    except Exception as oEx:
-                        logging.error(f"RiseMongoRepository.updateAllEntities. Exception removing _id from updated document: {oEx}")
-
-                    oResult = oCollection.update_many(oQuery, oUpdatedDocument)
-
-                    if oResult.modified_count > 0:
-                        iUpdatedEntities += 1
-                    else:
-                        logging.warning(f"RiseMongoRepository.updateAllEntities. Entity {oEntity.id} not updated")
-            
-                except Exception as oEx2:
-                    logging.error(f"RiseMongoRepository.updateAllEntities. Exception while processing one entity: {oEx2}")
+        return RiseMongoRepository.s_iBULK_CHUNK_SIZE
+
+    def bulkUpdate(self, aoEntities, iChunkSize=None):
+        """
+        Given a list of entities, updates them in the collection, based on their 'id' field,
+        with unordered bulk writes of (at most) iChunkSize operations
+        :param aoEntities: the list of entities to update
+        :param iChunkSize: max number of updates for each bulk write. None to use the configured one
+        :return: a tuple (number of matched entities, number of modified entities)
+        """
+        iMatched = 0
+        iModified = 0
+
+        if aoEntities is None or len(aoEntities) < 1:
+            return iMatched, iModified
+
+        oCollection = self.getCollection()
+
+        if oCollection is None:
+            logging.warning(f"RiseMongoRepository.bulkUpdate. Collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+            return iMatched, iModified
+
+        aoOperations, aoUpdatedEntities = self.getBulkUpdateOperations(aoEntities)
+
+        for aoChunk, aoChunkEntities in self.getEntityChunks(aoOperations, aoUpdatedEntities, iChunkSize):
+            aoCounts = self.bulkWrite(oCollection, aoChunk, "bulkUpdate")
+            iMatched += aoCounts.get("nMatched", 0)
+            iModified += aoCounts.get("nModified", 0)
+            self.markChunkWritten(aoCounts, "nMatched", aoChunkEntities)
+
+        self.logBulkResult("bulkUpdate", iMatched, len(aoOperations))
+
+        return iMatched, iModified
+
+    def getBulkUpdateOperations(self, aoEntities):
+        """
+        Get the operations of bulkUpdate: a $set of the changed fields for each entity
+        :param aoEntities: the list of entities to update
+        :return: a tuple (list of UpdateOne, list of the entities with an operation)
+        """
+        aoOperations = []
+        aoUpdatedEntities = []
+
+        for oEntity in aoEntities:
+            if not hasattr(oEntity, 'id'):
+                logging.warning(f"RiseMongoRepository.bulkUpdate. Entity missing 'id' {oEntity}")
+                continue
+
+            aoSet = self.getFieldsToUpdate(oEntity)
+
+            # Nothing changed: nothing to write
+            if len(aoSet) == 0:
+                continue
+
+            aoOperations.append(UpdateOne({"id": oEntity.id}, {"$set": aoSet}))
+            aoUpdatedEntities.append(oEntity)
+
+        return aoOperations, aoUpdatedEntities
+
+    def getChunks(self, aoOperations, iChunkSize=None):
+        """
+        Split a list of operations in chunks
+        :param aoOperations: list of operations
+        :param iChunkSize: size of the chunks. None to use the configured one
+        :return: generator of the chunks
+        """
+        if iChunkSize is None or iChunkSize < 1:
+            iChunkSize = self.getBulkChunkSize()
+
+        for iStart in range(0, len(aoOperations), iChunkSize):
+            yield aoOperations[iStart:iStart + iChunkSize]
+
+    def getEntityChunks(self, aoOperations, aoEntities, iChunkSize=None):
+        """
+        Split a list of operations, and the entities they write, in chunks
+        :param aoOperations: list of operations
+        :param aoEntities: the entity of each operation
+        :param iChunkSize: size of the chunks. None to use the configured one
+        :return: generator of tuples (operations, entities)
+        """
+        iChunkStart = 0
+
+        for aoChunk in self.getChunks(aoOperations, iChunkSize):
+            iChunkEnd = iChunkStart + len(aoChunk)
+            yield aoChunk, aoEntities[iChunkStart:iChunkEnd]
+            iChunkStart = iChunkEnd
+
+    def markChunkWritten(self, aoCounts, sCountKey, aoEntities):
+        """
+        Without errors, the entities of a chunk are now saved as they are: they are marked clean
+        :param aoCounts: the counts returned by bulkWrite
+        :param sCountKey: count that must be in the result of a write that succeeded (nMatched)
+        :param aoEntities: the entities of the chunk
+        :return:
+        """
+        if sCountKey not in aoCounts or len(aoCounts.get("writeErrors", [])) > 0:
+            return
+
+        for oEntity in aoEntities:
+            oEntity.markClean()
+
+    def logBulkResult(self, sCaller, iWritten, iOperations):
+        """
+        Logs the entities of a bulk write that have not been written
+        :param sCaller: name of the calling method
+        :param iWritten: number of entities matched or upserted
+        :param iOperations: number of operations
+        :return:
+        """
+        if iWritten < iOperations:
+            logging.warning(f"RiseMongoRepository.{sCaller}. {iOperations - iWritten} entities of {iOperations} not written in {self.m_sCollectionName}")
+
+    def bulkWrite(self, oCollection, aoOperations, sCaller):
+        """
+        Executes an unordered bulk write. With unordered writes, the operations after a failed one are
+        executed anyway: so in case of errors the counts are taken from the details of the exception
+        :param oCollection: the collection
+        :param aoOperations: the operations to execute
+        :param sCaller: name of the calling method, for the logs
+        :return: dictionary with the nInserted, nMatched, nModified, nUpserted counts and the upserted operations
+        """
+        try:
+            return self.getBulkWriteCounts(oCollection.bulk_write(aoOperations, ordered=False))
+        except BulkWriteError as oEx:
+            return self.getBulkWriteErrorCounts(oEx, aoOperations, sCaller)
         except Exception as oEx:
-            logging.error(f"RiseMongoRepository.updateAllEntities. Exception {oEx}")
+            logging.error(f"RiseMongoRepository.{sCaller}. Exception {oEx}")
 
-        return iUpdatedEntities
+        return {}
+
+    def getBulkWriteCounts(self, oResult):
+        """
+        Get the counts of a bulk write that succeeded
+        :param oResult: the BulkWriteResult
+        :return: dictionary with the nInserted, nMatched, nModified, nUpserted counts and the upserted operations
+        """
+        self.invalidateCache()
+        # upserted has the index in the bulk write and the _id of each upserted document, as in the details of BulkWriteError
+        return {"nInserted": oResult.inserted_count, "nMatched": oResult.matched_count, "nModified": oResult.modified_count,
+                "nUpserted": oResult.upserted_count, "upserted": oResult.bulk_api_result.get("upserted", [])}
+
+    def getBulkWriteErrorCounts(self, oEx, aoOperations, sCaller):
+        """
+        Get the counts of a bulk write with errors, from the details of the exception, and logs the errors
+        :param oEx: the BulkWriteError
+        :param aoOperations: the operations of the bulk write
+        :param sCaller: name of the calling method, for the logs
+        :return: the details of the exception, with the nInserted, nMatched, nModified, nUpserted counts, the upserted operations and the writeErrors
+        """
+        # The operations before and after the failed ones have been written
+        self.invalidateCache()
+        aoDetails = oEx.details
+        aoWriteErrors = aoDetails.get("writeErrors", [])
+        logging.error(f"RiseMongoRepository.{sCaller}. {len(aoWriteErrors)} operations failed of {len(aoOperations)} in {self.m_sCollectionName}")
+        if len(aoWriteErrors) > 0:
+            logging.error(f"RiseMongoRepository.{sCaller}. First error: {aoWriteErrors[0].get('errmsg')}")
+        return aoDetails
 
 
     def deleteEntity(self, sEntityId):
@@ -295,6 +762,8 @@ class RiseMongoRepository:
                 return False
 
             oResult = oCollection.delete_one({"id": sEntityId})
+            self.invalidateCache()
+            self.discardFromSession([sEntityId])
 
             if oResult.deleted_count > 0:
                 return True
@@ -325,6 +794,8 @@ class RiseMongoRepository:
                 return False
 
             oResult = oCollection.delete_many({"id": {"$in": asEntityIds}})
+            self.invalidateCache()
+            self.discardFromSession(asEntityIds)
 
             if oResult.deleted_count > 0:
                 return True
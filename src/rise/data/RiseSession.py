@@ -0,0 +1,147 @@
+import logging
+import threading
+
+
+class RiseSession:
+    """
+    Unit of work of one run (a phase of the deamon, or the run on an area).
+    The repositories with m_bIdentityMap give back the same instance of an entity each time it is read by id
+    in the session, and the updates registered with updateEntityLater are written in bulk when the session ends.
+    Each thread has its own session
+    """
+
+    _s_oLocal = threading.local()
+
+    def __init__(self):
+        # Entities read in this session, by (collection, id)
+        self.m_aoEntities = {}
+        # Entities to update at the end of the session, by collection: (repository, {id(entity): entity})
+        self.m_aoPendingUpdates = {}
+        # Number of begin not yet ended: only the outer end flushes the session
+        self.m_iDepth = 0
+        self.m_iHits = 0
+
+    @staticmethod
+    def begin():
+        """
+        Starts a session in this thread, or joins the one already started
+        :return: the session
+        """
+        oSession = RiseSession.getCurrent()
+
+        if oSession is None:
+            oSession = RiseSession()
+            RiseSession._s_oLocal.session = oSession
+
+        oSession.m_iDepth += 1
+
+        return oSession
+
+    @staticmethod
+    def end():
+        """
+        Ends the session of this thread: when the outer session ends, the pending updates are written
+        and the entities are forgotten
+        :return: the number of entities updated, 0 if the session is still open
+        """
+        oSession = RiseSession.getCurrent()
+
+        if oSession is None:
+            return 0
+
+        oSession.m_iDepth -= 1
+
+        if oSession.m_iDepth > 0:
+            return 0
+
+        RiseSession._s_oLocal.session = None
+
+        iUpdated = oSession.flush()
+
+        logging.debug("RiseSession.end: " + str(len(oSession.m_aoEntities)) + " entities, " + str(oSession.m_iHits) + " reads saved, " + str(iUpdated) + " updated")
+
+        return iUpdated
+
+    @staticmethod
+    def getCurrent():
+        """
+        Get the session of this thread
+        :return: the session, None if no session has been started
+        """
+        return getattr(RiseSession._s_oLocal, "session", None)
+
+    def get(self, sCollectionName, sEntityId):
+        """
+        Get an entity already read in this session
+        :param sCollectionName: collection of the entity
+        :param sEntityId: id of the entity
+        :return: the entity, None if it has not been read yet
+        """
+        oEntity = self.m_aoEntities.get((sCollectionName, sEntityId))
+
+        if oEntity is not None:
+            self.m_iHits += 1
+
+        return oEntity
+
+    def put(self, sCollectionName, oEntity):
+        """
+        Adds an entity read from the db to the session
+        :param sCollectionName: collection of the entity
+        :param oEntity: the entity
+        :return:
+        """
+        if oEntity is None:
+            return
+
+        self.m_aoEntities[(sCollectionName, oEntity.id)] = oEntity
+
+    def discard(self, sCollectionName, sEntityId):
+        """
+        Removes an entity from the session, i.e. because it has been deleted
+        :param sCollectionName: collection of the entity
+        :param sEntityId: id of the entity
+        :return:
+        """
+        self.m_aoEntities.pop((sCollectionName, sEntityId), None)
+
+        if sCollectionName in self.m_aoPendingUpdates:
+            aoEntities = self.m_aoPendingUpdates[sCollectionName][1]
+            for iKey in [iKey for iKey, oEntity in aoEntities.items() if oEntity.id == sEntityId]:
+                del aoEntities[iKey]
+
+    def addPendingUpdate(self, oRepository, oEntity):
+        """
+        Registers an entity to update at the end of the session. The same entity is written once,
+        with all the changes done in the meantime
+        :param oRepository: the repository of the entity
+        :param oEntity: the entity
+        :return:
+        """
+        if oRepository.m_sCollectionName not in self.m_aoPendingUpdates:
+            self.m_aoPendingUpdates[oRepository.m_sCollectionName] = (oRepository, {})
+
+        self.m_aoPendingUpdates[oRepository.m_sCollectionName][1][id(oEntity)] = oEntity
+
+    def flush(self):
+        """
+        Writes the pending updates, with a bulk write for each collection
+        :return: the number of entities updated
+        """
+        iUpdated = 0
+
+        for sCollectionName, aoPending in list(self.m_aoPendingUpdates.items()):
+            oRepository, aoEntities = aoPending
+
+            if len(aoEntities) == 0:
+                continue
+
+            try:
+                iMatched, iModified = oRepository.bulkUpdate(list(aoEntities.values()))
+                iUpdated += iModified
+            except Exception as oEx:
+                logging.error("RiseSession.flush: exception updating " + sCollectionName + ": " + str(oEx))
+
+        self.m_aoPendingUpdates.clear()
+
+        return iUpdated
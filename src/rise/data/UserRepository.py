@@ -6,4 +6,9 @@ class UserRepository(RiseMongoRepository):
     def __init__(self):
         super().__init__()
         self.m_sCollectionName = "users"
-        self.m_sEntityClassName = f"{User.__module__}.{User.__qualname__}"
\ No newline at end of file
+        self.m_sEntityClassName = f"{User.__module__}.{User.__qualname__}"
+        self.m_aoIndexes.extend([
+            # users to notify
+            {"keys": [("organizationId", 1), ("role", 1)]},
+            {"keys": [("userId", 1)]}
+        ])
@@ -1,42 +1,172 @@
 import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from src.rise.business.WasdiTask import WasdiTask
 from src.rise.data.RiseMongoRepository import RiseMongoRepository
 
 
 class WasdiTaskRepository(RiseMongoRepository):
+    # Projection for the checks that only look if a task is still running
+    s_aoSTATUS_PROJECTION = {"_id": 0, "id": 1, "status": 1, "startDate": 1}
+    # WASDI statuses of a finished process
+    s_asFINISHED_STATUSES = ["DONE", "ERROR", "STOPPED"]
+    # Collection of the finished tasks moved out of wasdi_tasks by archiveFinishedTasks
+    s_sARCHIVE_COLLECTION_NAME = "wasdi_tasks_archive"
+    # default number of tasks moved to the archive with each batch
+    s_iARCHIVE_BATCH_SIZE = 500
 
-    def __init__(self):
+    def __init__(self, bIncludeArchive=False):
+        """
+        :param bIncludeArchive: True to search also the archived tasks in getEntityById, findByParams,
+        existsByParams and getDoneDurations. The archived tasks are meant to be read, not updated
+        """
         super().__init__()
         self.m_sCollectionName = "wasdi_tasks"
+        self.m_bIncludeArchive = bIncludeArchive
         self.m_sEntityClassName = f"{WasdiTask.__module__}.{WasdiTask.__qualname__}"
+        self.m_aoIndexes.extend([
+            # getCreatedList
+            {"keys": [("status", 1), ("nextCheckAt", 1)]},
+            # findByParams: always by area, nearly always by map and plugin
+            {"keys": [("areaId", 1), ("mapId", 1), ("pluginId", 1), ("workspaceId", 1)]},
+            # getDoneDurations
+            {"keys": [("application", 1), ("status", 1), ("endDate", -1)]},
+            # archiveFinishedTasks
+            {"keys": [("status", 1), ("endDate", 1)]}
+        ])
+
+    def getArchiveRepository(self):
+        """
+        Get the repository of the archived tasks: same entities and methods, on the wasdi_tasks_archive collection
+        :return: the repository of the archive
+        """
+        oArchiveRepository = WasdiTaskRepository()
+        oArchiveRepository.m_sCollectionName = WasdiTaskRepository.s_sARCHIVE_COLLECTION_NAME
+        return oArchiveRepository
+
+    def getEntityById(self, sEntityId, aoProjection=None):
+        oTask = super().getEntityById(sEntityId, aoProjection)
+
+        if oTask is None and self.m_bIncludeArchive:
+            oTask = self.getArchiveRepository().getEntityById(sEntityId, aoProjection)
+
+        return oTask
+
+    def getCreatedList(self, bOnlyDue=True, aoProjection=None):
+        """
+        Get the list of the CREATED tasks
+        :param bOnlyDue: True to get only the tasks that must be checked now (see nextCheckAt)
+        :param aoProjection: optional Mongo projection, to read only some fields of the tasks
+        :return: list of tasks
+        """
+        return list(self.iterCreated(bOnlyDue, aoProjection))
+
+    def iterCreated(self, bOnlyDue=True, aoProjection=None, iBatchSize=None):
+        """
+        Streams the CREATED tasks
+        :param bOnlyDue: True to get only the tasks that must be checked now (see nextCheckAt)
+        :param aoProjection: optional Mongo projection, to read only some fields of the tasks
+        :param iBatchSize: number of documents of each batch. None to use the default one
+        :return: generator of tasks
+        """
+        return self.iterEntitiesByField(self.getCreatedFilter(bOnlyDue), iBatchSize, aoProjection)
+
+    def getCreatedFilter(self, bOnlyDue=True):
+        """
+        Get the Mongo filter of the CREATED tasks
+        :param bOnlyDue: True to get only the tasks that must be checked now (see nextCheckAt)
+        :return: the filter
+        """
+        aoFilters = {"status": "CREATED"}
+
+        if bOnlyDue:
+            aoFilters["$or"] = [{"nextCheckAt": {"$exists": False}}, {"nextCheckAt": {"$lte": datetime.now().timestamp()}}]
+
+        return aoFilters
 
-    def getCreatedList(self):
+    def getParamsFilter(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+        """
+        Get the Mongo filter of findByParams: the empty parameters are not filtered
+        :return: the filter
+        """
+        aoFilters = {}
+
+        if sAreaId is None:
+            sAreaId = ""
+        if sMapId is None:
+            sMapId = ""
+        if sPluginId is None:
+            sPluginId = ""
+        if sWorkspaceId is None:
+            sWorkspaceId = ""
+        if sApplication is None:
+            sApplication = ""
+        if sReferenceDate is None:
+            sReferenceDate = ""
+
+        if sAreaId != "":
+            aoFilters["areaId"] = sAreaId
+        if sMapId != "":
+            aoFilters["mapId"] = sMapId
+        if sPluginId != "":
+            aoFilters["pluginId"] = sPluginId
+        if sWorkspaceId != "":
+            aoFilters["workspaceId"] = sWorkspaceId
+        if sApplication != "":
+            aoFilters["application"] = sApplication
+        if sReferenceDate != "":
+            aoFilters["referenceDate"] = sReferenceDate
+        if bIsShortArchive is not None:
+            aoFilters["isShortArchive"] = bIsShortArchive
+
+        return aoFilters
+
+    def existsByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+        """
+        Check if there is at least one task matching the parameters of findByParams, without reading the tasks
+        :return: True if there is at least one task
+        """
+        aoFilters = self.getParamsFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
+
+        if self.exists(aoFilters):
+            return True
+
+        return self.m_bIncludeArchive and self.getArchiveRepository().exists(aoFilters)
+
+    def existsNotFinishedByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+        """
+        Check if there is at least one task matching the parameters of findByParams that is not finished
+        (status not in s_asFINISHED_STATUSES, or without status). The server stops at the first match
+        :return: True if there is a task not finished, False if all the tasks are finished (or there are no tasks), None in case of error
+        """
         try:
             oCollection = self.getCollection()
 
             if oCollection is None:
-                print(
-                    f"WasdiTaskRepository.getCreatedList. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                logging.warning(f"WasdiTaskRepository.existsNotFinishedByParams. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            oRetrievedResult = oCollection.find({"status": "CREATED"})
-
-            if oRetrievedResult is None:
-                print(f"WasdiTaskRepository.getCreatedList: no results retrieved from db")
-                oRetrievedResult = []
-
-            aoEntities = []
-            for oRes in oRetrievedResult:
-                aoEntities.append(WasdiTask(**oRes))
+            aoFilters = self.getNotFinishedFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
 
-            return aoEntities
+            return oCollection.find_one(aoFilters, {"_id": 1}) is not None
         except Exception as oEx:
-            print("WasdiTaskRepository.getCreatedList: Exception " + str(oEx))
+            logging.error(f"WasdiTaskRepository.existsNotFinishedByParams. Exception {oEx}")
 
-        return []
+        return None
 
-    def findByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+    def getNotFinishedFilter(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None):
+        """
+        Get the Mongo filter of the tasks matching the parameters of findByParams that are not finished
+        :return: the filter
+        """
+        aoFilters = self.getParamsFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
+        aoFilters["status"] = {"$nin": WasdiTaskRepository.s_asFINISHED_STATUSES}
+        return aoFilters
+
+    def findByParams(self, sAreaId="", sMapId="", sPluginId="", sWorkspaceId="", sApplication="", sReferenceDate="", bIsShortArchive=None, aoProjection=None):
         try:
             oCollection = self.getCollection()
 
@@ -44,48 +174,216 @@ class WasdiTaskRepository(RiseMongoRepository):
                 print(f"WasdiTaskRepository.findByParams. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            aoFilters = {}
-
-            if sAreaId is None:
-                sAreaId = ""
-            if sMapId is None:
-                sMapId = ""
-            if sPluginId is None:
-                sPluginId = ""
-            if sWorkspaceId is None:
-                sWorkspaceId = ""
-            if sApplication is None:
-                sApplication = ""
-            if sReferenceDate is None:
-                sReferenceDate = ""
-
-            if sAreaId != "":
-                aoFilters["areaId"] = sAreaId
-            if sMapId != "":
-                aoFilters["mapId"] = sMapId
-            if sPluginId != "":
-                aoFilters["pluginId"] = sPluginId
-            if sWorkspaceId != "":
-                aoFilters["workspaceId"] = sWorkspaceId
-            if sApplication != "":
-                aoFilters["application"] = sApplication
-            if sReferenceDate != "":
-                aoFilters["referenceDate"] = sReferenceDate
-            if bIsShortArchive is not None:
-                aoFilters["isShortArchive"] = bIsShortArchive
-            
-            oRetrievedResult = oCollection.find(aoFilters)
+            aoFilters = self.getParamsFilter(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive)
+
+            oRetrievedResult = oCollection.find(aoFilters, aoProjection)
 
             if oRetrievedResult is None:
                 print(f"WasdiTaskRepository.findByParams. no results retrieved from db")
                 return None
 
-            aoEntities = []
-            for oRes in oRetrievedResult:
-                aoEntities.append(WasdiTask(**oRes))
+            aoEntities = self.hydrateEntities(oRetrievedResult)
+
+            if self.m_bIncludeArchive:
+                aoEntities.extend(self.getArchiveRepository().findByParams(sAreaId, sMapId, sPluginId, sWorkspaceId, sApplication, sReferenceDate, bIsShortArchive, aoProjection))
 
             return aoEntities
         except:
             print("WasdiTaskRepository.findByParams. Exception")
 
         return []
+
+    def getDoneDurations(self, sApplication, iLimit=50, bIncludeArchive=None):
+        """
+        Get the durations of the last DONE tasks of an application
+        :param sApplication: name of the WASDI application
+        :param iLimit: max number of tasks to consider
+        :param bIncludeArchive: True to complete the list with the archived tasks. None to use the flag of the repository
+        :return: list of durations in seconds, the most recent first
+        """
+        if bIncludeArchive is None:
+            bIncludeArchive = self.m_bIncludeArchive
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"WasdiTaskRepository.getDoneDurations. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return []
+
+            aoFilter, aoProjection, aoSort = self.getDoneDurationsQuery(sApplication)
+            afDurations = self.getDurations(oCollection.find(aoFilter, aoProjection).sort(aoSort).limit(iLimit))
+
+            # The archived tasks are older than the ones still here
+            if bIncludeArchive and len(afDurations) < iLimit:
+                afDurations.extend(self.getArchiveRepository().getDoneDurations(sApplication, iLimit - len(afDurations), False))
+
+            return afDurations
+        except Exception as oEx:
+            logging.error("WasdiTaskRepository.getDoneDurations: Exception " + str(oEx))
+
+        return []
+
+    def getDoneDurationsQuery(self, sApplication):
+        """
+        Get the query of getDoneDurations: the DONE tasks of an application, the most recent first
+        :param sApplication: name of the WASDI application
+        :return: a tuple (filter, projection, sort)
+        """
+        return {"application": sApplication, "status": "DONE", "endDate": {"$gt": 0}}, {"_id": 0, "startDate": 1, "endDate": 1}, [("endDate", -1)]
+
+    def getDurations(self, aoDocuments):
+        """
+        Get the durations of the tasks read by the query of getDoneDurations
+        :param aoDocuments: the documents, with startDate and endDate
+        :return: list of the positive durations, in seconds
+        """
+        afDurations = []
+
+        for aoDocument in aoDocuments:
+            fDuration = aoDocument["endDate"] - aoDocument["startDate"]
+            if fDuration > 0:
+                afDurations.append(fDuration)
+
+        return afDurations
+
+    def setNextChecks(self, afNextChecks):
+        """
+        Saves, with a single bulk write, when each task will have to be checked again
+        :param afNextChecks: dictionary task id -> nextCheckAt timestamp
+        :return: number of tasks updated
+        """
+        if afNextChecks is None or len(afNextChecks) == 0:
+            return 0
+
+        try:
+            oCollection = self.getCollection()
+
+            if oCollection is None:
+                logging.warning(f"WasdiTaskRepository.setNextChecks. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return 0
+
+            oResult = oCollection.bulk_write(self.getNextChecksOperations(afNextChecks), ordered=False)
+            return oResult.modified_count
+        except Exception as oEx:
+            logging.error("WasdiTaskRepository.setNextChecks: Exception " + str(oEx))
+
+        return 0
+
+    def getNextChecksOperations(self, afNextChecks):
+        """
+        Get the operations of setNextChecks: the tasks are updated only if they are still CREATED
+        :param afNextChecks: dictionary task id -> nextCheckAt timestamp
+        :return: list of UpdateOne
+        """
+        return [UpdateOne({"id": sTaskId, "status": "CREATED"}, {"$set": {"nextCheckAt": fNextCheck}}) for sTaskId, fNextCheck in afNextChecks.items()]
+
+    def archiveFinishedTasks(self, iDays, iBatchSize=None):
+        """
+        Moves to wasdi_tasks_archive, with the same documents, the finished tasks older than iDays days
+        (by end date or, for the tasks without it, by start date). Each batch is first copied and then deleted:
+        the tasks already in the archive (i.e. copied by a run stopped before the delete) are only deleted
+        :param iDays: age in days of the tasks to archive
+        :param iBatchSize: number of tasks moved with each batch. None to use the default one
+        :return: number of tasks moved
+        """
+        iMoved = 0
+        aoFilters, iBatchSize = self.getArchivePlan(iDays, iBatchSize)
+
+        if aoFilters is None:
+            return iMoved
+
+        try:
+            oCollection = self.getCollection()
+            oArchiveCollection = self.getArchiveRepository().getCollection()
+
+            if oCollection is None or oArchiveCollection is None:
+                logging.warning(f"WasdiTaskRepository.archiveFinishedTasks. collections {self.m_sCollectionName} or {WasdiTaskRepository.s_sARCHIVE_COLLECTION_NAME} not found in {RiseMongoRepository.s_sDB_NAME} database")
+                return iMoved
+
+            while True:
+                aoDocuments = list(oCollection.find(aoFilters).limit(iBatchSize))
+
+                if len(aoDocuments) == 0:
+                    break
+
+                try:
+                    oArchiveCollection.insert_many(aoDocuments, ordered=False)
+                except BulkWriteError as oEx:
+                    if not self.isArchiveCopyComplete(oEx):
+                        break
+
+                oResult = oCollection.delete_many(self.getDocumentsFilter(aoDocuments))
+                iMoved += oResult.deleted_count
+
+                if self.isLastArchiveBatch(aoDocuments, iBatchSize):
+                    break
+
+        except Exception as oEx:
+            logging.error("WasdiTaskRepository.archiveFinishedTasks: Exception " + str(oEx))
+
+        return iMoved
+
+    def getArchivePlan(self, iDays, iBatchSize=None):
+        """
+        Get the filter and the batch size of archiveFinishedTasks
+        :param iDays: age in days of the tasks to archive
+        :param iBatchSize: number of tasks moved with each batch. None to use the default one
+        :return: a tuple (filter, batch size). The filter is None if there is nothing to archive
+        """
+        if iBatchSize is None or iBatchSize < 1:
+            iBatchSize = WasdiTaskRepository.s_iARCHIVE_BATCH_SIZE
+
+        if iDays is None or iDays <= 0:
+            return None, iBatchSize
+
+        return self.getArchiveFilter(iDays), iBatchSize
+
+    def isArchiveCopyComplete(self, oEx):
+        """
+        Check the errors of the copy of a batch of tasks to the archive
+        :param oEx: the BulkWriteError of insert_many
+        :return: True if all the tasks are in the archive (the only errors are tasks already archived), False otherwise
+        """
+        # 11000: duplicate key, the task is already in the archive
+        aoOtherErrors = [oError for oError in oEx.details.get("writeErrors", []) if oError.get("code") != 11000]
+
+        if len(aoOtherErrors) > 0:
+            logging.error(f"WasdiTaskRepository.archiveFinishedTasks. {len(aoOtherErrors)} tasks not copied to the archive: {aoOtherErrors[0].get('errmsg')}")
+            return False
+
+        return True
+
+    def getDocumentsFilter(self, aoDocuments):
+        """
+        Get the Mongo filter of a list of documents read from the db
+        :param aoDocuments: the documents
+        :return: the filter on their _id
+        """
+        return {"_id": {"$in": [aoDocument["_id"] for aoDocument in aoDocuments]}}
+
+    def isLastArchiveBatch(self, aoDocuments, iBatchSize):
+        """
+        Check if a batch of archiveFinishedTasks is the last one
+        :param aoDocuments: the tasks of the batch
+        :param iBatchSize: the batch size
+        :return: True if there are no more tasks to archive
+        """
+        return len(aoDocuments) < iBatchSize
+
+    def getArchiveFilter(self, iDays):
+        """
+        Get the Mongo filter of the finished tasks older than iDays days, by end date or,
+        for the tasks without it, by start date
+        :param iDays: age in days of the tasks
+        :return: the filter
+        """
+        fCutoff = datetime.now().timestamp() - iDays * 86400.0
+
+        return {
+            "status": {"$in": WasdiTaskRepository.s_asFINISHED_STATUSES},
+            "$or": [
+                {"endDate": {"$gt": 0, "$lt": fCutoff}},
+                {"endDate": {"$in": [0, None]}, "startDate": {"$lt": fCutoff}}
+            ]
+        }
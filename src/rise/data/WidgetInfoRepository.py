@@ -9,8 +9,44 @@ class WidgetInfoRepository(RiseMongoRepository):
         super().__init__()
         self.m_sCollectionName = "widget_infos"
         self.m_sEntityClassName = f"{WidgetInfo.__module__}.{WidgetInfo.__qualname__}"
+        self.m_aoIndexes.extend([
+            # findByParams
+            {"keys": [("widget", 1), ("areaId", 1), ("referenceDate", 1)]}
+        ])
     
-    def findByParams(self, sWidget="", sAreaId="", sReferenceDate=0, sTitle=""):
+    def getParamsFilter(self, sWidget="", sAreaId="", sReferenceDate=0, sTitle=""):
+        """
+        Get the Mongo filter of findByParams: the empty parameters are not filtered
+        :return: the filter
+        """
+        aoFilters = {}
+
+        if sAreaId is None:
+            sAreaId = ""
+        if sWidget is None:
+            sWidget = ""
+        if sTitle is None:
+            sTitle = ""
+
+        if sAreaId != "":
+            aoFilters["areaId"] = sAreaId
+        if sWidget != "":
+            aoFilters["widget"] = sWidget
+        if sReferenceDate != "":
+            aoFilters["referenceDate"] = sReferenceDate
+        if sTitle != "":
+            aoFilters["title"] = sTitle
+
+        return aoFilters
+
+    def existsByParams(self, sWidget="", sAreaId="", sReferenceDate=0, sTitle=""):
+        """
+        Check if there is at least one widget matching the parameters of findByParams, without reading them
+        :return: True if there is at least one widget
+        """
+        return self.exists(self.getParamsFilter(sWidget, sAreaId, sReferenceDate, sTitle))
+
+    def findByParams(self, sWidget="", sAreaId="", sReferenceDate=0, sTitle="", aoProjection=None):
         try:
             oCollection = self.getCollection()
 
@@ -18,33 +54,15 @@ class WidgetInfoRepository(RiseMongoRepository):
                 print(f"WidgetInfoRepository.findByParams. collection {self.m_sCollectionName} not found in {RiseMongoRepository.s_sDB_NAME} database")
                 return None
 
-            aoFilters = {}
-
-            if sAreaId is None:
-                sAreaId = ""
-            if sWidget is None:
-                sWidget = ""
-            if sTitle is None:
-                sTitle = ""
-
-            if sAreaId != "":
-                aoFilters["areaId"] = sAreaId
-            if sWidget != "":
-                aoFilters["widget"] = sWidget
-            if sReferenceDate != "":
-                aoFilters["referenceDate"] = sReferenceDate
-            if sTitle != "":
-                aoFilters["title"] = sTitle
+            aoFilters = self.getParamsFilter(sWidget, sAreaId, sReferenceDate, sTitle)
 
-            oRetrievedResult = oCollection.find(aoFilters)
+            oRetrievedResult = oCollection.find(aoFilters, aoProjection)
 
             if oRetrievedResult is None:
                 print(f"WidgetInfoRepository.findByParams. no results retrieved from db")
                 return None
 
-            aoEntities = []
-            for oRes in oRetrievedResult:
-                aoEntities.append(WidgetInfo(**oRes))
+            aoEntities = self.hydrateEntities(oRetrievedResult)
 
             return aoEntities
         except Exception as oEx:
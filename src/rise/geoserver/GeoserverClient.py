@@ -2,6 +2,8 @@ import logging
 
 from geo.Geoserver import Geoserver
 
+from src.rise.utils import TrafficRecorder
+
 class GeoserverClient:
     """
     Class dedicated to the creation of a single instance of the Geoserver client
@@ -15,7 +17,7 @@ class GeoserverClient:
             cls._s_oInstance = super(GeoserverClient, cls).__new__(cls)
             sUrl, sUserName, sPassword = cls._getGeoserverConnectionParameters()
             try:
-                cls._s_oInstance.client = Geoserver(sUrl, username=sUserName, password=sPassword)
+                cls._s_oInstance.client = TrafficRecorder.wrap(Geoserver(sUrl, username=sUserName, password=sPassword), "geoserver")
             except Exception as oEx:
                 logging.error(f"GeoserverClient.__new__: exception {oEx}")
         return cls._s_oInstance
@@ -10,6 +10,7 @@ from src.rise.data.LayerRepository import LayerRepository
 from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
 from src.rise.plugins.RisePlugin import RisePlugin
 from src.rise.geoserver.GeoserverService import GeoserverService
+from src.rise.utils import WorkspaceTracker
 
 class RainPlugin(RisePlugin):
     """
@@ -47,7 +48,7 @@ class RainPlugin(RisePlugin):
         logging.debug("RainPlugin.updateNewMaps[" + self.m_oArea.name +"] OVERRIDE")
 
         sWorkspaceName = self.m_oPluginConfig.workspace
-        sWorkspaceId = wasdi.openWorkspace(sWorkspaceName)
+        sWorkspaceId = WorkspaceTracker.openWorkspaceByName(sWorkspaceName)
         sProcessorId = str(uuid.uuid4())
         aoParameters = {}
         sProcessor="global_rain"
@@ -85,7 +86,7 @@ class RainPlugin(RisePlugin):
             logging.warning("RainPlugin.handleTask[" + self.m_oArea.name +"]:  error reading the time from task payload " + str(oInEx))
 
         # Open the workspace
-        wasdi.openWorkspace(self.m_oPluginConfig.workspace)
+        WorkspaceTracker.openWorkspaceByName(self.m_oPluginConfig.workspace)
         # Get files in the workspace
         asFilesInWorkspace = wasdi.getProductsByActiveWorkspace()
         # Get processes in the workspace
@@ -155,9 +156,7 @@ class RainPlugin(RisePlugin):
                         aoFilters["areaId"] = self.m_oArea.id
                         aoFilters["mapId"] = sMapId
 
-                        aoLayers = oLayerRepository.getEntitiesByField(aoFilters)
-
-                        if aoLayers is not None and len(aoLayers)>0:
+                        if oLayerRepository.exists(aoFilters):
                             # Layer already existing
                             logging.debug("RainPlugin.handleTask[" + self.m_oArea.name +"]: Layer Entity " + sLayerId + " already exists in DB")
                             continue
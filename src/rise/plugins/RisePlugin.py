@@ -8,6 +8,7 @@ import wasdi
 from src.rise.RiseDeamon import RiseDeamon
 from src.rise.data.MapRepository import MapRepository
 from src.rise.utils import RiseUtils
+from src.rise.utils import WorkspaceTracker
 
 
 class RisePlugin:
@@ -130,14 +131,8 @@ class RisePlugin:
         :return:
         """
         sWorkspaceName = self.getWorkspaceName(oMap)
-        sWorkspaceId = wasdi.getWorkspaceIdByName(sWorkspaceName)
-
-        if sWorkspaceId == "":
-            wasdi.createWorkspace(sWorkspaceName)
-            sWorkspaceId = wasdi.getWorkspaceIdByName(sWorkspaceName)
-
-        wasdi.openWorkspaceById(sWorkspaceId)
-        return sWorkspaceId
+        # The tracker opens the workspace only if it is not already the active one
+        return WorkspaceTracker.openWorkspaceByName(sWorkspaceName, True)
 
     def handleTask(self, oTask):
         '''
@@ -103,7 +103,8 @@ class ActiveFireMapEngine(RiseMapEngine):
         # Take all our task for today
         aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, "active_fire_map",
                                                             self.m_oPluginEntity.id, sWorkspaceId,
-                                                            oMapConfig.processor, sDate)
+                                                            oMapConfig.processor, sDate,
+                                                            aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
         # if we have existing tasks
         for oTask in aoExistingTasks:
             if self.isRunningStatus(oTask.status):
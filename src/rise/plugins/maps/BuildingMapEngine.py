@@ -228,7 +228,7 @@ class BuildingMapEngine(RiseMapEngine):
             aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
                                                                 self.m_oPluginEntity.id, sWorkspaceId,
                                                                 oMapConfig.processor,
-                                                                sToday)
+                                                                sToday, aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
 
             # if we have existing tasks
             for oTask in aoExistingTasks:
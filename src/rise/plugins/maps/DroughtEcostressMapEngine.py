@@ -99,7 +99,8 @@ class DroughtEcostressMapEngine(RiseMapEngine):
         # Take all our task for today
         aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, oMapConfig.id,
                                                             self.m_oPluginEntity.id, sWorkspaceId,
-                                                            oMapConfig.processor, sReferenceDate)
+                                                            oMapConfig.processor, sReferenceDate,
+                                                            aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
 
         bIsRunning = False
 
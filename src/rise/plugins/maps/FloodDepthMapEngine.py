@@ -9,6 +9,7 @@ from src.rise.RiseDeamon import RiseDeamon
 from src.rise.data.MapRepository import MapRepository
 from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
 from src.rise.plugins.maps.RiseMapEngine import RiseMapEngine
+from src.rise.utils import WorkspaceTracker
 
 class FloodDepthMapEngine(RiseMapEngine):
 
@@ -78,11 +79,11 @@ class FloodDepthMapEngine(RiseMapEngine):
         oWasdiTaskRepository = WasdiTaskRepository()
 
         # Take all our task for this day
-        aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
-                                                            self.m_oPluginEntity.id, sWorkspaceId, oFloodDepthConfig.processor, sDate)
+        bExistingTasks = oWasdiTaskRepository.existsByParams(self.m_oArea.id, self.m_oMapEntity.id,
+                                                             self.m_oPluginEntity.id, sWorkspaceId, oFloodDepthConfig.processor, sDate)
 
         # if we have existing tasks
-        if len(aoExistingTasks)>0:
+        if bExistingTasks:
             logging.info("FloodDepthMapEngine.runForDate[" + self.m_oArea.name + "]: a task is still ongoing or executed for day " + sDate + ". Nothing to do")
             return
 
@@ -158,7 +159,7 @@ class FloodDepthMapEngine(RiseMapEngine):
         sFloodsWorkspaceName = self.m_oArea.id + "|" + sFloodsPluginId + "|" + sSarFloodMapId
 
         # Open our workspace
-        sWorkspaceId = wasdi.openWorkspace(sFloodsWorkspaceName)
+        sWorkspaceId = WorkspaceTracker.openWorkspaceByName(sFloodsWorkspaceName)
 
         return sWorkspaceId        
     
@@ -13,6 +13,7 @@ from src.rise.data.EventRepository import EventRepository
 from src.rise.data.MapRepository import MapRepository
 from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
 from src.rise.plugins.maps.RiseMapEngine import RiseMapEngine
+from src.rise.utils import WorkspaceTracker
 
 class FloodEventFinderMapEngine(RiseMapEngine):
 
@@ -130,11 +131,11 @@ class FloodEventFinderMapEngine(RiseMapEngine):
         oWasdiTaskRepository = WasdiTaskRepository()
 
         # Take all our task for this day
-        aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
-                                                            self.m_oPluginEntity.id, sWorkspaceId, oFloodEventFinderConfig.processor, sDate)
+        bExistingTasks = oWasdiTaskRepository.existsByParams(self.m_oArea.id, self.m_oMapEntity.id,
+                                                             self.m_oPluginEntity.id, sWorkspaceId, oFloodEventFinderConfig.processor, sDate)
 
         # if we have existing tasks
-        if len(aoExistingTasks)>0:
+        if bExistingTasks:
             logging.info("FloodEventFinderMapEngine.runForDate [" + self.m_oArea.name +"]: a task is still ongoing or executed for day " + sDate + ". Nothing to do")
             return True
 
@@ -203,7 +204,7 @@ class FloodEventFinderMapEngine(RiseMapEngine):
         sFloodsWorkspaceName = self.m_oArea.id + "|" + sFloodsPluginId + "|" + sSarFloodMapId
 
         # Open our workspace
-        sWorkspaceId = wasdi.openWorkspace(sFloodsWorkspaceName)
+        sWorkspaceId = WorkspaceTracker.openWorkspaceByName(sFloodsWorkspaceName)
 
         return sWorkspaceId        
     
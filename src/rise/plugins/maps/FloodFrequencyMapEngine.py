@@ -97,11 +97,11 @@ class FloodFrequencyMapEngine(RiseMapEngine):
         oWasdiTaskRepository = WasdiTaskRepository()
 
         # Take all our task for today
-        aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
-                                                            self.m_oPluginEntity.id, sWorkspaceId, "floodfrequencymap", sDate)
+        bExistingTasks = oWasdiTaskRepository.existsByParams(self.m_oArea.id, self.m_oMapEntity.id,
+                                                             self.m_oPluginEntity.id, sWorkspaceId, "floodfrequencymap", sDate)
 
         # if we have existing tasks
-        if len(aoExistingTasks)>0:
+        if bExistingTasks:
             logging.info("FloodFrequencyMapEngine.updateNewMaps[" + self.m_oArea.name +"]: a task is still ongoing or executed for day " + sDate + ". Nothing to do")
             return
 
@@ -12,6 +12,7 @@ from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
 from src.rise.plugins.maps.RiseMapEngine import RiseMapEngine
 from src.rise.utils import RiseUtils
 from src.rise.data.WidgetInfoRepository import WidgetInfoRepository
+from src.rise.utils import WorkspaceTracker
 
 class ImpactMapEngine(RiseMapEngine):
 
@@ -258,7 +259,7 @@ class ImpactMapEngine(RiseMapEngine):
         sFloodsWorkspaceName = self.m_oArea.id + "|" + sFloodsPluginId + "|" + sSarFloodMapId
 
         # Open our workspace
-        sWorkspaceId = wasdi.openWorkspace(sFloodsWorkspaceName)
+        sWorkspaceId = WorkspaceTracker.openWorkspaceByName(sFloodsWorkspaceName)
 
         return sWorkspaceId        
     
@@ -395,9 +396,9 @@ class ImpactMapEngine(RiseMapEngine):
 
             oWidgetInfoRepository = WidgetInfoRepository()
 
-            aoWidgets = oWidgetInfoRepository.findByParams(sWidget="impacts_" + sMapType, sAreaId=self.m_oArea.id, sReferenceDate=oTask.referenceDate)
+            bWidgetExists = oWidgetInfoRepository.existsByParams(sWidget="impacts_" + sMapType, sAreaId=self.m_oArea.id, sReferenceDate=oTask.referenceDate)
 
-            if len(aoWidgets) > 0:
+            if bWidgetExists:
                 return
 
             self.openSarFloodWorkspace()
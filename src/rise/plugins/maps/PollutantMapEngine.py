@@ -32,7 +32,8 @@ class PollutantMapEngine(RiseMapEngine):
 
         # Take all our task for today
         aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, "pollutant_map", self.m_oPluginEntity.id,
-                                                            sWorkspaceId, oMapConfig.processor, sDay)
+                                                            sWorkspaceId, oMapConfig.processor, sDay,
+                                                            aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
 
         # if we have existing tasks
         for oTask in aoExistingTasks:
@@ -1,3 +1,4 @@
+import copy
 import glob
 import json
 import logging
@@ -18,6 +19,7 @@ from src.rise.data.UserRepository import UserRepository
 from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
 from src.rise.geoserver.GeoserverService import GeoserverService
 from src.rise.utils import RiseUtils
+from src.rise.utils import RunMemo
 
 
 class RiseMapEngine:
@@ -31,10 +33,14 @@ class RiseMapEngine:
         self.m_oMapEntity = oMap
 
         try:
-            oParentPath = Path(oConfig.myFilePath).parent
-            oPluginConfigPath = oParentPath.joinpath(oPlugin.id + ".json")
-            if os.path.isfile(oPluginConfigPath):
-                self.m_oPluginConfig = RiseDeamon.readConfigFile(oPluginConfigPath)
+            # The plugin engine already read the same config file: no need to parse it again
+            if oPluginEngine is not None and getattr(oPluginEngine, "m_oPluginConfig", None) is not None:
+                self.m_oPluginConfig = oPluginEngine.m_oPluginConfig
+            else:
+                oParentPath = Path(oConfig.myFilePath).parent
+                oPluginConfigPath = oParentPath.joinpath(oPlugin.id + ".json")
+                if os.path.isfile(oPluginConfigPath):
+                    self.m_oPluginConfig = RiseDeamon.readConfigFile(oPluginConfigPath)
 
         except Exception as oEx:
             logging.error("RiseMapEngine.init: exception " + str(oEx))
@@ -66,6 +72,7 @@ class RiseMapEngine:
             if sNewStatus == "ERROR" or sNewStatus == "STOPPED":
                 logging.warning("RiseMapEngine.handleTask: the new status is not done but " + sNewStatus + " update status and exit. Task id: " + oTask.id)
                 oTask.status = sNewStatus
+                oTask.endDate = datetime.now().timestamp()
                 oTaskRepo.updateEntity(oTask)
                 return False
 
@@ -73,6 +80,7 @@ class RiseMapEngine:
                 logging.debug("RiseMapEngine.handleTask: task done, lets proceed!")
                 # In any case, this task is done
                 oTask.status = sNewStatus
+                oTask.endDate = datetime.now().timestamp()
                 oTaskRepo.updateEntity(oTask)
                 return True
             else:
@@ -84,6 +92,13 @@ class RiseMapEngine:
             return False
     
     def getMapConfig(self, sMapId=None):
+        """
+        Get the config of a map, with the custom parameters of the area if they are in maps_parameters.
+        The plugin config is shared by the engines and kept across the runs: the result is a copy, with its own params,
+        that the caller can change
+        :param sMapId: id of the map. None for the map of this engine
+        :return: copy of the map config, None if the map is not in the plugin config
+        """
 
         # get the map id
         if sMapId is None:
@@ -95,6 +110,9 @@ class RiseMapEngine:
                 oMapConfig = oConfig
                 break
 
+        if oMapConfig is None:
+            return None
+
         # get the area id
         sAreaId = self.m_oArea.id
 
@@ -115,6 +133,8 @@ class RiseMapEngine:
                 aoParameters.sort(key=lambda oParams: oParams.lastModifyTimestamp, reverse=True)
                 oParameter = aoParameters[0]
 
+        oMapConfig = copy.copy(oMapConfig)
+
         if oParameter is not None:
             try:
                 oMapConfig.params = json.loads(oParameter.payload)
@@ -122,6 +142,9 @@ class RiseMapEngine:
             except Exception as oEx:
                 logging.warning(f"RiseMapEngine.getMapConfig: exception {oEx}")
 
+        if hasattr(oMapConfig, "params"):
+            oMapConfig.params = copy.deepcopy(oMapConfig.params)
+
         return oMapConfig
 
     def getStyleForMap(self, sMapId=None):
@@ -212,9 +235,16 @@ class RiseMapEngine:
             logging.error("RiseMapEngine.deleteLayer exception " + str(oEx))
             return False
 
-    def addAndPublishLayer(self, sFileName, oReferenceDate, bPublish=True, sMapIdForStyle=None, bKeepLayer=False, sDataSource="", oCreationDate=None, sResolution="", sInputData="", asProperties=None, sOverrideMapId=None, sOverridePluginId=None, bForceRepublish=False, sForceStyle=None, bForceDeleteLocalFile=True):
+    def addAndPublishLayer(self, sFileName, oReferenceDate, bPublish=True, sMapIdForStyle=None, bKeepLayer=False, sDataSource="", oCreationDate=None, sResolution="", sInputData="", asProperties=None, sOverrideMapId=None, sOverridePluginId=None, bForceRepublish=False, sForceStyle=None, bForceDeleteLocalFile=True, aoPendingLayers=None):
+        oLayerRepository = LayerRepository()
+        bPublishNow = bPublish or bForceRepublish
+        # When our publication started: it identifies it in the db
+        fPublishingStartDate = datetime.now().timestamp() if bPublishNow else 0.0
+        # True when the layer is being published by this call, and if, in case of failure, its db entry must be removed
+        bPublishing = False
+        bDeleteOnFailure = False
+
         try:
-            oLayerRepository = LayerRepository()
             sLayerName = Path(sFileName).stem
             oLayer = self.getLayerEntity(sLayerName, oReferenceDate.timestamp(), sDataSource, oCreationDate, sResolution, sInputData, asProperties)
 
@@ -225,21 +255,62 @@ class RiseMapEngine:
                 oLayer.pluginId = sOverridePluginId
 
             oLayer.keepLayer = bKeepLayer
-            oTestLayer = oLayerRepository.getEntityById(oLayer.id)
+            # The layer is published only once GeoServer has it: until then it is registered as being published
+            oLayer.published = False
+            oLayer.publishingStartDate = fPublishingStartDate
+
+            if not bPublishNow and aoPendingLayers is not None:
+                # Only registered: the caller will register all the layers with bulk upserts
+                aoPendingLayers.append(oLayer)
+                return oLayer
+
+            # One atomic upsert: it tells if the layer was already there and, if not, registers it.
+            # With force republish the db entry is replaced
+            bInserted = oLayerRepository.upsertLayer(oLayer, bForceRepublish)
+
+            if bInserted is None:
+                logging.error("RiseMapEngine.addAndPublishLayer: impossible to register the layer " + sLayerName)
+                return None
+
+            if not bInserted and not bForceRepublish:
+                if not bPublishNow:
+                    # Already registered, by us or by another publisher
+                    return oLayer
+
+                # Already registered: we publish it again only if its publication failed or its publisher died
+                fStaleSeconds = float(getattr(getattr(self.m_oConfig, "daemon", None), "layerPublishTimeoutSeconds", 3600))
+                bTaken = oLayerRepository.takeLayerPublication(oLayer.id, fPublishingStartDate, fStaleSeconds)
+
+                if bTaken is None:
+                    logging.error("RiseMapEngine.addAndPublishLayer: impossible to check the layer " + sLayerName)
+                    return None
+
+                if not bTaken:
+                    if oLayerRepository.exists({"id": oLayer.id, "published": True}):
+                        oLayer.published = True
+                        oLayer.publishingStartDate = 0.0
+                        return oLayer
+
+                    if oLayerRepository.exists({"id": oLayer.id, "publishingStartDate": {"$gt": 0.0}}):
+                        logging.info("RiseMapEngine.addAndPublishLayer: layer " + sLayerName + " is being published by another publisher")
+                        return None
 
-            if bForceRepublish and oTestLayer is not None:
-                # We need to clean it: delete our layer db entry
-                oLayerRepository.deleteEntity(oLayer.id)
-                # Get the Geoserver Service
+                    # Only registered, or unpublished by the retention: it stays as it is
+                    oLayer.publishingStartDate = 0.0
+                    return oLayer
+            else:
+                bDeleteOnFailure = True
+
+            bPublishing = bPublishNow
+
+            if bForceRepublish and not bInserted:
+                # We need to clean it: get the Geoserver Service
                 oGeoserverService = GeoserverService()
                 # If the layer exists
                 if oGeoserverService.existsLayer(sLayerName):
                     # Delete it
                     oGeoserverService.deleteLayer(oLayer.layerId)
 
-                # Set the layer as none to re-publish it
-                oTestLayer = None
-
             if bForceRepublish and bForceDeleteLocalFile:
                 # If we have already a local WASDI copy, delete it to be sure to take the last one from the workspace
                 sLocalFilePath = wasdi.getSavePath() + sFileName
@@ -250,42 +321,70 @@ class RiseMapEngine:
                 except Exception as oEx:
                     logging.warning("Error removing local file " + sLocalFilePath)
 
+            logging.info("RiseMapEngine.addAndPublishLayer: publish Map: " + sLayerName)
 
-            if oTestLayer is None:
-                logging.info("RiseMapEngine.addAndPublishLayer: publish Map: " + sLayerName)
-
-                if sForceStyle is not None:
-                    sStyle = sForceStyle
+            if sForceStyle is not None:
+                sStyle = sForceStyle
+            else:
+                if sMapIdForStyle is not None:
+                    sStyle = self.getStyleForMap(sMapIdForStyle)
                 else:
-                    if sMapIdForStyle is not None:
-                        sStyle = self.getStyleForMap(sMapIdForStyle)
-                    else:
-                        sStyle = self.getStyleForMap()
-
-                if bPublish or bForceRepublish:
-
-                    if self.isRasterFile(sFileName):
-                        if not self.publishRasterLayer(sFileName, sStyle):
-                            logging.error("RiseMapEngine.addAndPublishLayer: impossible to publish raster " + sLayerName)
-                            return None
-                        else:
-                            oLayer.published = True
-                    elif self.isShapeFile(sFileName):
-                        if not self.publishShapeLayer(sFileName, sStyle):
-                            logging.error("RiseMapEngine.addAndPublishLayer: impossible to publish shape " + sLayerName)
-                            return None
-                        else:
-                            oLayer.published = True
-                    else:
-                        logging.error("The file type of " + sLayerName + " is not recognized, we cannot publish!")
+                    sStyle = self.getStyleForMap()
+
+            if bPublishNow:
+
+                if self.isRasterFile(sFileName):
+                    if not self.publishRasterLayer(sFileName, sStyle):
+                        logging.error("RiseMapEngine.addAndPublishLayer: impossible to publish raster " + sLayerName)
+                        oLayerRepository.releaseLayerPublication(oLayer.id, fPublishingStartDate, bDeleteOnFailure)
                         return None
+                elif self.isShapeFile(sFileName):
+                    if not self.publishShapeLayer(sFileName, sStyle):
+                        logging.error("RiseMapEngine.addAndPublishLayer: impossible to publish shape " + sLayerName)
+                        oLayerRepository.releaseLayerPublication(oLayer.id, fPublishingStartDate, bDeleteOnFailure)
+                        return None
+                else:
+                    logging.error("The file type of " + sLayerName + " is not recognized, we cannot publish!")
+                    oLayerRepository.releaseLayerPublication(oLayer.id, fPublishingStartDate, bDeleteOnFailure)
+                    return None
+
+                bPublishing = False
+
+                if not oLayerRepository.setLayerPublished(oLayer, fPublishingStartDate):
+                    logging.warning("RiseMapEngine.addAndPublishLayer: the publication of " + sLayerName + " has been taken by another publisher")
 
-                oLayerRepository.addEntity(oLayer)
             return oLayer
         except Exception as oEx:
             logging.error("RiseMapEngine.addAndPublishLayer exception " + str(oEx))
+
+            if bPublishing:
+                # The layer has not been published: do not leave it in the db as being published
+                oLayerRepository.releaseLayerPublication(oLayer.id, fPublishingStartDate, bDeleteOnFailure)
+
             return None
 
+    def addPendingLayers(self, aoPendingLayers):
+        """
+        Registers in the db, with bulk upserts, the layers that addAndPublishLayer put in a pending list.
+        The list is emptied, so it is safe to call it more than once
+        :param aoPendingLayers: list of the layers to register
+        :return: number of layers added
+        """
+        if aoPendingLayers is None or len(aoPendingLayers) == 0:
+            return 0
+
+        try:
+            oLayerRepository = LayerRepository()
+            iUpserted = oLayerRepository.bulkUpsertLayers(aoPendingLayers)
+            logging.info("RiseMapEngine.addPendingLayers: added " + str(iUpserted) + " layers of " + str(len(aoPendingLayers)))
+            return iUpserted
+        except Exception as oEx:
+            logging.error("RiseMapEngine.addPendingLayers exception " + str(oEx))
+        finally:
+            aoPendingLayers.clear()
+
+        return 0
+
     def publishRasterLayer(self, sFileName, sStyleName=None):
         try:
             sLocalFilePath = wasdi.getPath(sFileName)
@@ -656,9 +755,6 @@ class RiseMapEngine:
     
     def isShortArchiveFinished(self, sMapId=None, sPluginId=None, sProcessor=None):
         try:
-            # get the map Config
-            oMapConfig = self.getMapConfig(sMapId)
-
             if sMapId is None:
                 sMapId = self.m_oMapEntity.id
 
@@ -666,22 +762,29 @@ class RiseMapEngine:
                 sPluginId = self.m_oPluginEntity.id
 
             if sProcessor is None:
+                # get the map Config
+                oMapConfig = self.getMapConfig(sMapId)
                 sProcessor = oMapConfig.processor
 
+            # The same check is done by many engines of the area in the same run
+            oMemoKey = ("isShortArchiveFinished", self.m_oArea.id, sMapId, sPluginId, sProcessor)
+            bFinished = RunMemo.get(oMemoKey)
+
+            if bFinished is not None:
+                return bFinished
+
             # Create the task repo
             oWasdiTaskRepo = WasdiTaskRepository()
-            # Search for a short archive task for this area, map, plugin and processor
-            aoOngoingShortArchiveTasks = oWasdiTaskRepo.findByParams(self.m_oArea.id, sMapId, sPluginId, None, sProcessor, None, True)
+            # Is there a short archive task for this area, map, plugin and processor not finished yet?
+            bNotFinished = oWasdiTaskRepo.existsNotFinishedByParams(self.m_oArea.id, sMapId, sPluginId, None, sProcessor, None, True)
+
+            if bNotFinished is None:
+                # We do not know: better to wait
+                return False
+
+            RunMemo.put(oMemoKey, not bNotFinished)
+            return not bNotFinished
 
-            if aoOngoingShortArchiveTasks is None or len(aoOngoingShortArchiveTasks) == 0:
-                return True
-            else:
-                # More than one short archive task found, we check if all are finished
-                for oTask in aoOngoingShortArchiveTasks:
-                    if not self.isFinishedStatus(oTask.status):
-                        return False
-                return True
-            
         except Exception as oEx:
             logging.error("RiseMapEngine.isShortArchiveFinshed: exception " + str(oEx))
             return False
\ No newline at end of file
@@ -35,7 +35,8 @@ class S3LSTMapEngine(RiseMapEngine):
         # Take all our task for today
         aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, oMapConfig.id,
                                                             self.m_oPluginEntity.id, sWorkspaceId,
-                                                            oMapConfig.processor, sYesterday)
+                                                            oMapConfig.processor, sYesterday,
+                                                            aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
                 
         for oTask in aoExistingTasks:
             if self.isRunningStatus(oTask.status):
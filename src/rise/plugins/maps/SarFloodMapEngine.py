@@ -14,6 +14,7 @@ from src.rise.data.WasdiTaskRepository import WasdiTaskRepository
 from src.rise.data.WidgetInfoRepository import WidgetInfoRepository
 from src.rise.plugins.maps.RiseMapEngine import RiseMapEngine
 from src.rise.utils import RiseUtils
+from src.rise.utils import WorkspaceTracker
 
 
 class SarFloodMapEngine(RiseMapEngine):
@@ -101,7 +102,8 @@ class SarFloodMapEngine(RiseMapEngine):
 
             # We need to check if the task is alredy ongoing
             oWasdiTaskRepository = WasdiTaskRepository()
-            aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id, self.m_oPluginEntity.id, sWorkspaceId)
+            aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id, self.m_oPluginEntity.id, sWorkspaceId,
+                                                                aoProjection={"_id": 0, "pluginPayload.integratedArchive": 1, "pluginPayload.fullArchive": 1})
 
             if len(aoExistingTasks) > 0:
                 for oTask in aoExistingTasks:
@@ -332,9 +334,9 @@ class SarFloodMapEngine(RiseMapEngine):
                         logging.warning("Error converting event peak date " + str(oEvent["peakDate"]))
 
                     # Check if we already inserted the event
-                    aoTestEvents = oEventRepository.findByParams(sAreaId=self.m_oArea.id, sPeakStringDate=oEvent["peakDate"], sType="FLOOD")
+                    bEventExists = oEventRepository.existsByParams(sAreaId=self.m_oArea.id, sPeakStringDate=oEvent["peakDate"], sType="FLOOD")
 
-                    if len(aoTestEvents)<=0:
+                    if not bEventExists:
                         #No: we start also the rain app!
                         self.startRainMaps(oEvent["peakDate"])
 
@@ -452,6 +454,8 @@ class SarFloodMapEngine(RiseMapEngine):
 
         fFirstMapTimestamp = -1.0
         fLastMapTimestamp = -1.0
+        # The daily layers are registered in the db with bulk upserts
+        aoPendingLayers = []
 
         try:
             logging.info("SarFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: task done, lets proceed!")
@@ -492,7 +496,7 @@ class SarFloodMapEngine(RiseMapEngine):
                     continue
 
                 logging.info("SarFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: Found " + sFileName + ", add the layer to db")
-                oLayer = self.addAndPublishLayer(sFileName, oActualDate, not bFullArchive, "sar_flood", sResolution=oMapConfig.resolution, sDataSource=oMapConfig.dataSource, sInputData=oMapConfig.inputData)
+                oLayer = self.addAndPublishLayer(sFileName, oActualDate, not bFullArchive, "sar_flood", sResolution=oMapConfig.resolution, sDataSource=oMapConfig.dataSource, sInputData=oMapConfig.inputData, aoPendingLayers=aoPendingLayers)
 
                 if oLayer is None:
                     logging.warning("SarFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: layer not good!")
@@ -510,6 +514,8 @@ class SarFloodMapEngine(RiseMapEngine):
 
                 oActualDate = oActualDate + oTimeDelta
 
+            self.addPendingLayers(aoPendingLayers)
+
             # Read the payload of the integrated sar archive
             aoPayload = wasdi.getProcessorPayloadAsJson(oTask.id)
 
@@ -647,6 +653,9 @@ class SarFloodMapEngine(RiseMapEngine):
             logging.error("SarFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: exception " + str(oEx))
             return False
         finally:
+            # If we had an exception, register anyway the layers already found
+            self.addPendingLayers(aoPendingLayers)
+
             bChanged = False
 
             # And if we do not have yet archive start and end date, set it
@@ -667,9 +676,9 @@ class SarFloodMapEngine(RiseMapEngine):
                 bChanged = True 
 
             if bChanged:
-                # Update the area if needed
+                # Update the area if needed: with the other updates of the run
                 oAreaRepository = AreaRepository()
-                oAreaRepository.updateEntity(self.m_oArea)
+                oAreaRepository.updateEntityLater(self.m_oArea)
 
     def startDailySARFloodDetection(self, sDay, oMapConfig, aoFloodChainParameters, sWorkspaceId):
         # Did we already start any map today?
@@ -677,7 +686,8 @@ class SarFloodMapEngine(RiseMapEngine):
 
         # Take all our task for today
         aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
-                                                            self.m_oPluginEntity.id, sWorkspaceId, oMapConfig.processor, sDay)
+                                                            self.m_oPluginEntity.id, sWorkspaceId, oMapConfig.processor, sDay,
+                                                            aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
 
         sTodayTaskId = None
         iTimestamp=0
@@ -856,7 +866,7 @@ class SarFloodMapEngine(RiseMapEngine):
         sFloodsWorkspaceName = self.m_oArea.id + "|" + sRainPluginId + "|" + sImergMapId
 
         # Open our workspace
-        sWorkspaceId = wasdi.openWorkspace(sFloodsWorkspaceName)
+        sWorkspaceId = WorkspaceTracker.openWorkspaceByName(sFloodsWorkspaceName)
 
         return sWorkspaceId
     
@@ -917,9 +927,9 @@ class SarFloodMapEngine(RiseMapEngine):
 
             oWidgetInfoRepository = WidgetInfoRepository()
 
-            aoWidgets = oWidgetInfoRepository.findByParams(sWidget="impacts_" + sMapType, sAreaId=self.m_oArea.id, sReferenceDate=sReferenceDate)
+            bWidgetExists = oWidgetInfoRepository.existsByParams(sWidget="impacts_" + sMapType, sAreaId=self.m_oArea.id, sReferenceDate=sReferenceDate)
 
-            if len(aoWidgets) > 0:
+            if bWidgetExists:
                 return
 
             #self.m_oPluginEngine.createOrOpenWorkspace(self.m_oMapEntity)
@@ -53,12 +53,12 @@ class UrbanFloodMapEngine(RiseMapEngine):
         oWasdiTaskRepository = WasdiTaskRepository()
 
         # Take all our task for today
-        aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
-                                                            self.m_oPluginEntity.id, sWorkspaceId,
-                                                            "flood_finder_in_archive", sDay)
+        bExistingTasks = oWasdiTaskRepository.existsByParams(self.m_oArea.id, self.m_oMapEntity.id,
+                                                             self.m_oPluginEntity.id, sWorkspaceId,
+                                                             "flood_finder_in_archive", sDay)
 
         # if we have existing tasks
-        if len(aoExistingTasks) > 0:
+        if bExistingTasks:
             logging.info("UrbanFloodMapEngine.updateNewMaps [" + self.m_oArea.name +"]: today task already done or ongoing")
             return
 
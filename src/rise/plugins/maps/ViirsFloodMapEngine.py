@@ -139,6 +139,8 @@ class ViirsFloodMapEngine(RiseMapEngine):
 
         fFirstMapTimestamp = -1.0
         fLastMapTimestamp = -1.0
+        # The daily layers are registered in the db with bulk upserts
+        aoPendingLayers = []
 
         try:
             logging.info("ViirsFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: task done, lets proceed!")
@@ -174,7 +176,7 @@ class ViirsFloodMapEngine(RiseMapEngine):
                 logging.info("ViirsFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: Found " + sFileName + ", publish it")
 
                 oMapConfig = self.getMapConfig("viirs_flood")
-                oLayer = self.addAndPublishLayer(sFileName, oActualDate, bOnlyLastWeek, sMapIdForStyle="viirs_flood", sResolution=oMapConfig.resolution, sDataSource=oMapConfig.dataSource, sInputData=oMapConfig.inputData)
+                oLayer = self.addAndPublishLayer(sFileName, oActualDate, bOnlyLastWeek, sMapIdForStyle="viirs_flood", sResolution=oMapConfig.resolution, sDataSource=oMapConfig.dataSource, sInputData=oMapConfig.inputData, aoPendingLayers=aoPendingLayers)
 
                 if oLayer is not None:
                     if fFirstMapTimestamp == -1.0:
@@ -189,6 +191,8 @@ class ViirsFloodMapEngine(RiseMapEngine):
 
                 oActualDate = oActualDate + oTimeDelta
 
+            self.addPendingLayers(aoPendingLayers)
+
             # notify users
             self.notifyEndOfTask(oTask.areaId, True, "Low Res Flooded Area Detection")
 
@@ -197,6 +201,9 @@ class ViirsFloodMapEngine(RiseMapEngine):
             logging.error("ViirsFloodMapEngine.handleArchiveTask [" + self.m_oArea.name +"]: exception " + str(oEx))
             return False
         finally:
+            # If we had an exception, register anyway the layers already found
+            self.addPendingLayers(aoPendingLayers)
+
             bChanged = False
 
             # And if we do not have yet archive start and end date, set it
@@ -217,9 +224,9 @@ class ViirsFloodMapEngine(RiseMapEngine):
                 bChanged = True                 
 
             if bChanged:
-                # Update the area if needed
+                # Update the area if needed: with the other updates of the run
                 oAreaRepository = AreaRepository()
-                oAreaRepository.updateEntity(self.m_oArea)
+                oAreaRepository.updateEntityLater(self.m_oArea)
 
     def viirsMapFromDate(self, sToday):
 
@@ -234,7 +241,7 @@ class ViirsFloodMapEngine(RiseMapEngine):
         # Take all our task for today
         aoExistingTasks = oWasdiTaskRepository.findByParams(self.m_oArea.id, self.m_oMapEntity.id,
                                                             self.m_oPluginEntity.id, sWorkspaceId, oMapConfig.processor,
-                                                            sToday)
+                                                            sToday, aoProjection=WasdiTaskRepository.s_aoSTATUS_PROJECTION)
 
         # if we have existing tasks
         for oTask in aoExistingTasks:
@@ -0,0 +1,181 @@
+import json
+import logging
+import threading
+
+# True when the queries of the repositories must be checked with explain()
+_s_bEnabled = False
+# Query shapes already checked by this process: "collection.method shape"
+_s_asCheckedShapes = set()
+# Query shapes that do a collection scan
+_s_asCollScans = []
+_s_oLock = threading.Lock()
+
+# Methods of a Mongo collection with a filter as first argument
+s_asFILTER_METHODS = ["find", "find_one", "count_documents", "update_one", "update_many", "replace_one",
+                      "delete_one", "delete_many", "find_one_and_update", "find_one_and_replace", "find_one_and_delete"]
+
+
+def enable(bEnabled=True):
+    """
+    Activates or deactivates the check of the queries
+    :param bEnabled: True to check the queries
+    :return:
+    """
+    global _s_bEnabled
+    _s_bEnabled = bEnabled
+
+
+def startFromConfig(oConfig):
+    """
+    Activates the check of the queries if daemon.explainQueries is true in the config
+    :param oConfig: the RISE config object
+    :return: True if the check is active
+    """
+    oDaemon = getattr(oConfig, "daemon", None)
+    enable(bool(getattr(oDaemon, "explainQueries", False)) if oDaemon is not None else False)
+    return _s_bEnabled
+
+
+def isEnabled():
+    return _s_bEnabled
+
+
+def wrap(oCollection, sCollectionName):
+    """
+    Wraps a Mongo collection to explain, once for each query shape, the queries done on it.
+    When the check is not active, the collection is returned as it is
+    :param oCollection: the Mongo collection
+    :param sCollectionName: name of the collection, for the logs
+    :return: the collection to use
+    """
+    if not _s_bEnabled or oCollection is None:
+        return oCollection
+
+    return _ExplainProxy(oCollection, sCollectionName)
+
+
+def getCollScans():
+    """
+    Get the query shapes that did a collection scan in this process
+    :return: list of strings "collection.method shape"
+    """
+    with _s_oLock:
+        return list(_s_asCollScans)
+
+
+def logSummary():
+    """
+    Logs the result of the check
+    :return:
+    """
+    if not _s_bEnabled:
+        return
+
+    asCollScans = getCollScans()
+    logging.info("QueryExplainer.logSummary: checked " + str(len(_s_asCheckedShapes)) + " query shapes, " + str(len(asCollScans)) + " with COLLSCAN")
+
+    for sCollScan in asCollScans:
+        logging.warning("QueryExplainer.logSummary: COLLSCAN " + sCollScan)
+
+
+def getQueryShape(oValue):
+    """
+    The shape of a query: same fields and operators, without the values
+    :param oValue: the filter (or part of it)
+    :return: the shape
+    """
+    if isinstance(oValue, dict):
+        return {sKey: getQueryShape(oChild) for sKey, oChild in oValue.items()}
+
+    if isinstance(oValue, list) and len(oValue) > 0 and isinstance(oValue[0], dict):
+        # i.e. the conditions of a $or
+        return [getQueryShape(oChild) for oChild in oValue]
+
+    return 1
+
+
+def hasCollScan(oPlan):
+    """
+    Search a COLLSCAN stage in an explained plan
+    :param oPlan: the plan (or part of it)
+    :return: True if the plan does a collection scan
+    """
+    if isinstance(oPlan, dict):
+        if oPlan.get("stage") == "COLLSCAN":
+            return True
+        return any(hasCollScan(oChild) for oChild in oPlan.values())
+
+    if isinstance(oPlan, list):
+        return any(hasCollScan(oChild) for oChild in oPlan)
+
+    return False
+
+
+def explainQuery(oCollection, sCollectionName, sMethod, aoFilter, aoSort=None):
+    """
+    Explains a query, if its shape was not checked yet, and logs a warning if it does a collection scan
+    :param oCollection: the real Mongo collection
+    :param sCollectionName: name of the collection
+    :param sMethod: the method that is going to run the query
+    :param aoFilter: the filter of the query
+    :param aoSort: the sort of the query, if any
+    :return:
+    """
+    if aoFilter is None:
+        aoFilter = {}
+
+    try:
+        sShape = sCollectionName + "." + sMethod + " " + json.dumps(getQueryShape(aoFilter), sort_keys=True)
+        if aoSort:
+            sShape = sShape + " sort " + json.dumps(aoSort)
+    except Exception:
+        sShape = sCollectionName + "." + sMethod + " " + str(aoFilter)
+
+    with _s_oLock:
+        if sShape in _s_asCheckedShapes:
+            return
+        _s_asCheckedShapes.add(sShape)
+
+    try:
+        oCursor = oCollection.find(aoFilter)
+        if aoSort:
+            oCursor = oCursor.sort(aoSort)
+
+        aoExplain = oCursor.explain()
+        oPlanner = aoExplain.get("queryPlanner", aoExplain)
+
+        if hasCollScan(oPlanner.get("winningPlan", oPlanner)):
+            logging.warning("QueryExplainer.explainQuery: COLLSCAN " + sShape)
+            with _s_oLock:
+                _s_asCollScans.append(sShape)
+        else:
+            logging.debug("QueryExplainer.explainQuery: index used by " + sShape)
+    except Exception as oEx:
+        logging.warning("QueryExplainer.explainQuery: impossible to explain " + sShape + ": " + str(oEx))
+
+
+class _ExplainProxy:
+    """
+    Proxy of a Mongo collection: explains the queries before running them
+    """
+    def __init__(self, oCollection, sCollectionName):
+        self.m_oCollection = oCollection
+        self.m_sCollectionName = sCollectionName
+
+    def __getattr__(self, sName):
+        oAttribute = getattr(self.m_oCollection, sName)
+
+        if sName not in s_asFILTER_METHODS and sName != "distinct":
+            return oAttribute
+
+        def _method(*aoArgs, **aoKwargs):
+            if sName == "distinct":
+                aoFilter = aoArgs[1] if len(aoArgs) > 1 else aoKwargs.get("filter")
+            else:
+                aoFilter = aoArgs[0] if len(aoArgs) > 0 else aoKwargs.get("filter")
+
+            explainQuery(self.m_oCollection, self.m_sCollectionName, sName, aoFilter, aoKwargs.get("sort"))
+
+            return oAttribute(*aoArgs, **aoKwargs)
+
+        return _method
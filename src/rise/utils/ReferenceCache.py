@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+
+from src.rise.utils import TrafficRecorder
+
+# Seconds a collection stays in the cache: 0 disables the cache
+_s_iTtlSeconds = 0
+# Seconds between two checks of a collection when the change streams are not available
+_s_iPollSeconds = 60
+# Cached collections: name -> (load time, list of documents)
+_s_aoEntries = {}
+# Last invalidation time of each collection
+_s_afInvalidatedAt = {}
+_s_oLock = threading.Lock()
+# Threads watching the collections in resident mode
+_s_aoWatchers = []
+_s_oStopEvent = threading.Event()
+
+# Operators supported by the filters applied to the cached documents
+s_asSUPPORTED_OPERATORS = ["$in", "$eq", "$ne", "$nin"]
+
+
+def configure(iTtlSeconds, iPollSeconds=60):
+    """
+    Sets the expiry of the cache
+    :param iTtlSeconds: seconds a collection stays in the cache. 0 disables the cache
+    :param iPollSeconds: seconds between two checks of a collection when the change streams are not available
+    :return:
+    """
+    global _s_iTtlSeconds
+    global _s_iPollSeconds
+
+    _s_iTtlSeconds = max(0, int(iTtlSeconds))
+    _s_iPollSeconds = max(1, int(iPollSeconds))
+    invalidate()
+
+
+def startFromConfig(oConfig):
+    """
+    Configures the cache from daemon.referenceCacheSeconds (default 300) and daemon.referenceCachePollSeconds (default 60).
+    :param oConfig: the RISE config object
+    :return: True if the cache is active
+    """
+    oDaemon = getattr(oConfig, "daemon", None)
+    iTtlSeconds = getattr(oDaemon, "referenceCacheSeconds", 300) if oDaemon is not None else 300
+    iPollSeconds = getattr(oDaemon, "referenceCachePollSeconds", 60) if oDaemon is not None else 60
+
+    configure(iTtlSeconds, iPollSeconds)
+
+    return isEnabled()
+
+
+def isEnabled():
+    return _s_iTtlSeconds > 0
+
+
+def getDocuments(sCollectionName, oLoader):
+    """
+    Get all the documents of a collection, from the cache if they are not expired
+    :param sCollectionName: name of the collection
+    :param oLoader: function that reads all the documents of the collection from the db, returns None on error
+    :return: the list of documents (that must not be changed by the caller), None if the cache is not active or the load failed
+    """
+    if not isEnabled():
+        return None
+
+    with _s_oLock:
+        aoEntry = _s_aoEntries.get(sCollectionName)
+
+    if aoEntry is not None and time.time() - aoEntry[0] < _s_iTtlSeconds:
+        return aoEntry[1]
+
+    fLoadTime = time.time()
+    aoDocuments = oLoader()
+
+    if aoDocuments is None:
+        return None
+
+    with _s_oLock:
+        # If the collection has been invalidated while we were reading it, the documents could be old:
+        # they are returned but not cached
+        if _s_afInvalidatedAt.get(sCollectionName, 0.0) < fLoadTime:
+            _s_aoEntries[sCollectionName] = (fLoadTime, aoDocuments)
+
+    logging.debug("ReferenceCache.getDocuments: loaded " + str(len(aoDocuments)) + " documents of " + sCollectionName)
+
+    return aoDocuments
+
+
+def invalidate(sCollectionName=None):
+    """
+    Removes a collection from the cache: the next read will load it again from the db
+    :param sCollectionName: name of the collection. None for all the collections
+    :return:
+    """
+    with _s_oLock:
+        if sCollectionName is None:
+            _s_aoEntries.clear()
+        else:
+            _s_aoEntries.pop(sCollectionName, None)
+            _s_afInvalidatedAt[sCollectionName] = time.time()
+
+
+def matches(aoDocument, aoFilter):
+    """
+    Check if a document matches a filter, for the simple filters of the reference collections:
+    equality, $eq, $ne, $in and $nin on first level fields
+    :param aoDocument: the document
+    :param aoFilter: the Mongo filter
+    :return: True or False, None if the filter is not supported and the query must go to the db
+    """
+    for sField, oCondition in aoFilter.items():
+        if sField.startswith("$") or "." in sField:
+            return None
+
+        oValue = aoDocument.get(sField)
+
+        if isinstance(oCondition, dict):
+            for sOperator, oOperand in oCondition.items():
+                if sOperator not in s_asSUPPORTED_OPERATORS:
+                    return None
+
+                if sOperator == "$eq" and oValue != oOperand:
+                    return False
+                if sOperator == "$ne" and oValue == oOperand:
+                    return False
+                if sOperator == "$in" and oValue not in oOperand:
+                    return False
+                if sOperator == "$nin" and oValue in oOperand:
+                    return False
+        elif oValue != oCondition:
+            return False
+
+    return True
+
+
+def filterDocuments(aoDocuments, aoFilter):
+    """
+    Get the documents matching a filter
+    :param aoDocuments: the documents
+    :param aoFilter: the Mongo filter
+    :return: the list of matching documents, None if the filter is not supported
+    """
+    aoMatching = []
+
+    for aoDocument in aoDocuments:
+        bMatch = matches(aoDocument, aoFilter)
+
+        if bMatch is None:
+            return None
+        if bMatch:
+            aoMatching.append(aoDocument)
+
+    return aoMatching
+
+
+def startWatching(aoRepositories):
+    """
+    Resident mode: starts a thread for each repository that invalidates its collection as soon as it changes.
+    The thread uses a Mongo change stream and, if the server does not support them (i.e. it is not a replica set)
+    or the traffic is recorded or replayed, checks every referenceCachePollSeconds the number of documents and the last lastModifyTimestamp
+    :param aoRepositories: the repositories of the cached collections
+    :return:
+    """
+    if not isEnabled():
+        return
+
+    _s_oStopEvent.clear()
+
+    for oRepository in aoRepositories:
+        oThread = threading.Thread(target=_watch, args=(oRepository,), name="RiseCacheWatch-" + oRepository.m_sCollectionName, daemon=True)
+        oThread.start()
+        _s_aoWatchers.append(oThread)
+
+
+def stopWatching():
+    """
+    Stops the threads started by startWatching
+    :return:
+    """
+    _s_oStopEvent.set()
+
+    for oThread in _s_aoWatchers:
+        oThread.join(5)
+
+    _s_aoWatchers.clear()
+
+
+def _watch(oRepository):
+    sCollectionName = oRepository.m_sCollectionName
+
+    # A change stream cannot be recorded or replayed: with the traffic harness the collections are polled
+    if TrafficRecorder.isRecording() or TrafficRecorder.isReplaying():
+        logging.info("ReferenceCache._watch: traffic " + ("replay" if TrafficRecorder.isReplaying() else "record") + ", polling " + sCollectionName + " every " + str(_s_iPollSeconds) + " seconds")
+        _poll(oRepository)
+        return
+
+    try:
+        oCollection = oRepository.getCollection()
+
+        # try_next waits at most one second for a change: then we check if we have to stop
+        with oCollection.watch(max_await_time_ms=1000) as oStream:
+            logging.info("ReferenceCache._watch: watching the changes of " + sCollectionName)
+
+            while not _s_oStopEvent.is_set() and oStream.alive:
+                if oStream.try_next() is not None:
+                    invalidate(sCollectionName)
+
+        return
+    except Exception as oEx:
+        logging.info("ReferenceCache._watch: change streams not available for " + sCollectionName + ", polling every " + str(_s_iPollSeconds) + " seconds: " + str(oEx))
+
+    _poll(oRepository)
+
+
+def _poll(oRepository):
+    sCollectionName = oRepository.m_sCollectionName
+    oLastSignature = None
+
+    while not _s_oStopEvent.is_set():
+        oSignature = _getSignature(oRepository)
+
+        # The first time we do not know what changed before: the collection is read again
+        if oSignature is not None and oSignature != oLastSignature:
+            logging.debug("ReferenceCache._poll: " + sCollectionName + " changed")
+            invalidate(sCollectionName)
+            oLastSignature = oSignature
+
+        _s_oStopEvent.wait(_s_iPollSeconds)
+
+
+def _getSignature(oRepository):
+    """
+    Number of documents and last lastModifyTimestamp of a collection: when it changes, the collection changed
+    :param oRepository: the repository of the collection
+    :return: tuple with the signature, None in case of error
+    """
+    try:
+        oCollection = oRepository.getCollection()
+        iCount = oCollection.count_documents({})
+        aoLast = oCollection.find_one({}, {"_id": 0, "lastModifyTimestamp": 1}, sort=[("lastModifyTimestamp", -1)])
+        return iCount, aoLast.get("lastModifyTimestamp") if aoLast is not None else None
+    except Exception as oEx:
+        logging.warning("ReferenceCache._getSignature: exception checking " + oRepository.m_sCollectionName + ": " + str(oEx))
+
+    return None
@@ -0,0 +1,50 @@
+import logging
+
+# Answers already computed in this run, by key
+_s_aoValues = {}
+# Number of answers given from the memo since the last reset
+_s_iHits = 0
+
+
+def reset():
+    """
+    Forgets all the answers: called at the start of each run on an area
+    :return:
+    """
+    global _s_iHits
+
+    if len(_s_aoValues) > 0:
+        logging.debug("RunMemo.reset: " + str(len(_s_aoValues)) + " answers, " + str(_s_iHits) + " reused")
+
+    _s_aoValues.clear()
+    _s_iHits = 0
+
+
+def get(oKey, oDefault=None):
+    """
+    Get an answer already computed in this run
+    :param oKey: the key of the answer (a tuple with the name of the check and its parameters)
+    :param oDefault: value returned if the answer is not there
+    :return: the answer or oDefault
+    """
+    global _s_iHits
+
+    if oKey in _s_aoValues:
+        _s_iHits += 1
+        return _s_aoValues[oKey]
+
+    return oDefault
+
+
+def put(oKey, oValue):
+    """
+    Remembers an answer until the next reset
+    :param oKey: the key of the answer
+    :param oValue: the answer
+    :return:
+    """
+    _s_aoValues[oKey] = oValue
+
+
+def getHits():
+    return _s_iHits
@@ -0,0 +1,446 @@
+import atexit
+import glob
+import gzip
+import inspect
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import wasdi
+
+# "" (not active), "record" or "replay"
+_s_sMode = ""
+# Folder of the archive
+_s_sPath = ""
+# Replay: 1.0 to wait the recorded latencies, 0.0 to answer immediately
+_s_fLatencyScale = 1.0
+# Record: calls not yet written in the archive
+_s_aoPendingRecords = []
+# Replay: recorded calls by (channel, method, arguments) and by (channel, method)
+_s_aoRecordsByKey = {}
+_s_aoRecordsByMethod = {}
+# Calls done by this process: "channel.method" -> [count, seconds]
+_s_aoStats = {}
+_s_oLock = threading.Lock()
+_s_oLocal = threading.local()
+_s_fStartTime = 0.0
+
+# Mongo methods that return a cursor: the results are recorded when the cursor is read
+s_asCURSOR_METHODS = ["find", "aggregate"]
+# Methods of a cursor that only change the query
+s_asCURSOR_CHAIN_METHODS = ["sort", "limit", "skip", "batch_size", "hint", "max_time_ms", "collation", "allow_disk_use"]
+
+
+class TrafficReplayMiss(Exception):
+    """
+    Raised in replay mode when a call was not in the recorded archive
+    """
+    pass
+
+
+def start(sMode, sPath, fLatencyScale=1.0):
+    """
+    Activates the recording or the replay of the traffic toward WASDI, GeoServer and Mongo for this process
+    :param sMode: "record" or "replay"
+    :param sPath: folder of the archive
+    :param fLatencyScale: replay only: multiplier of the recorded latencies (0 = no wait)
+    :return: True if the harness is active
+    """
+    global _s_sMode
+    global _s_sPath
+    global _s_fLatencyScale
+    global _s_fStartTime
+
+    if sMode not in ["record", "replay"]:
+        logging.error("TrafficRecorder.start: unknown mode " + str(sMode))
+        return False
+
+    if _s_sMode != "":
+        return True
+
+    _s_sMode = sMode
+    _s_sPath = sPath
+    _s_fLatencyScale = float(fLatencyScale)
+    _s_fStartTime = time.time()
+
+    os.makedirs(_s_sPath, exist_ok=True)
+
+    if sMode == "replay":
+        _loadArchive()
+
+    _installWasdi()
+    atexit.register(stop)
+
+    logging.info("TrafficRecorder.start: " + sMode + " traffic in " + sPath)
+    return True
+
+
+def startFromConfig(oConfig):
+    """
+    Activates the harness if the config has a traffic section with mode and path
+    :param oConfig: the RISE config object
+    :return: True if the harness is active
+    """
+    oTraffic = getattr(oConfig, "traffic", None)
+
+    if oTraffic is None or not getattr(oTraffic, "mode", ""):
+        return False
+
+    return start(oTraffic.mode, oTraffic.path, getattr(oTraffic, "latencyScale", 1.0))
+
+
+def isRecording():
+    return _s_sMode == "record"
+
+
+def isReplaying():
+    return _s_sMode == "replay"
+
+
+def wrap(oTarget, sChannel):
+    """
+    Wraps a client object (a Mongo collection, the GeoServer client) to record or replay its calls.
+    When the harness is not active, the object is returned as it is
+    :param oTarget: the real object; in replay mode it can be None
+    :param sChannel: name of the channel, i.e. "mongo.layers" or "geoserver"
+    :return: the object to use
+    """
+    if _s_sMode == "":
+        return oTarget
+
+    return _TrafficProxy(oTarget, sChannel)
+
+
+def flush():
+    """
+    Writes the recorded calls not yet saved in the archive of this process
+    :return:
+    """
+    global _s_aoPendingRecords
+
+    if _s_sMode != "record":
+        return
+
+    with _s_oLock:
+        aoRecords = _s_aoPendingRecords
+        _s_aoPendingRecords = []
+
+    if len(aoRecords) == 0:
+        return
+
+    sFile = os.path.join(_s_sPath, "traffic-" + str(os.getpid()) + ".pkl.gz")
+
+    try:
+        # gzip members can be appended: each flush is a new member
+        with gzip.open(sFile, "ab") as oFile:
+            for aoRecord in aoRecords:
+                pickle.dump(aoRecord, oFile)
+    except Exception as oEx:
+        logging.error("TrafficRecorder.flush: exception writing " + sFile + ": " + str(oEx))
+
+
+def stop():
+    """
+    Saves the pending records and the stats of this process
+    :return:
+    """
+    if _s_sMode == "":
+        return
+
+    flush()
+
+    fWallTime = time.time() - _s_fStartTime
+    iCalls = 0
+    fCallsTime = 0.0
+
+    for sName, aoStat in sorted(_s_aoStats.items()):
+        iCalls += aoStat[0]
+        fCallsTime += aoStat[1]
+
+    try:
+        sFile = os.path.join(_s_sPath, "stats-" + _s_sMode + "-" + str(os.getpid()) + ".json")
+        with open(sFile, "w") as oFile:
+            json.dump({"mode": _s_sMode, "wallTime": fWallTime, "calls": iCalls, "callsTime": fCallsTime, "methods": _s_aoStats}, oFile, indent=2, sort_keys=True)
+    except Exception as oEx:
+        logging.error("TrafficRecorder.stop: exception writing the stats: " + str(oEx))
+
+    logging.info("TrafficRecorder.stop: " + _s_sMode + " wall time " + str(round(fWallTime, 3)) + " s, " + str(iCalls) + " calls, " + str(round(fCallsTime, 3)) + " s in calls")
+
+
+def _makeKey(aoArgs, aoKwargs):
+    return repr(aoArgs) + repr(sorted(aoKwargs.items()))
+
+
+def _storable(oValue):
+    """
+    The results must be saved with pickle: objects that cannot be pickled (i.e. pymongo results)
+    are converted in a SimpleNamespace with their public attributes
+    """
+    try:
+        pickle.dumps(oValue)
+        return oValue
+    except Exception:
+        pass
+
+    oStorable = SimpleNamespace()
+    for sName in dir(oValue):
+        if sName.startswith("_"):
+            continue
+        try:
+            oAttribute = getattr(oValue, sName)
+            if not callable(oAttribute):
+                pickle.dumps(oAttribute)
+                setattr(oStorable, sName, oAttribute)
+        except Exception:
+            pass
+
+    return oStorable
+
+
+def _updateStats(sChannel, sMethod, fSeconds):
+    with _s_oLock:
+        aoStat = _s_aoStats.setdefault(sChannel + "." + sMethod, [0, 0.0])
+        aoStat[0] += 1
+        aoStat[1] += fSeconds
+
+
+def _record(sChannel, sMethod, sKey, oResult, oError, fLatency):
+    _updateStats(sChannel, sMethod, fLatency)
+
+    aoRecord = {"channel": sChannel, "method": sMethod, "key": sKey, "latency": fLatency, "result": None, "error": None}
+
+    if oError is not None:
+        try:
+            pickle.dumps(oError)
+            aoRecord["error"] = oError
+        except Exception:
+            aoRecord["error"] = RuntimeError(str(oError))
+    else:
+        aoRecord["result"] = _storable(oResult)
+
+    with _s_oLock:
+        _s_aoPendingRecords.append(aoRecord)
+
+
+def _loadArchive():
+    iRecords = 0
+
+    for sFile in sorted(glob.glob(os.path.join(_s_sPath, "traffic-*.pkl.gz"))):
+        try:
+            with gzip.open(sFile, "rb") as oFile:
+                while True:
+                    try:
+                        aoRecord = pickle.load(oFile)
+                    except EOFError:
+                        break
+
+                    aoRecord["used"] = False
+                    _s_aoRecordsByKey.setdefault((aoRecord["channel"], aoRecord["method"], aoRecord["key"]), deque()).append(aoRecord)
+                    _s_aoRecordsByMethod.setdefault((aoRecord["channel"], aoRecord["method"]), deque()).append(aoRecord)
+                    iRecords += 1
+        except Exception as oEx:
+            logging.error("TrafficRecorder._loadArchive: exception reading " + sFile + ": " + str(oEx))
+
+    logging.info("TrafficRecorder._loadArchive: " + str(iRecords) + " recorded calls loaded")
+
+
+def _takeRecord(oQueue):
+    while oQueue is not None and len(oQueue) > 0:
+        aoRecord = oQueue.popleft()
+        if not aoRecord["used"]:
+            aoRecord["used"] = True
+            return aoRecord
+    return None
+
+
+def _replay(sChannel, sMethod, sKey):
+    """
+    Gives back the recorded answer of a call: the same call with the same arguments if recorded,
+    otherwise (i.e. queries with the current time) the next recorded call of the same method
+    """
+    with _s_oLock:
+        aoRecord = _takeRecord(_s_aoRecordsByKey.get((sChannel, sMethod, sKey)))
+
+        if aoRecord is None:
+            aoRecord = _takeRecord(_s_aoRecordsByMethod.get((sChannel, sMethod)))
+
+    if aoRecord is None:
+        _updateStats(sChannel, sMethod + ".miss", 0.0)
+        raise TrafficReplayMiss(sChannel + "." + sMethod + " " + sKey)
+
+    fLatency = aoRecord["latency"] * _s_fLatencyScale
+    if fLatency > 0:
+        time.sleep(fLatency)
+
+    _updateStats(sChannel, sMethod, fLatency)
+
+    if aoRecord["error"] is not None:
+        raise aoRecord["error"]
+
+    return aoRecord["result"]
+
+
+def _call(sChannel, sMethod, oFunction, aoArgs, aoKwargs):
+    sKey = _makeKey(aoArgs, aoKwargs)
+
+    if _s_sMode == "replay":
+        return _replay(sChannel, sMethod, sKey)
+
+    # Calls done inside a recorded call (i.e. wasdi calling itself) are not recorded
+    iDepth = getattr(_s_oLocal, "depth", 0)
+    if iDepth > 0:
+        return oFunction(*aoArgs, **aoKwargs)
+
+    _s_oLocal.depth = iDepth + 1
+    fStart = time.time()
+
+    try:
+        oResult = oFunction(*aoArgs, **aoKwargs)
+    except Exception as oEx:
+        _record(sChannel, sMethod, sKey, None, oEx, time.time() - fStart)
+        raise
+    finally:
+        _s_oLocal.depth = iDepth
+
+    _record(sChannel, sMethod, sKey, oResult, None, time.time() - fStart)
+    return oResult
+
+
+def _installWasdi():
+    """
+    Replaces the public functions of the wasdi lib with recording/replaying ones.
+    The setters only change the local state of the lib and are left as they are
+    """
+    for sName, oFunction in inspect.getmembers(wasdi, inspect.isfunction):
+        if sName.startswith("_") or sName.startswith("set") or not str(oFunction.__module__).startswith(wasdi.__name__):
+            continue
+        setattr(wasdi, sName, _wrapFunction(sName, oFunction))
+
+
+def _wrapFunction(sName, oFunction):
+    def _wrapped(*aoArgs, **aoKwargs):
+        return _call("wasdi", sName, oFunction, aoArgs, aoKwargs)
+
+    _wrapped.__name__ = sName
+    _wrapped.__doc__ = oFunction.__doc__
+    return _wrapped
+
+
+class _TrafficProxy:
+    """
+    Records or replays the method calls of a client object
+    """
+
+    def __init__(self, oTarget, sChannel):
+        self.m_oTarget = oTarget
+        self.m_sChannel = sChannel
+
+    def __getattr__(self, sName):
+        oTargetMethod = None
+
+        if self.m_oTarget is not None:
+            oTargetMethod = getattr(self.m_oTarget, sName)
+            if not callable(oTargetMethod):
+                return oTargetMethod
+
+        def _method(*aoArgs, **aoKwargs):
+            if sName in s_asCURSOR_METHODS:
+                return _TrafficCursor(self.m_sChannel, sName, oTargetMethod, aoArgs, aoKwargs)
+            return _call(self.m_sChannel, sName, oTargetMethod, aoArgs, aoKwargs)
+
+        return _method
+
+
+class _TrafficCursor:
+    """
+    Cursor of a recorded or replayed query: the query is executed, and recorded, when the cursor is read.
+    Like a pymongo cursor it can be read only once, with for, next() or to_list()
+    """
+
+    def __init__(self, sChannel, sMethod, oTargetMethod, aoArgs, aoKwargs):
+        self.m_sChannel = sChannel
+        self.m_sMethod = sMethod
+        self.m_oTargetMethod = oTargetMethod
+        self.m_aoArgs = aoArgs
+        self.m_aoKwargs = aoKwargs
+        self.m_aoChain = []
+        self.m_aoResults = None
+        # Position of the next result to give back
+        self.m_iPosition = 0
+
+    def __getattr__(self, sName):
+        if sName not in s_asCURSOR_CHAIN_METHODS:
+            raise AttributeError(sName)
+
+        def _chain(*aoArgs, **aoKwargs):
+            self.m_aoChain.append((sName, aoArgs, aoKwargs))
+            return self
+
+        return _chain
+
+    def _getCursor(self):
+        oCursor = self.m_oTargetMethod(*self.m_aoArgs, **self.m_aoKwargs)
+        for sName, aoArgs, aoKwargs in self.m_aoChain:
+            oCursor = getattr(oCursor, sName)(*aoArgs, **aoKwargs)
+        return oCursor
+
+    def _execute(self):
+        return list(self._getCursor())
+
+    def _getResults(self):
+        if self.m_aoResults is None:
+            aoKeyArgs = self.m_aoArgs + tuple(self.m_aoChain)
+            self.m_aoResults = _call(self.m_sChannel, self.m_sMethod, lambda *aoArgs, **aoKwargs: self._execute(), aoKeyArgs, self.m_aoKwargs)
+        return self.m_aoResults
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        aoResults = self._getResults()
+
+        if self.m_iPosition >= len(aoResults):
+            raise StopIteration
+
+        oResult = aoResults[self.m_iPosition]
+        self.m_iPosition += 1
+        return oResult
+
+    def next(self):
+        return self.__next__()
+
+    def to_list(self, iLength=None):
+        """
+        Reads the results not read yet
+        :param iLength: max number of results, None for all of them
+        :return: list of documents
+        """
+        aoResults = self._getResults()
+        iEnd = len(aoResults) if iLength is None else min(len(aoResults), self.m_iPosition + iLength)
+        aoList = aoResults[self.m_iPosition:iEnd]
+        self.m_iPosition = iEnd
+        return aoList
+
+    def explain(self):
+        aoKeyArgs = self.m_aoArgs + tuple(self.m_aoChain)
+        return _call(self.m_sChannel, self.m_sMethod + ".explain", lambda *aoArgs, **aoKwargs: self._getCursor().explain(), aoKeyArgs, self.m_aoKwargs)
+
+    @property
+    def alive(self):
+        return self.m_aoResults is None or self.m_iPosition < len(self.m_aoResults)
+
+    def close(self):
+        # Nothing more to read: if the query has not been executed yet, it will not be
+        self.m_aoResults = []
+        self.m_iPosition = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, oType, oValue, oTraceback):
+        self.close()
@@ -0,0 +1,97 @@
+import logging
+
+import wasdi
+
+# Workspace currently open in the wasdi lib of this process
+_s_sActiveWorkspaceId = ""
+# Workspace Ids already resolved, by name
+_s_asWorkspaceIdsByName = {}
+# Number of real workspace switches since the last reset
+_s_iSwitches = 0
+
+
+def openWorkspaceById(sWorkspaceId):
+    """
+    Open a WASDI workspace, only if it is not already the active one
+    :param sWorkspaceId: Id of the workspace
+    :return: the workspace id, or an empty string if it was not possible to open it
+    """
+    global _s_sActiveWorkspaceId
+    global _s_iSwitches
+
+    if sWorkspaceId is None or sWorkspaceId == "":
+        return ""
+
+    if sWorkspaceId == _s_sActiveWorkspaceId:
+        return sWorkspaceId
+
+    sOpenedId = wasdi.openWorkspaceById(sWorkspaceId)
+
+    if sOpenedId is None or sOpenedId == "":
+        logging.warning("WorkspaceTracker.openWorkspaceById: impossible to open workspace " + sWorkspaceId)
+        _s_sActiveWorkspaceId = ""
+        return ""
+
+    _s_sActiveWorkspaceId = sWorkspaceId
+    _s_iSwitches += 1
+
+    return sWorkspaceId
+
+
+def openWorkspaceByName(sWorkspaceName, bCreate=False):
+    """
+    Open a WASDI workspace by name, only if it is not already the active one
+    :param sWorkspaceName: Name of the workspace
+    :param bCreate: True to create the workspace if it does not exist
+    :return: the workspace id, or an empty string if it was not possible to open it
+    """
+    sWorkspaceId = _s_asWorkspaceIdsByName.get(sWorkspaceName, "")
+
+    if sWorkspaceId == "":
+        sWorkspaceId = wasdi.getWorkspaceIdByName(sWorkspaceName)
+
+        if (sWorkspaceId is None or sWorkspaceId == "") and bCreate:
+            wasdi.createWorkspace(sWorkspaceName)
+            sWorkspaceId = wasdi.getWorkspaceIdByName(sWorkspaceName)
+
+        if sWorkspaceId is None or sWorkspaceId == "":
+            logging.warning("WorkspaceTracker.openWorkspaceByName: workspace " + sWorkspaceName + " not found")
+            return ""
+
+        _s_asWorkspaceIdsByName[sWorkspaceName] = sWorkspaceId
+
+    sOpenedId = openWorkspaceById(sWorkspaceId)
+
+    if sOpenedId == "":
+        # Maybe it has been deleted: next time we will ask again to WASDI
+        _s_asWorkspaceIdsByName.pop(sWorkspaceName, None)
+
+    return sOpenedId
+
+
+def resetActiveWorkspace():
+    """
+    Forget the active workspace and the known workspaces: to call every time the wasdi lib is initialized
+    :return:
+    """
+    global _s_sActiveWorkspaceId
+
+    _s_sActiveWorkspaceId = ""
+    _s_asWorkspaceIdsByName.clear()
+
+
+def getSwitchCount():
+    """
+    Get the number of real workspace switches since the last reset
+    :return: number of switches
+    """
+    return _s_iSwitches
+
+
+def resetSwitchCount():
+    """
+    Reset the counter of the workspace switches
+    :return:
+    """
+    global _s_iSwitches
+    _s_iSwitches = 0